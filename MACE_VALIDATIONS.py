@@ -1,442 +1,653 @@
-import streamlit as st
-import pandas as pd
+import os
+import re
+import tempfile
+import time
 from io import BytesIO
 
+import streamlit as st
+
+from columnar import to_parquet_bytes
+from diagnostics import RunRecorder, stage, timed_stage
+from export import FORMATS, mime_type, render
+from incremental import prune_snapshots, run_incremental
+from parse_cache import ParseCache
+from results_view import PAGE_SIZES, page_count, query, summarize
+from sql_backend import HAS_DUCKDB, SqlBackend
+from suite import run_suite
+from validations import (
+    CHECK_INPUTS,
+    MERGE_MODES,
+    RULE_SETS,
+    SUMMARY_LABELS,
+    compare,
+    fanout_summary,
+    load_rules,
+    read_sap_table,
+    read_table,
+    reader_for,
+    report_file_name,
+    report_sheets,
+    sales_area_fanout,
+    summary_labels,
+    text_columns,
+)
+
 st.set_page_config(layout="wide")
 st.title("🔍 Customer Validation Tool")
 
-tabs = st.tabs(["📄 KNA1 vs KNVV", "📄 KNA1+KNVV vs MACE", "📄 KNVV vs KNVP","📄 KNVP vs MACE_PARTNER"])
+tabs = st.tabs(["📄 KNA1 vs KNVV", "📄 KNA1+KNVV vs MACE", "📄 KNVV vs KNVP","📄 KNVP vs MACE_PARTNER", "🚀 Full suite", "🧩 Rule sets"])
+
+
+# One parse cache for every tab, rerun and session
+@st.cache_resource
+def get_parse_cache():
+    return ParseCache()
+
+
+parse_cache = get_parse_cache()
+
+UPLOAD_TYPES = ["xlsx", "csv", "parquet"]
+
+# Session key of the KNA1+KNVV merge kept as Parquet for Tab 2
+MERGED_HANDOFF_KEY = "merged_kna1_knvv_parquet"
+
+# Every compare writes its timings, memory and row counts here as JSON;
+# only the newest RUN_RECORD_LIMIT records are kept
+RUN_RECORD_DIR = os.environ.get("MACE_RUN_RECORD_DIR", os.path.join(tempfile.gettempdir(), "mace_run_records"))
+RUN_RECORD_LIMIT = int(os.environ.get("MACE_RUN_RECORD_LIMIT", "500"))
+
+# Per-check snapshots of the last incremental compare, one subdirectory per
+# snapshot name; only the SNAPSHOT_LIMIT names saved to most recently are kept.
+# The snapshots hold whole result frames, so point MACE_SNAPSHOT_DIR at a
+# directory only the app's users may read.
+SNAPSHOT_DIR = os.environ.get("MACE_SNAPSHOT_DIR", os.path.join(tempfile.gettempdir(), "mace_snapshots"))
+SNAPSHOT_LIMIT = int(os.environ.get("MACE_SNAPSHOT_LIMIT", "50"))
+
+# Memory DuckDB may use before spilling to disk in on-disk suite runs
+SQL_MEMORY_LIMIT = os.environ.get("MACE_SQL_MEMORY_LIMIT")
+
+key_columns_only = st.sidebar.checkbox(
+    "Load only compared columns",
+    help="Reads just the columns the checks compare. Much faster on wide extracts, but result tables show only those columns.",
+)
+
+export_format = st.sidebar.selectbox(
+    "Report format",
+    FORMATS,
+    help="Reports with two sheets download as a zip of one CSV or Parquet file per sheet.",
+)
+split_sheets = st.sidebar.checkbox(
+    "Split sheets over Excel's row limit",
+    value=True,
+    help="Sheets longer than 1,048,575 rows continue on '<sheet> (2)', '<sheet> (3)', ...",
+)
+incremental = st.sidebar.checkbox(
+    "Incremental compare",
+    help="Re-checks only the customers whose rows changed since the last compare of the same check under the same snapshot name, with the same results as a full compare, and lists newly broken and newly fixed customers.",
+)
+snapshot_name = st.sidebar.text_input(
+    "Snapshot name",
+    value="default",
+    disabled=not incremental,
+    help="Incremental compares under one name compare against each other, from any session and on any day. Use one name per dataset, e.g. 'EU daily'.",
+)
+
+
+def load(upload, reader, name, rule_sets=None):
+    # A cache hit shows as a load stage without parse and clean stages
+    with stage(f"load {name}") as info:
+        df = parse_cache.load(
+            upload,
+            reader,
+            columns=text_columns(name, rule_sets) if key_columns_only else None,
+            text_columns=text_columns(name, rule_sets),
+        )
+        info["rows_out"] = len(df)
+    return df
+
+
+# Each on-disk suite run gets its own database in a temporary directory;
+# the session keeps only its last one, whose tables hold the results shown
+def new_sql_backend():
+    close_sql_backend()
+    st.session_state["sql_backend"] = SqlBackend(memory_limit=SQL_MEMORY_LIMIT)
+    return st.session_state["sql_backend"]
+
+
+# Deletes the database of the session's last on-disk run, and with it
+# the results paged from it
+def close_sql_backend():
+    backend = st.session_state.pop("sql_backend", None)
+    if backend is not None:
+        st.session_state.pop("results_suite", None)
+        backend.close()
+
+
+def load_into(backend, upload, name):
+    with stage(f"load {name}") as info:
+        table = backend.load(name, upload, columns=text_columns(name) if key_columns_only else None)
+        info["rows_out"] = len(table)
+    return table
+
+
+def upload_info(**uploads):
+    return {name: {"file": upload.name, "bytes": upload.size} for name, upload in uploads.items()}
+
+
+# The snapshot name as a directory name of its own, never a path
+def snapshot_dir():
+    name = re.sub(r"[^\w.-]+", "_", snapshot_name.strip()).strip("._") or "default"
+    return os.path.join(SNAPSHOT_DIR, name)
+
+
+# The delta of an incremental compare is kept with the run's results
+def run_compare(run, check, *frames, **options):
+    with stage("compare", rows_in=sum(len(df) for df in frames)) as info:
+        if incremental:
+            result, run.results["delta"] = run_incremental(check, frames, snapshot_dir(), **options)
+            prune_snapshots(SNAPSHOT_DIR, SNAPSHOT_LIMIT)
+        else:
+            result = compare(check, *frames, **options)
+        info["rows_out"] = sum(len(df) for df in result)
+    return result
+
+
+def show_delta(run):
+    delta = run.results.get("delta") if run else None
+    if not delta:
+        return
+    if delta["full_run"]:
+        st.info(f"🔁 Full compare of {delta['customers']} customers; the next incremental compare starts from it.")
+    else:
+        st.info(f"🔁 Re-checked {delta['changed_customers']} of {delta['customers']} customers changed since the last compare.")
+    if delta["newly_broken"] is not None:
+        broken, fixed = st.columns(2)
+        broken.write(f"🆕 Newly broken customers: {len(delta['newly_broken'])}")
+        broken.dataframe({"Customer": delta["newly_broken"]}, hide_index=True, height=150)
+        fixed.write(f"✅ Newly fixed customers: {len(delta['newly_fixed'])}")
+        fixed.dataframe({"Customer": delta["newly_fixed"]}, hide_index=True, height=150)
+
+
+def save_run_record(run):
+    try:
+        run.write(RUN_RECORD_DIR, keep=RUN_RECORD_LIMIT)
+    except OSError as e:
+        st.warning(f"⚠️ Could not write the run record: {e}")
+
+
+# Download of a check's result frames; the file is only built when the
+# button is clicked, and clicking keeps the results on screen. The export
+# is added to the run's record when there is one.
+def download_report(label, check, *frames, run=None, rule_sets=None):
+    sheets = report_sheets(check, frames, rule_sets)
+    fmt, split = export_format, split_sheets
+
+    def build():
+        if run is None:
+            return render(sheets, fmt=fmt, split=split)
+        with timed_stage(run, f"export {fmt}", rows_in=sum(len(df) for _, df in sheets)):
+            data = render(sheets, fmt=fmt, split=split)
+        if run.path:
+            run.write(run.path)
+        return data
+
+    st.download_button(
+        label,
+        build,
+        file_name=report_file_name(check, fmt, rule_sets),
+        mime=mime_type(fmt, len(sheets)),
+        on_click="ignore",
+    )
+
+
+# Where the time and memory of the last compare went, stage by stage
+def show_diagnostics(run, key):
+    with st.expander("🩺 Run diagnostics"):
+        peaks = [row["peak_rss_mb"] for row in run.stages if row["peak_rss_mb"] is not None]
+        st.caption(
+            f"{run.seconds:.2f} s in total"
+            + (f", peak memory {max(peaks):.0f} MB" if peaks else "")
+            + (f", recorded in {run.path}" if run.path else "")
+        )
+        st.dataframe(run.stages, hide_index=True)
+        st.download_button(
+            "⬇️ Download run record",
+            run.to_json,
+            file_name=run.file_name(),
+            mime="application/json",
+            on_click="ignore",
+            key=f"{key}_run_record",
+        )
+
+
+# How many merged rows each customer's sales areas make
+def show_fanout(fanout):
+    summary = fanout_summary(fanout)
+    st.write(
+        f"📊 Sales areas per customer: {summary['mean_sales_areas']} on average, "
+        f"{summary['max_sales_areas']} at most; {summary['multi_area_customers']} customers have several, "
+        f"{summary['customers_without_sales_area']} none"
+    )
+    with st.expander("📊 Sales areas per customer"):
+        show_results("Largest merges first", fanout, "kna1_knvv_fanout")
+
+
+# Results are kept per check until the next compare, so paging and
+# filtering reruns can show them again; they are dropped from view once
+# the uploads they came from change
+def keep_results(name, sources, *frames, run=None):
+    st.session_state[name] = {"sources": sources, "frames": frames, "run": run}
+
+
+def stored_run(name):
+    stored = st.session_state.get(name)
+    return stored["run"] if stored else None
+
+
+def stored_results(name, sources):
+    stored = st.session_state.get(name)
+    if stored and stored["sources"] == sources:
+        return stored["frames"]
+    return None
+
+
+# Counts first, then one page of rows filtered and sorted on the server
+def show_results(title, df, key):
+    st.subheader(title)
+    summary = summarize(df)
+    if summary:
+        for column, (label, counts) in zip(st.columns(len(summary)), summary.items()):
+            column.caption(f"By {label.lower()}")
+            column.dataframe(counts, hide_index=True, height=min(35 * (len(counts) + 1) + 3, 250))
+    if df.empty:
+        st.dataframe(df.head(0))
+        return
+
+    columns = [str(col) for col in df.columns]
+    by_name = dict(zip(columns, df.columns))
+    search, search_in, sort_by, order, size = st.columns([3, 2, 2, 1, 1])
+    text = search.text_input("Filter rows", key=f"{key}_filter", placeholder="Text to look for")
+    filter_column = search_in.selectbox("In", ["All columns", *columns], key=f"{key}_filter_column")
+    sort_column = sort_by.selectbox("Sort by", ["Original order", *columns], key=f"{key}_sort")
+    descending = order.checkbox("Descending", key=f"{key}_descending")
+    page_size = size.selectbox("Rows per page", PAGE_SIZES, index=1, key=f"{key}_page_size")
+
+    # The page is clamped to the last one when a filter leaves fewer rows
+    page = st.session_state.get(f"{key}_page", 1)
+    rows, matched = query(
+        df,
+        text,
+        filter_column=by_name.get(filter_column),
+        sort_column=by_name.get(sort_column),
+        ascending=not descending,
+        page=page,
+        page_size=page_size,
+    )
+    pages = page_count(matched, page_size)
+    if page > pages:
+        st.session_state[f"{key}_page"] = pages
+    st.dataframe(rows)
+    pager, position = st.columns([1, 4])
+    page = pager.number_input("Page", min_value=1, max_value=pages, step=1, key=f"{key}_page")
+    start = (page - 1) * page_size
+    if not matched:
+        position.caption(f"No rows match the filter, {len(df)} in total")
+    else:
+        position.caption(
+            f"Rows {start + 1}–{min(start + page_size, matched)} of {matched}"
+            + (f" matching, {len(df)} in total" if matched != len(df) else "")
+        )
 
 
 # ---------- TAB 1: KNA1 vs KNVV ----------
 with tabs[0]:
     st.header("📤 Upload KNA1 and KNVV Files")
-    kna1_file = st.file_uploader("Upload KNA1 Excel", type=["xlsx"], key="kna1")
-    knvv_file = st.file_uploader("Upload KNVV Excel", type=["xlsx"], key="knvv")
-
-    def find_column(df, target):
-        for col in df.columns:
-            if col.lower() == target.lower():
-                return col
-        return None
-
-    def clean_all_text_columns(df):
-        df = df.fillna('').replace({pd.NA: ''})
-        for col in df.columns:
-            df[col] = df[col].astype(str).str.replace(r"\s+", " ", regex=True).str.replace("\xa0", " ", regex=True).str.strip()
-        return df
+    kna1_file = st.file_uploader("Upload KNA1 Excel", type=UPLOAD_TYPES, key="kna1")
+    knvv_file = st.file_uploader("Upload KNVV Excel", type=UPLOAD_TYPES, key="knvv")
+    merge = st.radio(
+        "Merged view",
+        MERGE_MODES,
+        format_func={"per-sales-area": "One row per sales area", "per-customer": "One row per customer, sales areas nested"}.get,
+        horizontal=True,
+        key="kna1_knvv_merge",
+        help="Nested: each KNVV column lists the customer's sales areas' values in order, separated by '; ', with their number in 'Sales areas'. Keeps the merge as long as KNA1 for customers with many sales areas.",
+    )
 
     if kna1_file and knvv_file:
+        sources = (kna1_file.file_id, knvv_file.file_id, merge)
         if st.button("🔍 Compare", key="compare_kna1_knvv"):
-            with st.spinner("Validating..."):
-                # Read and clean KNA1
-                df_kna1 = pd.read_excel(kna1_file, header=4, skiprows=[5])
-                df_kna1.columns = df_kna1.columns.str.strip()
-                df_kna1 = df_kna1.loc[:, ~df_kna1.columns.str.contains('^Unnamed', case=False) & (df_kna1.columns.str.strip() != '')]
-                df_kna1 = clean_all_text_columns(df_kna1)
-
-                # Read and clean KNVV
-                df_knvv = pd.read_excel(knvv_file, header=4, skiprows=[5])
-                df_knvv.columns = df_knvv.columns.str.strip()
-                df_knvv = df_knvv.loc[:, ~df_knvv.columns.str.contains('^Unnamed', case=False) & (df_knvv.columns.str.strip() != '')]
-                df_knvv = clean_all_text_columns(df_knvv)
-
-                # Find "Customer" column
-                customer_col_kna1 = find_column(df_kna1, "Customer")
-                customer_col_knvv = find_column(df_knvv, "Customer")
-
-                # Filter non-empty customers
-                df_kna1_clean = df_kna1[df_kna1[customer_col_kna1] != '']
-                df_knvv_clean = df_knvv[df_knvv[customer_col_knvv] != '']
-
-                # Unique customers
-                kna1_customers = set(df_kna1_clean[customer_col_kna1])
-                knvv_customers = set(df_knvv_clean[customer_col_knvv])
-
-                # Differences
-                df_diff1 = df_kna1_clean[df_kna1_clean[customer_col_kna1].isin(kna1_customers - knvv_customers)]
-                df_diff2 = df_knvv_clean[df_knvv_clean[customer_col_knvv].isin(knvv_customers - kna1_customers)]
-                df_diff1.index = range(1, len(df_diff1) + 1)
-                df_diff2.index = range(1, len(df_diff2) + 1)
-
-                st.write(f"🔢 Customers in KNA1 not in KNVV: {len(df_diff1)}")
-                st.write(f"🔢 Customers in KNVV not in KNA1: {len(df_diff2)}")
-
-                st.subheader("❗ Customers in KNA1 but NOT in KNVV")
-                st.dataframe(df_diff1)
-
-                st.subheader("❗ Customers in KNVV but NOT in KNA1")
-                st.dataframe(df_diff2)
-
-                # Merge on Customer only
-                merged_df = pd.merge(
-                    df_kna1_clean,
-                    df_knvv_clean,
-                    how="left",
-                    left_on=customer_col_kna1,
-                    right_on=customer_col_knvv,
-                    suffixes=('', '_KNVV')
-                )
-
-                # Remove duplicate columns from KNVV (_KNVV)
-                merged_df = merged_df.drop(columns=[col for col in merged_df.columns if col.endswith('_KNVV')])
-
-                st.subheader("🔗 Merged View")
-                merged_df.index = range(1, len(merged_df) + 1)
-                st.dataframe(merged_df)
-
-                # Excel download function
-                def to_excel(df):
-                    output = BytesIO()
-                    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                        df.to_excel(writer, index=False)
-                    output.seek(0)
-                    return output
-
-                st.download_button("⬇️ Download Merged Excel", to_excel(merged_df), file_name="merged_kna1_knvv.xlsx")
+            with st.spinner("Validating..."), RunRecorder("kna1-knvv", upload_info(kna1=kna1_file, knvv=knvv_file)) as run:
+                df_kna1 = load(kna1_file, read_sap_table, "kna1")
+                df_knvv = load(knvv_file, read_sap_table, "knvv")
+                df_diff1, df_diff2, merged_df = run_compare(run, "kna1-knvv", df_kna1, df_knvv, merge=merge)
+                with stage("fan-out"):
+                    fanout = sales_area_fanout(df_kna1, df_knvv)
+                    run.results["fan-out"] = fanout_summary(fanout)
+
+                # Keep the merge for Tab 2, so it need not go through an xlsx
+                # download and upload; Tab 2 compares one row per sales area
+                if merge == "per-sales-area":
+                    with stage("handoff to Tab 2", rows_in=len(merged_df)):
+                        st.session_state[MERGED_HANDOFF_KEY] = {
+                            "data": to_parquet_bytes(merged_df),
+                            "rows": len(merged_df),
+                            "sources": f"{kna1_file.name} + {knvv_file.name}",
+                        }
+            save_run_record(run)
+            keep_results("results_kna1_knvv", sources, df_diff1, df_diff2, merged_df, fanout, run=run)
+
+        results = stored_results("results_kna1_knvv", sources)
+        if results:
+            df_diff1, df_diff2, merged_df, fanout = results
+            st.write(f"🔢 Customers in KNA1 not in KNVV: {len(df_diff1)}")
+            st.write(f"🔢 Customers in KNVV not in KNA1: {len(df_diff2)}")
+            show_delta(stored_run("results_kna1_knvv"))
+
+            show_results("❗ Customers in KNA1 but NOT in KNVV", df_diff1, "kna1_not_in_knvv")
+            show_results("❗ Customers in KNVV but NOT in KNA1", df_diff2, "knvv_not_in_kna1")
+            show_fanout(fanout)
+            show_results("🔗 Merged View", merged_df, "merged_view")
+            if merge != "per-sales-area":
+                st.caption("Tab 2 compares one row per sales area, so this merge is not handed over to it.")
+
+            download_report("⬇️ Download Merged Excel", "kna1-knvv", merged_df, run=stored_run("results_kna1_knvv"))
+            show_diagnostics(stored_run("results_kna1_knvv"), "kna1_knvv")
 
 # ---------- TAB 2: Merged vs MACE ----------
 with tabs[1]:
     st.header("📥 Upload KNA1+KNVV and MACE File")
-    merged_file = st.file_uploader("Upload KNA1+KNVV Excel from Tab 1", type=["xlsx"], key="merged")
-    mace_file = st.file_uploader("Upload MACE Excel", type=["xlsx"], key="mace")
-
-    if merged_file and mace_file:
+    merged_handoff = st.session_state.get(MERGED_HANDOFF_KEY)
+    use_handoff = merged_handoff is not None and st.checkbox(
+        f"Use the KNA1+KNVV result from Tab 1 ({merged_handoff['sources']}, {merged_handoff['rows']} rows)",
+        value=True,
+        key="use_merged_handoff",
+    )
+    merged_file = None if use_handoff else st.file_uploader("Upload KNA1+KNVV Excel from Tab 1", type=UPLOAD_TYPES, key="merged")
+    mace_file = st.file_uploader("Upload MACE Excel", type=UPLOAD_TYPES, key="mace")
+
+    if (use_handoff or merged_file) and mace_file:
+        sources = (merged_handoff["sources"] if use_handoff else merged_file.file_id, mace_file.file_id)
         if st.button("📎 Compare with MACE", key="compare_mace"):
-            with st.spinner("Comparing KNA1+KNVV data with MACE..."):
+            if use_handoff:
+                inputs = {"merged": {"file": f"Tab 1: {merged_handoff['sources']}", "bytes": len(merged_handoff["data"])}}
+            else:
+                inputs = upload_info(merged=merged_file)
+            inputs.update(upload_info(mace=mace_file))
+            with st.spinner("Comparing KNA1+KNVV data with MACE..."), RunRecorder("merged-mace", inputs) as run:
                 try:
-                    df_merged = pd.read_excel(merged_file)
-                    df_mace = pd.read_excel(mace_file)
-                    df_merged = clean_all_text_columns(df_merged)
-                    df_mace = clean_all_text_columns(df_mace)
+                    df_merged = load(merged_handoff["data"] if use_handoff else merged_file, read_table, "merged")
+                    df_mace = load(mace_file, read_table, "mace")
                 except Exception as e:
                     st.error(f"Error reading files: {e}")
                     st.stop()
 
-                if "CUSTOMER_NATURAL_ID" not in df_mace.columns:
-                    st.error("❌ MACE file must contain 'CUSTOMER_NATURAL_ID'")
+                try:
+                    df_not_in_mace, df_not_in_merged = run_compare(run, "merged-mace", df_merged, df_mace)
+                except ValueError as e:
+                    st.error(f"❌ {e}")
                     st.stop()
+            save_run_record(run)
+            keep_results("results_merged_mace", sources, df_not_in_mace, df_not_in_merged, run=run)
+
+        results = stored_results("results_merged_mace", sources)
+        if results:
+            df_not_in_mace, df_not_in_merged = results
+            # Show results
+            st.write(f"🔢 Customers in KNA1+KNVV but NOT in MACE (including mismatches): {len(df_not_in_mace)}")
+            st.write(f"🔢 Customers in MACE but NOT in KNA1+KNVV: {len(df_not_in_merged)}")
+            show_delta(stored_run("results_merged_mace"))
+
+            show_results("❗ Customers in KNA1+KNVV but NOT in MACE (or mismatched)", df_not_in_mace, "not_in_mace")
+            show_results("❗ Customers in MACE but NOT in KNA1+KNVV", df_not_in_merged, "mace_not_in_merged")
+
+            download_report("⬇️ Download MACE_kna1+knvv Comparison Result", "merged-mace", df_not_in_mace, df_not_in_merged, run=stored_run("results_merged_mace"))
+            show_diagnostics(stored_run("results_merged_mace"), "merged_mace")
 
-                # Define column mapping
-                column_mapping = {
-                    "Customer": "CUSTOMER_NATURAL_ID",
-                    "City": "CUSTOMER_CITY_NAME",
-                    "Ctry/Reg.": "CUSTOMER_COUNTRY_ISO2_CODE",
-                    "Postal Code": "CUSTOMER_POSTAL_CODE",
-                    "Street": "CUSTOMER_STREET_NAME",
-                    "Region": "CUSTOMER_REGION_CODE",
-                    "Name": "CUSTOMER_NAME",
-                    "Name2": "CUSTOMER_NAME2",
-                    "Sales Org.": "CUSTOMER_SALES_ORGANIZATION_CODE",
-                    "Distr. Channel": "CUSTOMER_SALES_DISTRIBUTION_CHANNEL_CODE",
-                    "Division": "CUSTOMER_DIVISION_CODE",
-                    "Currency": "CUSTOMER_CURRENCY",
-                    "Account group": "CUSTOMER_ACCOUNT_GROUP_CODE",
-                    "Language": "CUSTOMER_LANGUAGE_KEY",
-                    "Group": "CUSTOMER_GROUP_KEY"
-                }
-
-                merged_not_in_mace = []
-                mismatch_reason = []
-                mace_customers = set(df_mace["CUSTOMER_NATURAL_ID"].astype(str).str.strip())
-                merged_customers = df_merged["Customer"].astype(str).str.strip()
-
-                for idx, row in df_merged.iterrows():
-                    cust_id = str(row.get("Customer", "")).strip()
-
-                    # If customer is not in MACE at all
-                    if cust_id not in mace_customers:
-                        merged_not_in_mace.append(row)
-                        mismatch_reason.append("Customer not found in MACE")
-                        continue
-
-                    # Check all MACE rows for this customer
-                    matching_mace_rows = df_mace[df_mace["CUSTOMER_NATURAL_ID"] == cust_id]
-                    found_match = False
-                    mismatch_cols = []
-
-                    for _, mace_row in matching_mace_rows.iterrows():
-                        current_mismatch = []
-
-                        for m_col, mace_col in column_mapping.items():
-                            if m_col not in row or mace_col not in mace_row:
-                                continue
-
-                            val_merged = str(row[m_col]).strip()
-                            val_mace = str(mace_row[mace_col]).strip()
-
-                            # Skip blanks or 'not found'
-                            if (
-                                val_merged == ""
-                                or val_mace == ""
-                                or val_merged.lower() == "not found"
-                                or val_mace.lower() == "not found"
-                            ):
-                                continue
-
-                            try:
-                                if float(val_merged) != float(val_mace):
-                                    current_mismatch.append(m_col)
-                            except:
-                                if val_merged != val_mace:
-                                    current_mismatch.append(m_col)
-
-                        # If exact match found
-                        if not current_mismatch:
-                            found_match = True
-                            break
-
-                        # Track first mismatch set
-                        if not mismatch_cols:
-                            mismatch_cols = current_mismatch
-
-                    if not found_match:
-                        merged_not_in_mace.append(row)
-                        mismatch_reason.append(", ".join(mismatch_cols) if mismatch_cols else "Mismatch")
-
-                df_not_in_mace = pd.DataFrame(merged_not_in_mace)
-                if not df_not_in_mace.empty:
-                    df_not_in_mace["Mismatch Reason"] = mismatch_reason
-                    df_not_in_mace.index = range(1, len(df_not_in_mace) + 1)
-
-                # Customers in MACE not in merged
-                mace_customers_set = set(df_mace["CUSTOMER_NATURAL_ID"].astype(str).str.strip())
-                merged_customers_set = set(merged_customers)
-                df_not_in_merged = df_mace[df_mace["CUSTOMER_NATURAL_ID"].isin(mace_customers_set - merged_customers_set)]
-                df_not_in_merged.index = range(1, len(df_not_in_merged) + 1)
-
-                # Show results
-                st.write(f"🔢 Customers in KNA1+KNVV but NOT in MACE (including mismatches): {len(df_not_in_mace)}")
-                st.write(f"🔢 Customers in MACE but NOT in KNA1+KNVV: {len(df_not_in_merged)}")
-
-                st.subheader("❗ Customers in KNA1+KNVV but NOT in MACE (or mismatched)")
-                st.dataframe(df_not_in_mace)
-
-                st.subheader("❗ Customers in MACE but NOT in KNA1+KNVV")
-                st.dataframe(df_not_in_merged)
-
-                # Download button
-                def download_excel(df1, df2):
-                    output = BytesIO()
-                    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                        df1.to_excel(writer, index=False, sheet_name='kna1+knvv _Not_in_MACE')
-                        df2.to_excel(writer, index=False, sheet_name='MACE_Not_in_ kna1+knvv')
-                    output.seek(0)
-                    return output
-
-                st.download_button("⬇️ Download MACE_kna1+knvv Comparison Result", download_excel(df_not_in_mace, df_not_in_merged), file_name="mace_kna1+knvv_comparison.xlsx")
-# ---------- TAB 3: KNVV vs KNVP ----------
 # ---------- TAB 3: KNVV vs KNVP ----------
 with tabs[2]:
     st.header("📦 Upload KNVV and KNVP Files")
-    knvv_file_tab3 = st.file_uploader("Upload KNVV Excel", type=["xlsx"], key="knvv_tab3")
-    knvp_file = st.file_uploader("Upload KNVP Excel", type=["xlsx"], key="knvp")
+    knvv_file_tab3 = st.file_uploader("Upload KNVV Excel", type=UPLOAD_TYPES, key="knvv_tab3")
+    knvp_file = st.file_uploader("Upload KNVP Excel", type=UPLOAD_TYPES, key="knvp")
 
     if knvv_file_tab3 and knvp_file:
+        sources = (knvv_file_tab3.file_id, knvp_file.file_id)
         if st.button("🔍 Compare KNVV vs KNVP", key="compare_knvv_knvp"):
             with st.spinner("Processing..."):
                 try:
-                    df_knvv = pd.read_excel(knvv_file_tab3, header=4, skiprows=[5])
-                    df_knvp = pd.read_excel(knvp_file, header=4, skiprows=[5])
-
-                    df_knvv.columns = df_knvv.columns.str.strip()
-                    df_knvp.columns = df_knvp.columns.str.strip()
-
-                    df_knvv = df_knvv.loc[:, ~df_knvv.columns.str.contains('^Unnamed', case=False) & (df_knvv.columns.str.strip() != '')]
-                    df_knvp = df_knvp.loc[:, ~df_knvp.columns.str.contains('^Unnamed', case=False) & (df_knvp.columns.str.strip() != '')]
-
-                    df_knvv = clean_all_text_columns(df_knvv)
-                    df_knvp = clean_all_text_columns(df_knvp)
-
-                    # Detect Customer column
-                    customer_col_knvv = find_column(df_knvv, "Customer")
-                    customer_col_knvp = find_column(df_knvp, "Customer")
-
-                    df_knvv_clean = df_knvv[df_knvv[customer_col_knvv] != '']
-                    df_knvp_clean = df_knvp[df_knvp[customer_col_knvp] != '']
-
-                    comparison_columns = ["Sales Org.", "Distr. Channel", "Division"]
+                    with RunRecorder("knvv-knvp", upload_info(knvv=knvv_file_tab3, knvp=knvp_file)) as run:
+                        df_knvv = load(knvv_file_tab3, read_sap_table, "knvv")
+                        df_knvp = load(knvp_file, read_sap_table, "knvp")
+                        results = run_compare(run, "knvv-knvp", df_knvv, df_knvp)
+                    save_run_record(run)
+                    keep_results("results_knvv_knvp", sources, *results, run=run)
 
-                    mismatched_rows = []
-                    reasons = []
-
-                    knvp_grouped = df_knvp_clean.groupby(customer_col_knvp)
-
-                    for idx, row in df_knvv_clean.iterrows():
-                        cust_id = str(row[customer_col_knvv]).strip()
-                        found_match = False
-                        mismatch_fields = []
-
-                        if cust_id in knvp_grouped.groups:
-                            knvp_matches = knvp_grouped.get_group(cust_id)
-
-                            for _, knvp_row in knvp_matches.iterrows():
-                                mismatches = []
-                                for col in comparison_columns:
-                                    if col in row and col in knvp_row:
-                                        val_knvv = str(row[col]).strip()
-                                        val_knvp = str(knvp_row[col]).strip()
-                                        if val_knvv != val_knvp:
-                                            mismatches.append(col)
-
-                                if not mismatches:
-                                    found_match = True
-                                    break  # Exact match found, skip further check
-
-                                if not mismatch_fields:
-                                    mismatch_fields = mismatches  # Store the first mismatch set
-
-                        else:
-                            mismatch_fields = ["Customer not found in KNVP"]
-
-                        if not found_match:
-                            mismatched_rows.append(row)
-                            reasons.append(", ".join(mismatch_fields))
-
-                    df_mismatches = pd.DataFrame(mismatched_rows)
-                    if not df_mismatches.empty:
-                        df_mismatches["Mismatch Reason"] = reasons
-                        df_mismatches.index = range(1, len(df_mismatches) + 1)
-
-                    st.write(f"🔢 Customers in KNVV but NOT properly matched in KNVP: {len(df_mismatches)}")
-                    st.subheader("❗ Customers in KNVV but NOT in KNVP or mismatched")
-                    st.dataframe(df_mismatches)
+                except Exception as e:
+                    st.error(f"❌ Error during processing: {e}")
 
-                    # Excel export function
-                    def to_excel(df):
-                        output = BytesIO()
-                        with pd.ExcelWriter(output, engine="openpyxl") as writer:
-                            df.to_excel(writer, index=False, sheet_name="Mismatches")
-                        output.seek(0)
-                        return output
+        results = stored_results("results_knvv_knvp", sources)
+        if results:
+            (df_mismatches,) = results
+            st.write(f"🔢 Customers in KNVV but NOT properly matched in KNVP: {len(df_mismatches)}")
+            show_delta(stored_run("results_knvv_knvp"))
+            show_results("❗ Customers in KNVV but NOT in KNVP or mismatched", df_mismatches, "knvv_knvp_mismatches")
 
-                    st.download_button("⬇️ Download Mismatch Report", to_excel(df_mismatches), file_name="knvv_knvp_mismatch.xlsx")
+            download_report("⬇️ Download Mismatch Report", "knvv-knvp", df_mismatches, run=stored_run("results_knvv_knvp"))
+            show_diagnostics(stored_run("results_knvv_knvp"), "knvv_knvp")
 
-                except Exception as e:
-                    st.error(f"❌ Error during processing: {e}")
+# ---------- TAB 4: KNVP vs MACE Partner ----------
 with tabs[3]:
     st.header("📦 Upload KNVP and MACE Partner Data Files")
-    knvp_file_tab4 = st.file_uploader("Upload KNVP Excel", type=["xlsx"], key="knvp_tab4")
-    mace_partner_file = st.file_uploader("Upload MACE Partner Excel", type=["xlsx"], key="mace_partner")
+    knvp_file_tab4 = st.file_uploader("Upload KNVP Excel", type=UPLOAD_TYPES, key="knvp_tab4")
+    mace_partner_file = st.file_uploader("Upload MACE Partner Excel", type=UPLOAD_TYPES, key="mace_partner")
 
     if knvp_file_tab4 and mace_partner_file:
+        sources = (knvp_file_tab4.file_id, mace_partner_file.file_id)
         if st.button("🔍 Compare KNVP vs MACE Partner", key="compare_knvp_mace_partner"):
             with st.spinner("Processing..."):
                 try:
-                    df_knvp = pd.read_excel(knvp_file_tab4, header=4, skiprows=[5])
-                    df_mace = pd.read_excel(mace_partner_file)
-
-                    df_knvp.columns = df_knvp.columns.str.strip()
-                    df_mace.columns = df_mace.columns.str.strip()
-
-                    df_knvp = df_knvp.loc[:, ~df_knvp.columns.str.contains('^Unnamed', case=False)]
-                    df_knvp = clean_all_text_columns(df_knvp)
-                    df_mace = clean_all_text_columns(df_mace)
-
-                    column_mapping = {
-                        "Customer": "CUSTOMER_NATURAL_ID",
-                        "Sales Org.": "CUSTOMER_SALES_ORGANIZATION",
-                        "Distr. Channel": "CUSTOMER_DISTRIBUTION_CHANNEL",
-                        "Division": "CUSTOMER_DIVISION",
-                        "Partner Functn": "CUSTOMER_PARTNER_FUNCTION",
-                        "Customer Parent": "CUSTOMER_PARTNER_NATURAL_ID"
-                    }
-
-                    knvp_mismatches = []
-                    mace_mismatches = []
-                    mace_grouped = df_mace.groupby("CUSTOMER_NATURAL_ID")
-                    knvp_grouped = df_knvp.groupby("Customer")
-
-                    # ---------- KNVP vs MACE ----------
-                    for idx, row in df_knvp.iterrows():
-                        cust_id = str(row.get("Customer", "")).strip()
-                        found_match = False
-                        mismatched_cols = []
-
-                        if cust_id in mace_grouped.groups:
-                            mace_matches = mace_grouped.get_group(cust_id)
-                            for _, mace_row in mace_matches.iterrows():
-                                mismatched_cols_tmp = []
-                                for knvp_col, mace_col in column_mapping.items():
-                                    val_knvp = str(row.get(knvp_col, "")).strip()
-                                    val_mace = str(mace_row.get(mace_col, "")).strip()
-                                    if val_knvp != val_mace:
-                                        mismatched_cols_tmp.append(knvp_col)
-
-                                if not mismatched_cols_tmp:
-                                    found_match = True
-                                    break
-                                else:
-                                    if not mismatched_cols:
-                                        mismatched_cols = mismatched_cols_tmp
-                        else:
-                            mismatched_cols = ["Customer Not Found"]
-
-                        if not found_match:
-                            mismatch_row = row.copy()
-                            mismatch_row["Mismatch Columns"] = ", ".join(mismatched_cols)
-                            knvp_mismatches.append(mismatch_row)
-
-                    df_knvp_mismatches = pd.DataFrame(knvp_mismatches)
-                    if not df_knvp_mismatches.empty:
-                        df_knvp_mismatches.index = range(1, len(df_knvp_mismatches)+1)
-
-                    # ---------- MACE vs KNVP ----------
-                    for idx, row in df_mace.iterrows():
-                        cust_id = str(row.get("CUSTOMER_NATURAL_ID", "")).strip()
-                        found_match = False
-                        mismatched_cols = []
-
-                        if cust_id in knvp_grouped.groups:
-                            knvp_matches = knvp_grouped.get_group(cust_id)
-                            for _, knvp_row in knvp_matches.iterrows():
-                                mismatched_cols_tmp = []
-                                for knvp_col, mace_col in column_mapping.items():
-                                    val_knvp = str(knvp_row.get(knvp_col, "")).strip()
-                                    val_mace = str(row.get(mace_col, "")).strip()
-                                    if val_knvp != val_mace:
-                                        mismatched_cols_tmp.append(knvp_col)
-
-                                if not mismatched_cols_tmp:
-                                    found_match = True
-                                    break
-                                else:
-                                    if not mismatched_cols:
-                                        mismatched_cols = mismatched_cols_tmp
-                        else:
-                            mismatched_cols = ["Customer Not Found"]
-
-                        if not found_match:
-                            mismatch_row = row.copy()
-                            mismatch_row["Mismatch Columns"] = ", ".join(mismatched_cols)
-                            mace_mismatches.append(mismatch_row)
-
-                    df_mace_mismatches = pd.DataFrame(mace_mismatches)
-                    if not df_mace_mismatches.empty:
-                        df_mace_mismatches.index = range(1, len(df_mace_mismatches)+1)
-
-                    # Display
-                    st.write(f"🔢 KNVP rows not matching MACE: {len(df_knvp_mismatches)}")
-                    st.write(f"🔢 MACE rows not matching KNVP: {len(df_mace_mismatches)}")
-
-                    st.subheader("❗ Customers in KNVP but NOT in MACE Partner or mismatched")
-                    st.dataframe(df_knvp_mismatches)
-
-                    st.subheader("❗ Customer in MACE Partner Not in KNVP or mismatched")
-                    st.dataframe(df_mace_mismatches)
-
-                    # Export
-                    def download_excel(df1, df2):
-                        output = BytesIO()
-                        with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                            df1.to_excel(writer, index=False, sheet_name='KNVP_Not_in_MACEpartner')
-                            df2.to_excel(writer, index=False, sheet_name='MACEpartner_Not_in_KNVP')
-                        output.seek(0)
-                        return output
-
-                    st.download_button("⬇️ Download KNVP-MACE comparision Report",
-                                       download_excel(df_knvp_mismatches, df_mace_mismatches),
-                                       file_name="knvp_mace_partner_mismatch.xlsx")
+                    with RunRecorder("knvp-mace-partner", upload_info(knvp=knvp_file_tab4, mace_partner=mace_partner_file)) as run:
+                        df_knvp = load(knvp_file_tab4, read_sap_table, "knvp")
+                        df_mace = load(mace_partner_file, read_table, "mace_partner")
+                        results = run_compare(run, "knvp-mace-partner", df_knvp, df_mace)
+                    save_run_record(run)
+                    keep_results("results_knvp_mace_partner", sources, *results, run=run)
 
                 except Exception as e:
                     st.error(f"❌ Error during processing: {e}")
+
+        results = stored_results("results_knvp_mace_partner", sources)
+        if results:
+            df_knvp_mismatches, df_mace_mismatches = results
+            # Display
+            st.write(f"🔢 KNVP rows not matching MACE: {len(df_knvp_mismatches)}")
+            st.write(f"🔢 MACE rows not matching KNVP: {len(df_mace_mismatches)}")
+            show_delta(stored_run("results_knvp_mace_partner"))
+
+            show_results("❗ Customers in KNVP but NOT in MACE Partner or mismatched", df_knvp_mismatches, "knvp_not_in_mace_partner")
+            show_results("❗ Customer in MACE Partner Not in KNVP or mismatched", df_mace_mismatches, "mace_partner_not_in_knvp")
+
+            download_report(
+                "⬇️ Download KNVP-MACE comparision Report",
+                "knvp-mace-partner",
+                df_knvp_mismatches,
+                df_mace_mismatches,
+                run=stored_run("results_knvp_mace_partner"),
+            )
+            show_diagnostics(stored_run("results_knvp_mace_partner"), "knvp_mace_partner")
+
+# ---------- TAB 5: Full suite ----------
+SUITE_TITLES = {
+    "kna1-knvv": "KNA1 vs KNVV",
+    "merged-mace": "KNA1+KNVV vs MACE",
+    "knvv-knvp": "KNVV vs KNVP",
+    "knvp-mace-partner": "KNVP vs MACE Partner",
+}
+
+with tabs[4]:
+    st.header("🚀 Run Every Validation at Once")
+    st.caption("Each file is read once and every check with its inputs uploaded runs in parallel, split by customer across the CPU cores.")
+    suite_files = {
+        "kna1": st.file_uploader("Upload KNA1 Excel", type=UPLOAD_TYPES, key="kna1_suite"),
+        "knvv": st.file_uploader("Upload KNVV Excel", type=UPLOAD_TYPES, key="knvv_suite"),
+        "knvp": st.file_uploader("Upload KNVP Excel", type=UPLOAD_TYPES, key="knvp_suite"),
+        "mace": st.file_uploader("Upload MACE Excel", type=UPLOAD_TYPES, key="mace_suite"),
+        "mace_partner": st.file_uploader("Upload MACE Partner Excel", type=UPLOAD_TYPES, key="mace_partner_suite"),
+    }
+    suite_partitions = st.number_input(
+        "Partitions per check",
+        min_value=0,
+        value=0,
+        help="0 splits large inputs automatically, one part per CPU core at most.",
+        key="suite_partitions",
+    )
+    on_disk = st.checkbox(
+        "Run on disk (DuckDB)",
+        disabled=not HAS_DUCKDB,
+        help="Loads the files into a database on local disk and runs the checks there as SQL, spilling to disk "
+        "instead of running out of memory on very large extracts. Results are paged back from the database."
+        + ("" if HAS_DUCKDB else " Needs the duckdb package."),
+        key="suite_on_disk",
+    )
+    # The merged input comes from the KNA1 vs KNVV check
+    suite_checks = [
+        check for check in SUITE_TITLES
+        if all(suite_files.get(name) or (name == "merged" and suite_files["kna1"] and suite_files["knvv"]) for name in CHECK_INPUTS[check])
+    ]
+
+    if suite_checks:
+        st.write("Checks to run: " + ", ".join(SUITE_TITLES[check] for check in suite_checks))
+        sources = (on_disk, *(upload.file_id for upload in suite_files.values() if upload))
+        if st.button("🚀 Run full suite", key="run_full_suite"):
+            readers = {"mace": read_table, "mace_partner": read_table}
+            uploads = {
+                name: upload for name, upload in suite_files.items()
+                if upload and any(name in CHECK_INPUTS[check] for check in suite_checks)
+            }
+            with RunRecorder("full-suite", upload_info(**uploads)) as run:
+                with st.spinner("Reading files..."):
+                    if on_disk:
+                        backend = new_sql_backend()
+                        tables = {name: load_into(backend, upload, name) for name, upload in uploads.items()}
+                    else:
+                        close_sql_backend()
+                        tables = {name: load(upload, readers.get(name, read_sap_table), name) for name, upload in uploads.items()}
+
+                # One bar per validation, filled partition by partition
+                bars = {check: st.progress(0.0, text=f"{SUITE_TITLES[check]}: waiting") for check in suite_checks}
+                suite_started = time.perf_counter()
+
+                def show_progress(check, done, total):
+                    cells = "🟩" * done + "⬜" * (total - done)
+                    state = "done" if done == total else ("running" if on_disk else f"{done}/{total} partitions")
+                    bars[check].progress(done / total, text=f"{SUITE_TITLES[check]}: {state} {cells}")
+                    if done == total:
+                        run.results[check] = {"finished_after_seconds": round(time.perf_counter() - suite_started, 4)}
+
+                try:
+                    if on_disk:
+                        with stage("checks in the database", rows_in=sum(len(df) for df in tables.values())) as info:
+                            suite_results, suite_errors = backend.run_suite(tables, suite_checks, on_progress=show_progress)
+                            info["rows_out"] = sum(len(df) for frames in suite_results.values() for df in frames)
+                    else:
+                        with stage("checks in parallel", rows_in=sum(len(df) for df in tables.values())) as info:
+                            suite_results, suite_errors = run_suite(tables, suite_checks, partitions=suite_partitions or None, on_progress=show_progress)
+                            info["rows_out"] = sum(len(df) for frames in suite_results.values() for df in frames)
+                except Exception as e:
+                    st.error(f"❌ Error during processing: {e}")
+                    st.stop()
+            for check, error in suite_errors.items():
+                bars[check].progress(1.0, text=f"{SUITE_TITLES[check]}: failed")
+                run.results[check] = {"error": str(error)}
+            for check, frames in suite_results.items():
+                run.results.setdefault(check, {})["rows"] = dict(zip(SUMMARY_LABELS[check], map(len, frames)))
+            save_run_record(run)
+            keep_results("results_suite", sources, suite_results, suite_errors, run=run)
+
+        results = stored_results("results_suite", sources)
+        if results:
+            suite_results, suite_errors = results
+            for check in suite_checks:
+                st.subheader(f"📄 {SUITE_TITLES[check]}")
+                if check in suite_errors:
+                    st.error(f"❌ {suite_errors[check]}")
+                    continue
+                frames = suite_results[check]
+                for label, df in zip(SUMMARY_LABELS[check], frames):
+                    st.write(f"🔢 {label}: {len(df)}")
+                for i, (label, df) in enumerate(zip(SUMMARY_LABELS[check], frames)):
+                    show_results(f"❗ {label}", df, f"suite_{check}_{i}")
+                # The KNA1 vs KNVV report holds the merge only
+                download_report(
+                    f"⬇️ Download {SUITE_TITLES[check]} Report",
+                    check,
+                    *(frames[2:] if check == "kna1-knvv" else frames),
+                    run=stored_run("results_suite"),
+                )
+            show_diagnostics(stored_run("results_suite"), "suite")
+
+# ---------- TAB 6: Rule sets ----------
+with tabs[5]:
+    st.header("🧩 Validate with a Rule File")
+    st.caption(
+        "A JSON rule file lists column-mapped checks: the column pairs two extracts are compared on, "
+        "each exactly, numerically, case-insensitively or ignoring leading zeros, with blanks skipped, "
+        "compared or always a mismatch. Without a file the built-in rule sets are offered."
+    )
+    rules_file = st.file_uploader("Upload rule file", type=["json"], key="rules_file")
+    try:
+        rule_sets = load_rules(BytesIO(rules_file.getvalue())) if rules_file else RULE_SETS
+    except ValueError as e:
+        st.error(f"❌ {e}")
+        rule_sets = {}
+
+    if rule_sets:
+        rule_name = st.selectbox("Rule set", list(rule_sets), format_func=lambda name: rule_sets[name].title, key="rule_set")
+        rule_set = rule_sets[rule_name]
+        left_file = st.file_uploader(f"Upload {rule_set.left.upper()} file", type=UPLOAD_TYPES, key="rules_left")
+        right_file = st.file_uploader(f"Upload {rule_set.right.upper()} file", type=UPLOAD_TYPES, key="rules_right")
+
+        if left_file and right_file:
+            sources = (rules_file.file_id if rules_file else None, rule_name, left_file.file_id, right_file.file_id)
+            if st.button(f"🔍 Compare {rule_set.title}", key="compare_rule_set"):
+                with st.spinner("Processing..."):
+                    try:
+                        with RunRecorder(rule_name, upload_info(**{rule_set.left: left_file, rule_set.right: right_file})) as run:
+                            df_left = load(left_file, reader_for(rule_set.left, rule_sets), rule_set.left, rule_sets)
+                            df_right = load(right_file, reader_for(rule_set.right, rule_sets), rule_set.right, rule_sets)
+                            # Rule files are always compared in full
+                            with stage("compare", rows_in=len(df_left) + len(df_right)) as info:
+                                results = compare(rule_name, df_left, df_right, rule_sets=rule_sets)
+                                info["rows_out"] = sum(len(df) for df in results)
+                        save_run_record(run)
+                        keep_results("results_rule_set", sources, *results, run=run)
+
+                    except Exception as e:
+                        st.error(f"❌ Error during processing: {e}")
+
+            results = stored_results("results_rule_set", sources)
+            if results:
+                labels = summary_labels(rule_name, rule_sets)
+                for label, df in zip(labels, results):
+                    st.write(f"🔢 {label}: {len(df)}")
+                for i, (label, df) in enumerate(zip(labels, results)):
+                    show_results(f"❗ {label}", df, f"rule_set_{i}")
+                download_report(
+                    f"⬇️ Download {rule_set.title} Report",
+                    rule_name,
+                    *results,
+                    run=stored_run("results_rule_set"),
+                    rule_sets=rule_sets,
+                )
+                show_diagnostics(stored_run("results_rule_set"), "rule_set")
+
+# ---------- SIDEBAR: parse cache ----------
+# Rendered last so the counters include this run's loads
+with st.sidebar:
+    st.subheader("🗂️ Parse cache")
+    cache_stats = parse_cache.stats()
+    st.metric("Hits", cache_stats["hits"])
+    st.metric("Misses", cache_stats["misses"])
+    st.caption(f"{cache_stats['entries']} files cached, {cache_stats['size_bytes'] / 2**20:.1f} MB, {cache_stats['evictions']} evicted")
+    if st.button("🧹 Clear parse cache", key="clear_parse_cache"):
+        parse_cache.clear()
+        st.rerun()
@@ -0,0 +1,224 @@
+"""Time parsing, cleaning, matching and export of every validation.
+
+    python benchmark.py --sizes 10000 100000 1000000 --data-dir bench-data
+
+For each size, synthetic extracts are generated (see synthetic.py) and
+written in the app's input layout; with --data-dir they are kept and
+reused by later runs. Every input is then parsed and cleaned once, and
+every check is matched and exported, with wall-clock seconds per stage.
+KNA1+KNVV vs MACE reads the merged workbook the KNA1 vs KNVV export
+wrote, as a user would.
+
+Results are checked against the original row-by-row implementation in
+reference.py up to --reference-rows, run on the inputs as the original
+app parsed and cleaned them, and against the result fingerprints
+an earlier run saved with --save-baseline when --baseline is given, so a
+performance change can be shown to leave every output as it was.
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+import synthetic
+from ingest import read_extract
+from normalize import normalize_text_columns
+from reference import reference, reference_merged_workbook, reference_read
+from validations import (
+    CHECK_INPUTS,
+    KEY_COLUMNS,
+    REPORTS,
+    compare,
+    input_layout,
+    report_file_name,
+    tidy_columns,
+    write_report,
+)
+
+SIZES = [10_000, 100_000, 1_000_000]
+STAGES = ["parse", "clean", "match", "export"]
+
+# The original loops are quadratic per customer; above this many rows
+# they take too long to be worth waiting for
+REFERENCE_ROWS = 10_000
+
+
+def _timed(fn, *args, **kwargs):
+    start = time.perf_counter()
+    result = fn(*args, **kwargs)
+    return result, time.perf_counter() - start
+
+
+def fingerprint(df):
+    # Hash of the column names and every value as text, in row order
+    digest = hashlib.sha256("\x1f".join(map(str, df.columns)).encode())
+    digest.update(pd.util.hash_pandas_object(df.astype(str), index=False).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def same_result(expected, actual):
+    # Equal as the reports show them: same columns, same text, same order
+    if list(expected.columns) != list(actual.columns) or len(expected) != len(actual):
+        return False
+    return expected.astype(str).reset_index(drop=True).equals(actual.astype(str).reset_index(drop=True))
+
+
+def prepare_inputs(rows, data_dir, fmt, options):
+    # Reuse extracts written for the same size and options, else generate them
+    tag = "_".join(f"{name}-{value}" for name, value in sorted(options.items()))
+    directory = os.path.join(data_dir, f"{rows}_{tag}")
+    paths = {name: os.path.join(directory, f"{file_name}.{fmt}") for name, file_name in synthetic.FILE_NAMES.items()}
+    if not all(os.path.exists(path) for path in paths.values()):
+        tables = synthetic.generate(rows, **options)
+        paths = synthetic.write_extracts(tables, directory, fmt)
+    return paths
+
+
+def load(path, name):
+    # Parse and clean one input the way its reader does, timing each half
+    raw, parse_seconds = _timed(read_extract, path, layout=input_layout(name))
+    df, clean_seconds = _timed(lambda: normalize_text_columns(tidy_columns(raw, name), KEY_COLUMNS[name], compact=True))
+    return df, parse_seconds, clean_seconds
+
+
+def reference_input(name, paths, cache):
+    # Input `name` as the original app had it; the merged one is the
+    # original KNA1 vs KNVV merge, saved and read back as its download was
+    if name not in cache:
+        if name == "merged":
+            merged = reference("kna1-knvv", reference_input("kna1", paths, cache), reference_input("knvv", paths, cache))[2]
+            cache[name] = reference_merged_workbook(merged)
+        else:
+            cache[name] = reference_read(paths[name], name)
+    return cache[name]
+
+
+def bench_size(rows, paths, output_dir, reference_rows=REFERENCE_ROWS):
+    """Benchmark every check on one set of inputs; returns one record per check."""
+    tables, parse, clean = {}, {}, {}
+    for name, path in paths.items():
+        tables[name], parse[name], clean[name] = load(path, name)
+
+    records = []
+    reference_inputs = {}
+    for check in REPORTS:
+        names = CHECK_INPUTS[check]
+        if check == "merged-mace":
+            merged_path = os.path.join(output_dir, report_file_name("kna1-knvv"))
+            tables["merged"], parse["merged"], clean["merged"] = load(merged_path, "merged")
+        inputs = [tables[name] for name in names]
+
+        frames, match_seconds = _timed(compare, check, *inputs)
+        reported = frames[2:] if check == "kna1-knvv" else frames
+        path = os.path.join(output_dir, report_file_name(check))
+        _, export_seconds = _timed(write_report, path, check, reported)
+
+        record = {
+            "rows": rows,
+            "check": check,
+            "input_rows": {name: len(tables[name]) for name in names},
+            "parse": sum(parse[name] for name in names),
+            "clean": sum(clean[name] for name in names),
+            "match": match_seconds,
+            "export": export_seconds,
+            "result_rows": [len(df) for df in frames],
+            "fingerprints": [fingerprint(df) for df in frames],
+            "matches_reference": None,
+        }
+        if max(len(df) for df in inputs) <= reference_rows:
+            expected = reference(check, *(reference_input(name, paths, reference_inputs) for name in names))
+            record["matches_reference"] = all(same_result(e, a) for e, a in zip(expected, frames))
+        records.append(record)
+    return records
+
+
+def print_records(records):
+    print(f"{'rows':>9}  {'check':<18} " + " ".join(f"{stage:>8}" for stage in STAGES) + f" {'total':>8}  {'result rows':<18} reference")
+    for record in records:
+        total = sum(record[stage] for stage in STAGES)
+        reference_state = {None: "skipped", True: "same", False: "DIFFERENT"}[record["matches_reference"]]
+        print(
+            f"{record['rows']:>9}  {record['check']:<18} "
+            + " ".join(f"{record[stage]:>8.2f}" for stage in STAGES)
+            + f" {total:>8.2f}  {'/'.join(map(str, record['result_rows'])):<18} {reference_state}"
+        )
+
+
+def compare_baseline(records, baseline):
+    # Names of the (size, check) pairs whose outputs changed since the baseline
+    changed = []
+    for record in records:
+        saved = baseline.get(str(record["rows"]), {}).get(record["check"])
+        if saved is not None and saved != record["fingerprints"]:
+            changed.append(f"{record['rows']} rows {record['check']}")
+    return changed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the validations on synthetic extracts.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=SIZES, help="KNVV rows per run (default: 10k, 100k and 1M)")
+    parser.add_argument("--duplicates", type=int, default=2, help="sales areas per customer")
+    parser.add_argument("--mismatch-rate", type=float, default=0.05)
+    parser.add_argument("--blank-rate", type=float, default=0.02)
+    parser.add_argument("--missing-rate", type=float, default=0.02)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", dest="fmt", choices=["xlsx", "csv", "parquet"], default="xlsx", help="input format")
+    parser.add_argument("--data-dir", help="keep generated extracts here and reuse them (default: a temporary directory)")
+    parser.add_argument("--reference-rows", type=int, default=REFERENCE_ROWS, help="check against the original loops up to this many input rows")
+    parser.add_argument("--json", help="write the timings to this file")
+    parser.add_argument("--save-baseline", help="save result fingerprints to this file")
+    parser.add_argument("--baseline", help="fail if results differ from fingerprints saved earlier")
+    args = parser.parse_args(argv)
+
+    options = {
+        "duplicates": args.duplicates,
+        "mismatch_rate": args.mismatch_rate,
+        "blank_rate": args.blank_rate,
+        "missing_rate": args.missing_rate,
+        "seed": args.seed,
+    }
+    records = []
+    with tempfile.TemporaryDirectory() as scratch:
+        data_dir = args.data_dir or os.path.join(scratch, "data")
+        for rows in args.sizes:
+            paths = prepare_inputs(rows, data_dir, args.fmt, options)
+            output_dir = os.path.join(scratch, f"reports_{rows}")
+            os.makedirs(output_dir)
+            size_records = bench_size(rows, paths, output_dir, args.reference_rows)
+            print_records(size_records)
+            records.extend(size_records)
+
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"options": options, "format": args.fmt, "records": records}, f, indent=2)
+
+    status = 0
+    if any(record["matches_reference"] is False for record in records):
+        print("Results differ from the original implementation", file=sys.stderr)
+        status = 1
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline["options"] != options:
+            print("Baseline was saved with other generator options; not compared", file=sys.stderr)
+        else:
+            changed = compare_baseline(records, baseline["fingerprints"])
+            for name in changed:
+                print(f"Changed since baseline: {name}", file=sys.stderr)
+            status = status or int(bool(changed))
+    if args.save_baseline:
+        fingerprints = {}
+        for record in records:
+            fingerprints.setdefault(str(record["rows"]), {})[record["check"]] = record["fingerprints"]
+        with open(args.save_baseline, "w") as f:
+            json.dump({"options": options, "fingerprints": fingerprints}, f, indent=2)
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
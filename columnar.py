@@ -0,0 +1,20 @@
+"""Arrow/Parquet helpers for handing DataFrames between steps without xlsx."""
+from io import BytesIO
+
+import pandas as pd
+
+
+def arrow_safe(df):
+    # Object columns mixing text with numbers/dates (common after Excel
+    # reads) cannot be stored as one Arrow type; write those values as text.
+    df = df.copy(deep=False)
+    for col in df.columns:
+        if df[col].dtype == object and pd.api.types.infer_dtype(df[col], skipna=True) not in ("string", "empty"):
+            df[col] = df[col].map(lambda value: value if pd.isna(value) else str(value))
+    return df
+
+
+def to_parquet_bytes(df):
+    output = BytesIO()
+    arrow_safe(df).to_parquet(output, index=False)
+    return output.getvalue()
@@ -0,0 +1,197 @@
+"""Per-stage wall time, peak memory and row counts of a validation run.
+
+Code marks its stages with `stage(name)`, which does nothing unless a
+RunRecorder is active in the current context, so the validations cost
+nothing extra when nobody is watching. Stages nest; a nested stage is
+recorded as "outer › inner". Memory is the process's resident set size,
+sampled every few milliseconds while a stage runs, so in a shared
+Streamlit server it also counts other sessions' work.
+
+    with RunRecorder("knvv-knvp") as run:
+        with stage("load knvv") as info:
+            df = read_sap_table(path)
+            info["rows_out"] = len(df)
+    run.write("run_records")
+"""
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from datetime import datetime, timezone
+
+try:
+    import resource
+except ImportError:
+    resource = None
+
+SAMPLE_SECONDS = 0.005
+MB = 2**20
+
+_active = contextvars.ContextVar("run_recorder", default=None)
+
+
+def rss_bytes():
+    # Current resident set size, or the process's peak where only that is known
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, AttributeError):
+        pass
+    if resource is not None:
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if sys.platform == "darwin" else peak * 1024
+    return None
+
+
+class _PeakSampler:
+    # Highest RSS seen between start() and stop(), sampled on a thread
+    def __init__(self):
+        self.start_bytes = rss_bytes()
+        self.peak_bytes = self.start_bytes
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True)
+
+    def _run(self):
+        while not self._done.wait(SAMPLE_SECONDS):
+            self._sample()
+
+    def _sample(self):
+        current = rss_bytes()
+        if current is not None and (self.peak_bytes is None or current > self.peak_bytes):
+            self.peak_bytes = current
+
+    def start(self):
+        if self.start_bytes is not None:
+            self._thread.start()
+        return self
+
+    def stop(self):
+        if self._thread.is_alive():
+            self._done.set()
+            self._thread.join()
+        self._sample()
+
+
+class RunRecorder:
+    """Collects the stages of one run; use as a context manager to activate it."""
+
+    def __init__(self, run, inputs=None):
+        self.run = run
+        self.inputs = inputs or {}
+        self.started = datetime.now(timezone.utc)
+        self.stages = []
+        self.results = {}
+        self.seconds = None
+        self.path = None
+        self._stack = []
+        self._start = time.perf_counter()
+        self._token = None
+        self._lock = threading.Lock()
+
+    def __enter__(self):
+        self._token = _active.set(self)
+        return self
+
+    def __exit__(self, *exc_info):
+        _active.reset(self._token)
+        self.seconds = time.perf_counter() - self._start
+        return False
+
+    @contextmanager
+    def stage(self, name, rows_in=None):
+        """Time and measure the enclosed block; set info["rows_out"] to record output rows."""
+        self._stack.append(name)
+        try:
+            with timed_stage(self, " › ".join(self._stack), rows_in) as info:
+                yield info
+        finally:
+            self._stack.pop()
+
+    def add(self, name, seconds, start_bytes=None, peak_bytes=None, rows_in=None, rows_out=None):
+        with self._lock:
+            self.stages.append({
+                "stage": name,
+                "seconds": round(seconds, 4),
+                "peak_rss_mb": None if peak_bytes is None else round(peak_bytes / MB, 1),
+                "rss_growth_mb": None if peak_bytes is None else round((peak_bytes - start_bytes) / MB, 1),
+                "rows_in": rows_in,
+                "rows_out": rows_out,
+            })
+
+    def record(self):
+        return {
+            "run": self.run,
+            "started": self.started.isoformat(timespec="seconds"),
+            "seconds": None if self.seconds is None else round(self.seconds, 4),
+            "inputs": self.inputs,
+            "results": self.results,
+            "stages": list(self.stages),
+        }
+
+    def file_name(self):
+        return f"{self.started:%Y%m%dT%H%M%S}_{self.run}.json"
+
+    def to_json(self):
+        return json.dumps(self.record(), indent=2, ensure_ascii=False, default=str)
+
+    def write(self, path, keep=None):
+        """Write the JSON run record to `path`, or into it when it is a directory.
+
+        With `keep`, only the newest `keep` records of that directory are
+        left; older ones are deleted.
+        """
+        directory = None
+        if os.path.isdir(path) or not path.endswith(".json"):
+            os.makedirs(path, exist_ok=True)
+            directory = path
+            path = os.path.join(path, self.file_name())
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(self.to_json())
+        self.path = path
+        if directory is not None and keep is not None:
+            prune_records(directory, keep)
+        return path
+
+
+def prune_records(directory, keep):
+    """Delete all but the newest `keep` run records in `directory`."""
+    records = [entry for entry in os.scandir(directory) if entry.is_file() and entry.name.endswith(".json")]
+    records.sort(key=lambda entry: (entry.stat().st_mtime, entry.name), reverse=True)
+    for entry in records[keep:]:
+        try:
+            os.remove(entry.path)
+        except FileNotFoundError:
+            # Pruned by another session at the same time
+            pass
+
+
+@contextmanager
+def stage(name, rows_in=None):
+    """Record the enclosed block as a stage of the active run, if there is one."""
+    recorder = _active.get()
+    if recorder is None:
+        yield {"rows_in": rows_in, "rows_out": None}
+        return
+    with recorder.stage(name, rows_in) as info:
+        yield info
+
+
+@contextmanager
+def timed_stage(recorder, name, rows_in=None):
+    """Record the enclosed block as stage `name` of `recorder`, active or not.
+
+    For work done outside the recorder's context, such as a report built
+    on another thread when its download button is clicked.
+    """
+    sampler = _PeakSampler().start()
+    start = time.perf_counter()
+    info = {"rows_in": rows_in, "rows_out": None}
+    try:
+        yield info
+    finally:
+        seconds = time.perf_counter() - start
+        sampler.stop()
+        recorder.add(name, seconds, sampler.start_bytes, sampler.peak_bytes, info["rows_in"], info["rows_out"])
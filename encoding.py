@@ -0,0 +1,114 @@
+"""Compact, dictionary-encoded storage of the loaded extracts.
+
+The readers keep customer IDs and the compared columns with few distinct
+values (sales org, distribution channel, division, currency, language,
+partner function...) as categoricals: one small integer code per row
+into one copy of each distinct value, instead of a string per row.
+
+Before a check runs, the customer ID columns of all its inputs are put
+on one shared dictionary (share_customer_codes), so the same customer
+has the same integer code in every table; merges then join on those
+codes and matching (see matching.Comparator) works on codes and on the
+distinct values only. Result frames are handed back as plain text
+(decoded), so reports, display and snapshots are as they always were.
+"""
+import numpy as np
+import pandas as pd
+
+# Columns holding customer IDs, in any of the inputs
+CUSTOMER_ID_COLUMNS = ["Customer", "CUSTOMER_NATURAL_ID", "Customer Parent", "CUSTOMER_PARTNER_NATURAL_ID"]
+
+
+def is_customer_id(column):
+    return str(column).strip().lower() in {name.lower() for name in CUSTOMER_ID_COLUMNS}
+
+
+def is_categorical(series):
+    return isinstance(series.dtype, pd.CategoricalDtype)
+
+
+def same_dictionary(left, right):
+    # Same categories in the same order, so equal codes mean equal values
+    # (unordered categorical dtypes compare equal whatever their order)
+    return is_categorical(left) and is_categorical(right) and left.cat.categories.equals(right.cat.categories)
+
+
+def to_categorical(codes, values, index=None):
+    """Series of `values[codes]` as a categorical; equal values may repeat in `values`."""
+    value_codes, categories = pd.factorize(values)
+    return pd.Series(pd.Categorical.from_codes(value_codes[codes], categories=categories), index=index)
+
+
+def distinct_text(values):
+    """(codes, distinct values as stripped text) of a column.
+
+    Categoricals already hold their distinct values; other columns are
+    factorized once. Missing values read as blank, and equal texts may
+    appear more than once among the distinct values.
+    """
+    if is_categorical(values):
+        codes = values.cat.codes.to_numpy()
+        uniques = pd.Series(values.cat.categories)
+        if (codes < 0).any():
+            codes = np.where(codes < 0, len(uniques), codes)
+            uniques = pd.concat([uniques, pd.Series([""], dtype=uniques.dtype)], ignore_index=True)
+    else:
+        codes, uniques = pd.factorize(values, use_na_sentinel=False)
+        uniques = pd.Series(uniques)
+    return codes, uniques.astype(str).str.strip().fillna("")
+
+
+def shared_codes(left, right):
+    """Integer codes of two columns' values on one dictionary (values as they are)."""
+    if same_dictionary(left, right):
+        return left.cat.codes.to_numpy(), right.cat.codes.to_numpy()
+    codes, _ = pd.factorize(pd.concat([left, right], ignore_index=True).astype(object))
+    return codes[:len(left)], codes[len(left):]
+
+
+def share_customer_codes(frames):
+    """Put the customer ID columns of all `frames` on one dictionary.
+
+    Only the distinct IDs are hashed; every row keeps an integer code,
+    renumbered into the shared categories. Nothing changes unless some
+    ID column is categorical; plain ones next to it are encoded too.
+    Frames are not modified.
+    """
+    columns = [(i, col) for i, df in enumerate(frames) for col in df.columns if is_customer_id(col)]
+    values = [frames[i][col] for i, col in columns]
+    if not any(is_categorical(column) for column in values) or all(same_dictionary(values[0], column) for column in values):
+        return tuple(frames)
+
+    codes, categories = [], []
+    for column in values:
+        if is_categorical(column):
+            codes.append(column.cat.codes.to_numpy())
+            categories.append(column.cat.categories)
+        else:
+            column_codes, uniques = pd.factorize(column)
+            codes.append(column_codes)
+            categories.append(pd.Index(uniques))
+    union_codes, union = pd.factorize(np.concatenate([np.asarray(c, dtype=object) for c in categories]))
+    category_dtypes = {c.dtype for c in categories}
+    dtype = pd.CategoricalDtype(pd.Index(union, dtype=category_dtypes.pop() if len(category_dtypes) == 1 else object))
+    bounds = np.cumsum([len(c) for c in categories])[:-1]
+
+    frames = [df.copy(deep=False) for df in frames]
+    for (i, col), column_codes, renumber in zip(columns, codes, np.split(union_codes, bounds)):
+        # Missing values keep code -1
+        shared = np.where(column_codes < 0, -1, renumber[np.maximum(column_codes, 0)]) if len(renumber) else column_codes
+        frames[i][col] = pd.Categorical.from_codes(shared, dtype=dtype)
+    return tuple(frames)
+
+
+def decoded(df):
+    """df with categorical columns turned back into plain values."""
+    columns = [col for col in df.columns if is_categorical(df[col])]
+    if not columns:
+        return df
+    df = df.copy(deep=False)
+    for col in columns:
+        # A take on the categories' own array; missing codes give NaN
+        values = df[col].cat
+        df[col] = pd.Series(values.categories.array.take(values.codes.to_numpy(), allow_fill=True), index=df.index)
+    return df
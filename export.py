@@ -0,0 +1,166 @@
+"""Report writers: streaming xlsx, CSV and Parquet.
+
+Reports are lists of (sheet name, DataFrame). xlsx is written with
+openpyxl's write-only mode in row chunks, so memory stays flat however
+long the sheets are; sheets longer than Excel's row limit can be split
+into "<name> (2)", "<name> (3)", ... CSV and Parquet write one file per
+sheet, zipped together when a report has more than one sheet. Sheets may
+also be tables kept in a database (sql_backend.SqlTable), which are read
+back a chunk at a time.
+"""
+import zipfile
+from io import BytesIO, TextIOWrapper
+
+from columnar import arrow_safe
+
+FORMATS = ["xlsx", "csv", "parquet"]
+
+EXCEL_MAX_ROWS = 1_048_576  # including the header row
+SHEET_NAME_LIMIT = 31
+CHUNK_ROWS = 50_000
+
+MIME_TYPES = {
+    "xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    "csv": "text/csv",
+    "parquet": "application/vnd.apache.parquet",
+    "zip": "application/zip",
+}
+
+
+def _part_name(name, part):
+    if part == 1:
+        return name
+    suffix = f" ({part})"
+    return name[:SHEET_NAME_LIMIT - len(suffix)] + suffix
+
+
+def _in_database(df):
+    return hasattr(df, "chunks")
+
+
+def _slice(df, start, stop):
+    return df.slice(start, stop) if _in_database(df) else df.iloc[start:stop]
+
+
+def _chunks(df):
+    if _in_database(df):
+        yield from df.chunks(CHUNK_ROWS)
+        return
+    for start in range(0, len(df), CHUNK_ROWS):
+        yield df.iloc[start:start + CHUNK_ROWS]
+
+
+def split_sheets(sheets, max_rows=EXCEL_MAX_ROWS - 1):
+    # Cut sheets over max_rows data rows into numbered parts
+    for name, df in sheets:
+        if len(df) <= max_rows:
+            yield name, df
+            continue
+        for part, start in enumerate(range(0, len(df), max_rows), start=1):
+            yield _part_name(name, part), _slice(df, start, start + max_rows)
+
+
+def _rows(df):
+    # Plain Python values, blanks as None, a chunk at a time
+    for chunk in _chunks(df):
+        chunk = chunk.astype(object)
+        chunk = chunk.where(chunk.notna(), None)
+        yield from chunk.itertuples(index=False, name=None)
+
+
+def write_xlsx(output, sheets, split=True):
+    from openpyxl import Workbook
+
+    if split:
+        sheets = split_sheets(sheets, EXCEL_MAX_ROWS - 1)
+    workbook = Workbook(write_only=True)
+    for name, df in sheets:
+        if len(df) > EXCEL_MAX_ROWS - 1:
+            raise ValueError(f"Sheet '{name}' has {len(df)} rows, more than Excel allows; enable sheet splitting")
+        sheet = workbook.create_sheet(title=name)
+        if len(df.columns):
+            sheet.append([str(col) for col in df.columns])
+        for row in _rows(df):
+            sheet.append(row)
+    if not workbook.worksheets:
+        workbook.create_sheet()
+    workbook.save(output)
+
+
+def _write_csv(output, df):
+    if not _in_database(df):
+        df.to_csv(output, index=False, chunksize=CHUNK_ROWS)
+        return
+    df.head(0).to_csv(output, index=False)
+    for chunk in _chunks(df):
+        chunk.to_csv(output, index=False, header=False)
+
+
+def _write_parquet(output, df):
+    if _in_database(df) and len(df.columns):
+        # Streamed as the database types it, one row group per batch
+        import pyarrow.parquet as pq
+
+        batches = df.arrow_batches(CHUNK_ROWS * 10)
+        with pq.ParquetWriter(output, batches.schema) as writer:
+            for batch in batches:
+                writer.write_batch(batch)
+        return
+    if _in_database(df):
+        df = df.head(0)
+    arrow_safe(df).to_parquet(output, index=False, row_group_size=CHUNK_ROWS * 10)
+
+
+def write_files(output, sheets, fmt):
+    # One CSV/Parquet file, or a zip of one file per sheet
+    sheets = list(sheets)
+    if len(sheets) == 1:
+        if fmt == "csv":
+            # Detach so the caller's file stays open
+            text = TextIOWrapper(output, encoding="utf-8", newline="")
+            _write_csv(text, sheets[0][1])
+            text.flush()
+            text.detach()
+        else:
+            _write_parquet(output, sheets[0][1])
+        return
+    with zipfile.ZipFile(output, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+        for name, df in sheets:
+            with archive.open(f"{name}.{fmt}", "w") as member:
+                if fmt == "csv":
+                    with TextIOWrapper(member, encoding="utf-8", newline="") as text:
+                        _write_csv(text, df)
+                else:
+                    _write_parquet(member, df)
+
+
+def file_name(base_name, fmt, n_sheets):
+    stem = base_name.rsplit(".", 1)[0]
+    if fmt == "xlsx":
+        return f"{stem}.xlsx"
+    return f"{stem}.{fmt}" if n_sheets == 1 else f"{stem}.zip"
+
+
+def mime_type(fmt, n_sheets):
+    return MIME_TYPES[fmt] if fmt == "xlsx" or n_sheets == 1 else MIME_TYPES["zip"]
+
+
+def write_sheets(output, sheets, fmt="xlsx", split=True):
+    """Write (sheet name, DataFrame) pairs to a path or binary file in `fmt`."""
+    if fmt not in FORMATS:
+        raise ValueError(f"Unknown export format '{fmt}'")
+    if fmt == "xlsx":
+        write_xlsx(output, sheets, split=split)
+        return
+    if isinstance(output, str):
+        with open(output, "wb") as f:
+            write_files(f, sheets, fmt)
+    else:
+        write_files(output, sheets, fmt)
+
+
+def render(sheets, fmt="xlsx", split=True):
+    """Return the report as bytes, as st.download_button takes them."""
+    output = BytesIO()
+    write_sheets(output, sheets, fmt=fmt, split=split)
+    return output.getvalue()
@@ -0,0 +1,237 @@
+"""Incremental validation: re-check only the customers whose rows changed.
+
+Every result row of a check belongs to one customer and depends on that
+customer's rows alone, which is also what lets suite.py partition by
+customer. So a run can keep the previous verdicts of every customer whose
+rows are the same on both sides. After each run a snapshot is kept per
+check: an order-sensitive digest of each customer's rows in every input,
+and the result frames. The next run compares only the customers that were
+added, removed or changed, moves the cached result rows of the others to
+their new row positions and gives the same frames as a full run.
+
+Snapshots are pickles of the result frames, so that cached rows keep
+their exact values and dtypes; only load snapshots this module wrote.
+"""
+import os
+import pickle
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+from encoding import distinct_text
+from suite import PARTITION_KEYS, ROW_COLUMN, combine
+from validations import CHECK_INPUTS, compare, find_column
+
+SNAPSHOT_VERSION = 1
+
+# Customer and position within the customer of each result row's source row
+KEY_COLUMN = "__incremental_key__"
+RANK_COLUMN = "__incremental_rank__"
+
+# Input (position in CHECK_INPUTS) each result frame's rows come from
+RESULT_SOURCES = {
+    "kna1-knvv": [0, 1, 0],
+    "merged-mace": [0, 1],
+    "knvv-knvp": [0],
+    "knvp-mace-partner": [0, 1],
+}
+
+# Result frames listing broken customers; the KNA1+KNVV merge is a view
+VERDICT_FRAMES = {
+    "kna1-knvv": [0, 1],
+    "merged-mace": [0, 1],
+    "knvv-knvp": [0],
+    "knvp-mace-partner": [0, 1],
+}
+
+_MIX = np.uint64(0x9E3779B97F4A7C15)
+
+
+class Customers:
+    """Customer of each row of one input, as codes into `keys`, and its position within the customer."""
+
+    def __init__(self, df, key):
+        # Keys as the checks compare them, like suite's partitioning
+        codes, texts = distinct_text(df[key])
+        # Unused categories are no customer
+        used = np.bincount(codes, minlength=len(texts)) > 0
+        text_codes, uniques = pd.factorize(texts[used])
+        remap = np.full(len(texts), -1, dtype=np.int64)
+        remap[used] = text_codes
+        self.codes = remap[codes]
+        # Object dtype: hash lookups on it are much faster than on Arrow text
+        self.keys = pd.Index(np.asarray(uniques, dtype=object), dtype=object)
+        # Values that strip to the same text are one customer, so rows are
+        # grouped by these codes, not by distinct_text's
+        self.order = np.argsort(self.codes, kind="stable")
+        counts = np.bincount(self.codes, minlength=len(self.keys))
+        self.starts = np.cumsum(counts) - counts
+        self.ranks = np.empty(len(self.codes), dtype=np.int64)
+        self.ranks[self.order] = np.arange(len(self.codes)) - np.repeat(self.starts, counts)
+
+    def digests(self, df):
+        """One 64-bit digest per customer over its rows' values, in row order."""
+        mixed = pd.util.hash_array(row_hashes(df) ^ (self.ranks.astype(np.uint64) * _MIX))
+        if not len(mixed):
+            return pd.Series(np.array([], dtype=np.uint64), index=self.keys)
+        return pd.Series(np.add.reduceat(mixed[self.order], self.starts), index=self.keys)
+
+    def positions(self, keys, ranks):
+        # Row of the `ranks`-th row of each of `keys`; all must exist
+        return self.order[self.starts[self.keys.get_indexer(keys)] + ranks]
+
+
+def row_hashes(df):
+    # One 64-bit hash per row over every column; each distinct value of a
+    # column is hashed once, which is cheap on repetitive extracts
+    hashes = np.zeros(len(df), dtype=np.uint64)
+    for col in df.columns:
+        codes, uniques = pd.factorize(df[col], use_na_sentinel=False)
+        if not isinstance(uniques, np.ndarray):
+            uniques = np.asarray(uniques, dtype=object)
+        hashes = (hashes ^ pd.util.hash_array(uniques, categorize=False)[codes]) * _MIX
+    return hashes
+
+
+def _layout(df):
+    # Column names and dtypes; when they change every digest is suspect
+    return [(str(col), str(dtype)) for col, dtype in df.dtypes.items()]
+
+
+def _changed_keys(now, before):
+    # Customers added, removed or with other rows since the snapshot
+    previous = before.index.get_indexer(now.index)
+    changed = (previous == -1) | (before.to_numpy()[previous] != now.to_numpy())
+    removed = now.index.get_indexer(before.index) == -1
+    return now.index[changed].append(before.index[removed])
+
+
+def _broken(check, frames):
+    keys = [df[KEY_COLUMN] for i, df in enumerate(frames) if i in VERDICT_FRAMES[check] and KEY_COLUMN in df]
+    return pd.Index(pd.concat(keys).unique()) if keys else pd.Index([])
+
+
+def snapshot_path(snapshot_dir, check):
+    return os.path.join(snapshot_dir, f"{check}.pkl")
+
+
+def load_snapshot(snapshot_dir, check):
+    path = snapshot_path(snapshot_dir, check)
+    if not os.path.exists(path):
+        return None
+    try:
+        with open(path, "rb") as f:
+            snapshot = pickle.load(f)
+    except Exception:
+        # Truncated, or written by other code: the run is a full one
+        return None
+    if not isinstance(snapshot, dict) or snapshot.get("version") != SNAPSHOT_VERSION:
+        return None
+    return snapshot
+
+
+def save_snapshot(snapshot_dir, check, snapshot):
+    # Written to a file of its own first, so a failed run leaves the old
+    # snapshot and runs saving at the same time never share a file
+    os.makedirs(snapshot_dir, exist_ok=True)
+    fd, tmp = tempfile.mkstemp(dir=snapshot_dir, prefix=f".{check}.", suffix=".tmp")
+    try:
+        with os.fdopen(fd, "wb") as f:
+            pickle.dump(snapshot, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, snapshot_path(snapshot_dir, check))
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def prune_snapshots(root, keep):
+    """Delete all but the `keep` most recently saved snapshot directories in `root`."""
+    if not os.path.isdir(root):
+        return
+    directories = [entry for entry in os.scandir(root) if entry.is_dir()]
+    # Saving a snapshot renames it into its directory, which updates the
+    # directory's modification time
+    directories.sort(key=lambda entry: (entry.stat().st_mtime, entry.name), reverse=True)
+    for entry in directories[keep:]:
+        # Already pruned by another session at the same time is fine
+        shutil.rmtree(entry.path, ignore_errors=True)
+
+
+def run_incremental(check, frames, snapshot_dir, **options):
+    """Run `check` on `frames`, re-comparing only customers changed since the last run.
+
+    `options` go to validations.compare; a snapshot taken with others is
+    not reused. Returns (result frames as compare gives them, delta). The
+    delta says what was re-checked and which customers are newly broken
+    (in a result frame now, not before) or newly fixed; both lists are
+    None when there was no readable snapshot to compare with. The snapshot in
+    `snapshot_dir` is replaced by this run's.
+    """
+    key_columns = [find_column(df, PARTITION_KEYS[name]) for df, name in zip(frames, CHECK_INPUTS[check])]
+    if None in key_columns:
+        # No customer column: the check reports it as it would in a full run
+        return compare(check, *frames, **options), None
+    inputs = [Customers(df, key) for df, key in zip(frames, key_columns)]
+    digests = [customers.digests(df) for customers, df in zip(inputs, frames)]
+    layout = [_layout(df) for df in frames]
+
+    snapshot = load_snapshot(snapshot_dir, check)
+    full = snapshot is None or snapshot["layout"] != layout or snapshot.get("options", {}) != options
+    every = inputs[0].keys.append([customers.keys for customers in inputs[1:]]).unique()
+    if full:
+        changed = every
+    else:
+        changed = pd.Index([], dtype=object)
+        for now, before in zip(digests, snapshot["digests"]):
+            changed = changed.append(_changed_keys(now, before))
+        changed = changed.unique()
+
+    numbered = [df.assign(**{ROW_COLUMN: np.arange(len(df))}) for df in frames]
+    if full:
+        rechecked = numbered
+    else:
+        # Rows of the changed customers, by their customer codes
+        rechecked = [df[(changed.get_indexer(customers.keys) != -1)[customers.codes]] for df, customers in zip(numbered, inputs)]
+
+    fresh = compare(check, *rechecked, **options) if full or len(changed) else None
+    results = []
+    for i, source in enumerate(RESULT_SOURCES[check]):
+        parts = []
+        if fresh is not None:
+            df = fresh[i]
+            if len(df.columns):
+                customers, positions = inputs[source], df[ROW_COLUMN].to_numpy()
+                df = df.assign(**{
+                    KEY_COLUMN: pd.Series(customers.keys.to_numpy()[customers.codes[positions]], index=df.index, dtype=object),
+                    RANK_COLUMN: customers.ranks[positions],
+                })
+            parts.append(df)
+        if not full:
+            cached = snapshot["frames"][i]
+            if len(cached.columns):
+                cached = cached[changed.get_indexer(cached[KEY_COLUMN]) == -1]
+                positions = inputs[source].positions(cached[KEY_COLUMN], cached[RANK_COLUMN].to_numpy())
+                cached = cached.assign(**{ROW_COLUMN: positions})
+            # An empty result keeps the shape the compare gives it
+            if len(cached) or fresh is None:
+                parts.append(cached)
+        results.append(combine(parts))
+
+    broken = _broken(check, results)
+    delta = {
+        "full_run": full,
+        "customers": len(every),
+        "changed_customers": len(changed),
+        "rechecked_rows": sum(len(df) for df in rechecked),
+        "newly_broken": None,
+        "newly_fixed": None,
+    }
+    if snapshot is not None:
+        broken_before = _broken(check, snapshot["frames"])
+        delta["newly_broken"] = sorted(broken.difference(broken_before))
+        delta["newly_fixed"] = sorted(broken_before.difference(broken))
+
+    save_snapshot(snapshot_dir, check, {"version": SNAPSHOT_VERSION, "layout": layout, "options": options, "digests": digests, "frames": results})
+    return tuple(df.drop(columns=[KEY_COLUMN, RANK_COLUMN]) if KEY_COLUMN in df else df for df in results), delta
@@ -0,0 +1,304 @@
+"""Readers for SAP and MACE extracts in xlsx, CSV or Parquet form.
+
+The format is detected from the file content, so uploads, paths and
+in-memory buffers all work. Only the requested columns of an Excel
+workbook are kept, and their values are typed exactly as pd.read_excel
+would type them. CSV and Parquet files produced by scripts are read with
+the header on the first row.
+
+Workbooks are read with one of two engines, a choice of speed against
+memory. python-calamine is about ten times faster, but holds the whole
+sheet, every column of it, until the read is done. openpyxl's read-only
+mode streams one row at a time, so only the kept columns are held. On a
+30,000-row sheet of 100 columns read for two of them, calamine took 4 s
+and 275 MB, openpyxl 62 s and 30 MB; read for all of them, 8 s and
+300 MB against 88 s and 245 MB. read_extract uses calamine when it is
+installed, unless the MACE_XLSX_ENGINE environment variable or its
+`engine` argument says "openpyxl". read_extract_chunks always streams
+through openpyxl, so its memory stays at about one chunk however large
+the sheet.
+"""
+import os
+from datetime import date, datetime
+from io import BytesIO
+
+import numpy as np
+import pandas as pd
+from pandas.io.parsers import TextParser
+
+try:
+    import python_calamine  # noqa: F401
+    HAS_CALAMINE = True
+except ImportError:
+    HAS_CALAMINE = False
+
+# Workbook engines of read_extract, see above
+XLSX_ENGINES = ["calamine", "openpyxl"]
+XLSX_ENGINE = os.environ.get("MACE_XLSX_ENGINE") or ("calamine" if HAS_CALAMINE else "openpyxl")
+
+# Rows of the SAP export layout: header on row 5, junk row 6 (0-based)
+SAP_HEADER_ROW = 4
+SAP_SKIP_ROWS = [5]
+
+XLSX_MAGIC = b"PK\x03\x04"
+PARQUET_MAGIC = b"PAR1"
+EXCEL_ERRORS = {"#NULL!", "#DIV/0!", "#VALUE!", "#REF!", "#NAME?", "#NUM!", "#N/A"}
+
+# Rows per frame of read_extract_chunks
+CHUNK_ROWS = 100_000
+
+
+def _open(source):
+    # A seekable binary buffer over uploads, paths and raw bytes
+    if isinstance(source, (bytes, bytearray)):
+        return BytesIO(source)
+    if hasattr(source, "read"):
+        source.seek(0)
+        return source
+    return open(source, "rb")
+
+
+def detect_format(buffer):
+    head = buffer.read(4)
+    buffer.seek(0)
+    if head == XLSX_MAGIC:
+        return "xlsx"
+    if head == PARQUET_MAGIC:
+        return "parquet"
+    if head[:4] == b"\xd0\xcf\x11\xe0":
+        return "xls"
+    return "csv"
+
+
+def _wanted(columns):
+    # Case-insensitive column filter on stripped header names, like find_column
+    if columns is None:
+        return None
+    wanted = {str(col).strip().lower() for col in columns}
+    return lambda name: str(name).strip().lower() in wanted
+
+
+def _header_names(row):
+    # Column names as pd.read_excel builds them: blanks become "Unnamed: i",
+    # repeats get ".1", ".2", ... suffixes
+    names, seen = [], {}
+    for i, value in enumerate(row):
+        name = f"Unnamed: {i}" if value is None or value == "" else value
+        if name in seen:
+            count = seen[name]
+            while f"{name}.{count}" in seen:
+                count += 1
+            seen[name] = count + 1
+            name = f"{name}.{count}"
+        seen[name] = 1
+        names.append(name)
+    return names
+
+
+def _number(value):
+    # Integral floats become ints, as in pandas' Excel readers
+    if value != value or value in (float("inf"), float("-inf")):
+        return value
+    as_int = int(value)
+    return as_int if as_int == value else float(value)
+
+
+def _openpyxl_value(value):
+    # Mirrors pandas' openpyxl cell conversion
+    if value is None:
+        return ""
+    if isinstance(value, bool):
+        return value
+    if isinstance(value, (int, float)):
+        return _number(value)
+    if isinstance(value, str) and value in EXCEL_ERRORS:
+        return np.nan
+    return value
+
+
+def _calamine_value(value):
+    # Mirrors pandas' calamine cell conversion
+    if isinstance(value, float):
+        return _number(value)
+    if isinstance(value, date) and not isinstance(value, datetime):
+        return datetime(value.year, value.month, value.day)
+    return value
+
+
+def _openpyxl_rows(buffer):
+    from openpyxl import load_workbook
+
+    workbook = load_workbook(buffer, read_only=True, data_only=True, keep_links=False)
+    try:
+        sheet = workbook.worksheets[0]
+        sheet.reset_dimensions()
+        yield from sheet.iter_rows(values_only=True)
+    finally:
+        workbook.close()
+
+
+def _calamine_rows(buffer):
+    from python_calamine import CalamineWorkbook
+
+    sheet = CalamineWorkbook.from_filelike(buffer).get_sheet_by_index(0)
+    # iter_rows starts at the first used column; pad back to column A
+    padding = [""] * (sheet.start[1] if sheet.start else 0)
+    for row in sheet.iter_rows():
+        yield padding + row
+
+
+def _xlsx_batches(rows, convert, header_row, skip_rows, keep, batch_rows=None):
+    # Stream the rows, keeping converted values for the wanted columns
+    # only; yields (names, rows) batches of `batch_rows` rows, or a single
+    # batch of all of them. Blank rows after the last data row are dropped
+    skipped = set(skip_rows)
+
+    # Everything above the header is junk; the header decides which
+    # column positions are kept
+    header = []
+    for row_number, row in enumerate(rows):
+        if row_number == header_row:
+            header = [convert(value) for value in row]
+            break
+    while header and header[-1] == "":
+        header.pop()
+    names = _header_names(header)
+    positions = None if keep is None else [i for i, name in enumerate(names) if keep(name)]
+
+    def batch(data):
+        if positions is not None:
+            return [names[i] for i in positions], data
+        # Cells past the header still become columns, as in pd.read_excel
+        return _header_names(header + [""] * (width - len(header))), [values + [""] * (width - len(values)) for values in data]
+
+    data, blanks = [], []
+    width = len(names)
+    batches = 0
+    for row_number, row in enumerate(rows, start=header_row + 1):
+        if row_number in skipped:
+            continue
+        if positions is None:
+            values = [convert(value) for value in row]
+            while values and values[-1] == "":
+                values.pop()
+            width = max(width, len(values))
+        else:
+            values = [convert(row[i]) if i < len(row) else "" for i in positions]
+        if not any(value is not None and value != "" for value in row):
+            # Kept only if a data row follows
+            blanks.append(values)
+            continue
+        data.extend(blanks)
+        blanks = []
+        data.append(values)
+        if batch_rows and len(data) >= batch_rows:
+            yield batch(data)
+            batches += 1
+            data = []
+    if data or not batches:
+        yield batch(data)
+
+
+def _xlsx_frame(names, data):
+    if not names:
+        return pd.DataFrame(index=range(len(data)))
+    # Same type inference as pd.read_excel, on the kept columns only
+    parser = TextParser(data, names=names, header=None, skip_blank_lines=False)
+    return parser.read()
+
+
+def _xlsx_rows(buffer, engine):
+    # (row iterator, cell conversion) of the first sheet; calamine loads
+    # the sheet before its first row, openpyxl only holds the current one
+    if engine not in XLSX_ENGINES:
+        raise ValueError(f"Unknown workbook engine '{engine}', expected one of {', '.join(XLSX_ENGINES)}")
+    if engine == "calamine":
+        if not HAS_CALAMINE:
+            raise ValueError("The calamine workbook engine needs the python-calamine package")
+        return _calamine_rows(buffer), _calamine_value
+    return _openpyxl_rows(buffer), _openpyxl_value
+
+
+def read_extract(source, layout="plain", columns=None, engine=None):
+    """Read an extract into a raw (uncleaned) DataFrame.
+
+    `layout` is "sap" for SAP exports (header on row 5, junk row 6) or
+    "plain" for a header on the first row; it only applies to Excel files.
+    `columns` limits the result to those columns (matched on stripped,
+    case-insensitive names) and is the cheapest way to read wide tables.
+    `engine` ("calamine" or "openpyxl", default XLSX_ENGINE) reads Excel
+    workbooks, faster or in less memory.
+    """
+    header_row, skip_rows = (SAP_HEADER_ROW, SAP_SKIP_ROWS) if layout == "sap" else (0, [])
+    keep = _wanted(columns)
+    buffer = _open(source)
+    try:
+        kind = detect_format(buffer)
+        if kind == "xlsx":
+            rows, convert = _xlsx_rows(buffer, engine or XLSX_ENGINE)
+            return _xlsx_frame(*next(_xlsx_batches(rows, convert, header_row, skip_rows, keep)))
+        if kind == "xls":
+            return pd.read_excel(buffer, header=header_row, skiprows=skip_rows, usecols=keep)
+        if kind == "parquet":
+            import pyarrow.parquet as pq
+
+            names = pq.ParquetFile(buffer).schema_arrow.names
+            buffer.seek(0)
+            return pd.read_parquet(buffer, columns=[n for n in names if keep is None or keep(n)])
+        # Text as-is: no numeric guessing, and codes like "NA" stay codes
+        return pd.read_csv(buffer, dtype=str, keep_default_na=False, usecols=keep)
+    finally:
+        if buffer is not source:
+            buffer.close()
+
+
+def read_extract_chunks(source, layout="plain", columns=None, chunk_rows=CHUNK_ROWS):
+    """read_extract a chunk of rows at a time, for extracts too large to hold whole.
+
+    All formats are streamed; Excel workbooks always through openpyxl's
+    read-only mode, never python-calamine. Each chunk of a workbook is
+    typed on its own, so a column may come back as numbers in one chunk and
+    text in the next, and cells past the header may add columns to later
+    chunks.
+    Old .xls files are read whole and handed out in slices. Always yields
+    at least one frame, empty if the extract has no rows.
+    """
+    header_row, skip_rows = (SAP_HEADER_ROW, SAP_SKIP_ROWS) if layout == "sap" else (0, [])
+    keep = _wanted(columns)
+    buffer = _open(source)
+    try:
+        kind = detect_format(buffer)
+        if kind == "parquet":
+            import pyarrow.parquet as pq
+
+            parquet = pq.ParquetFile(buffer)
+            names = [n for n in parquet.schema_arrow.names if keep is None or keep(n)]
+            empty = True
+            for batch in parquet.iter_batches(batch_size=chunk_rows, columns=names):
+                empty = False
+                yield batch.to_pandas()
+            if empty:
+                yield parquet.schema_arrow.empty_table().select(names).to_pandas()
+        elif kind == "csv":
+            empty = True
+            for chunk in pd.read_csv(buffer, dtype=str, keep_default_na=False, usecols=keep, chunksize=chunk_rows):
+                empty = False
+                yield chunk
+            if empty:
+                buffer.seek(0)
+                yield pd.read_csv(buffer, dtype=str, keep_default_na=False, usecols=keep, nrows=0)
+        elif kind == "xlsx":
+            rows, convert = _xlsx_rows(buffer, "openpyxl")
+            start = 0
+            for names, data in _xlsx_batches(rows, convert, header_row, skip_rows, keep, batch_rows=chunk_rows):
+                chunk = _xlsx_frame(names, data)
+                chunk.index = pd.RangeIndex(start, start + len(chunk))
+                start += len(chunk)
+                yield chunk
+        else:
+            df = read_extract(buffer, layout=layout, columns=columns)
+            for start in range(0, max(len(df), 1), chunk_rows):
+                yield df.iloc[start:start + chunk_rows]
+    finally:
+        if buffer is not source:
+            buffer.close()
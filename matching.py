@@ -0,0 +1,352 @@
+import numpy as np
+import pandas as pd
+
+from encoding import distinct_text
+
+# Codes used for values that are skipped (blank / "not found") and for values
+# that parse to NaN, which never compare equal to anything.
+WILDCARD = -1
+NEVER_EQUAL = -2
+
+# Upper bound on candidate (left row, right row) pairs compared at once, so
+# customers with many rows on both sides cannot blow up memory.
+MAX_PAIRS_PER_CHUNK = 2_000_000
+
+
+# Numerals that float() and a vectorised cast parse identically.
+PLAIN_NUMBER = r"[+-]?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][+-]?[0-9]+)?"
+# Other ASCII spellings float() may accept; non-ASCII values (e.g. other
+# scripts' digits) are always handed to float() itself.
+MAYBE_NUMBER = r"(?i)[+-]?(?:[0-9_.]+(?:e[+-]?[0-9_]+)?|inf(?:inity)?|nan)"
+ASCII_ONLY = r"[\x00-\x7f]*"
+
+
+def _to_float(value):
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+
+def _parse_numbers(values):
+    # float(value) for every value, NaN where float() would raise. Plain
+    # numerals are cast in one vectorised step; only unusual spellings
+    # ("1_000", "Infinity", non-ASCII digits) fall back to Python.
+    numbers = np.full(len(values), np.nan)
+    parsed = np.zeros(len(values), dtype=bool)
+    plain = values.str.fullmatch(PLAIN_NUMBER).to_numpy(dtype=bool)
+    numbers[plain] = values[plain].astype(float).to_numpy()
+    parsed[plain] = True
+    unusual = ~plain & (
+        values.str.fullmatch(MAYBE_NUMBER).to_numpy(dtype=bool)
+        | ~values.str.fullmatch(ASCII_ONLY).to_numpy(dtype=bool)
+    )
+    for i, value in zip(np.flatnonzero(unusual), values[unusual].tolist()):
+        number = _to_float(value)
+        if number is not None:
+            numbers[i] = number
+            parsed[i] = True
+    return numbers, parsed
+
+
+# Each comparator turns distinct, non-blank values into codes that are
+# equal exactly when the values compare equal.
+def _exact_codes(values):
+    return pd.factorize(values)[0]
+
+
+def _numeric_codes(values):
+    # Equal as numbers where a value parses as one, as text otherwise;
+    # values that parse to NaN never compare equal.
+    codes = np.empty(len(values), dtype=np.int64)
+    numbers, parsed = _parse_numbers(values)
+    never_equal = parsed & np.isnan(numbers)
+    codes[never_equal] = NEVER_EQUAL
+    comparable = parsed & ~never_equal
+    # Adding 0.0 folds -0.0 into 0.0, as float equality does.
+    number_codes, number_uniques = pd.factorize(numbers[comparable] + 0.0)
+    codes[comparable] = number_codes
+    text_codes, _ = pd.factorize(values[~parsed])
+    codes[~parsed] = text_codes + len(number_uniques)
+    return codes
+
+
+def _case_insensitive_codes(values):
+    return pd.factorize(values.str.casefold())[0]
+
+
+def _trim_leading_zeros_codes(values):
+    # "000123" equals "123"; a run of zeros stays "0"
+    trimmed = values.str.lstrip("0")
+    return pd.factorize(trimmed.mask(trimmed.eq("") & values.ne(""), "0"))[0]
+
+
+COMPARATORS = {
+    "exact": _exact_codes,
+    "numeric": _numeric_codes,
+    "case-insensitive": _case_insensitive_codes,
+    "trim-leading-zeros": _trim_leading_zeros_codes,
+}
+
+# What blank values (see BLANK_VALUES) do: match anything, compare like
+# any other value, or never match.
+BLANK_POLICIES = ["skip", "compare", "mismatch"]
+BLANK_VALUES = ["", "Not Found"]
+
+
+class Comparator:
+    """How the values of one mapped column pair are compared.
+
+    `kind` is one of COMPARATORS and `blanks` one of BLANK_POLICIES for
+    the `blank_values`, which are matched case-insensitively.
+    """
+
+    def __init__(self, kind="exact", blanks="compare", blank_values=BLANK_VALUES):
+        if kind not in COMPARATORS:
+            raise ValueError(f"Unknown comparator '{kind}'; use one of {', '.join(COMPARATORS)}")
+        if blanks not in BLANK_POLICIES:
+            raise ValueError(f"Unknown blank policy '{blanks}'; use one of {', '.join(BLANK_POLICIES)}")
+        self.kind = kind
+        self.blanks = blanks
+        self.blank_values = sorted({str(value).strip().lower() for value in blank_values})
+
+    def __repr__(self):
+        return f"Comparator({self.kind!r}, blanks={self.blanks!r})"
+
+    def encode(self, left_values, right_values):
+        """Encode both sides' values, as stripped text, into shared integer codes.
+
+        Two values compare equal exactly when their codes are equal and not
+        NEVER_EQUAL; WILDCARD values are skipped. Work is done on the
+        distinct values only (a categorical's categories), never on the
+        individual cells.
+        """
+        left_codes, left_text = distinct_text(left_values)
+        right_codes, right_text = distinct_text(right_values)
+        codes, uniques = pd.factorize(pd.concat([left_text, right_text], ignore_index=True))
+        uniques = pd.Series(uniques)
+
+        unique_codes = np.empty(len(uniques), dtype=np.int64)
+        regular = np.ones(len(uniques), dtype=bool)
+        if self.blanks != "compare":
+            blank = uniques.str.lower().isin(self.blank_values).to_numpy(dtype=bool)
+            unique_codes[blank] = WILDCARD if self.blanks == "skip" else NEVER_EQUAL
+            regular = ~blank
+        unique_codes[regular] = COMPARATORS[self.kind](uniques[regular])
+
+        encoded = unique_codes[codes]
+        return encoded[:len(left_text)][left_codes], encoded[len(left_text):][right_codes]
+
+
+def _pair_mismatches(left_codes, right_codes):
+    active = (left_codes != WILDCARD) & (right_codes != WILDCARD)
+    return active & ((left_codes != right_codes) | (left_codes == NEVER_EQUAL) | (right_codes == NEVER_EQUAL))
+
+
+def _candidate_groups(left_codes, right_codes):
+    # For every left row, locate the block of right rows sharing its key
+    # code, keeping the right rows in their original order within each block.
+    order = np.argsort(right_codes, kind="stable")
+    sorted_codes = right_codes[order]
+    starts = np.searchsorted(sorted_codes, left_codes, side="left")
+    counts = np.searchsorted(sorted_codes, left_codes, side="right") - starts
+    return order, starts, counts
+
+
+def _reason_strings(mismatch_matrix, column_names):
+    # Label each distinct mismatch pattern once instead of once per row.
+    if mismatch_matrix.size == 0:
+        return np.full(len(mismatch_matrix), "Mismatch", dtype=object)
+    if mismatch_matrix.shape[1] <= 64:
+        bits = np.zeros(len(mismatch_matrix), dtype=np.uint64)
+        for j in range(mismatch_matrix.shape[1]):
+            bits |= mismatch_matrix[:, j].astype(np.uint64) << np.uint64(j)
+        inverse, pattern_bits = pd.factorize(bits)
+        patterns = [[(int(b) >> j) & 1 for j in range(len(column_names))] for b in pattern_bits]
+    else:
+        patterns, inverse = np.unique(mismatch_matrix, axis=0, return_inverse=True)
+    labels = np.array(
+        [", ".join(name for name, bad in zip(column_names, pattern) if bad) or "Mismatch"
+         for pattern in patterns],
+        dtype=object,
+    )
+    return labels[np.ravel(inverse)]
+
+
+def find_unmatched_rows(
+    left,
+    right,
+    column_mapping,
+    left_key,
+    right_key,
+    numeric=True,
+    skip_blanks=True,
+    missing="skip",
+    not_found_reason="Customer not found",
+    reason_column="Mismatch Reason",
+    comparators=None,
+    key_comparator=None,
+):
+    """Return the rows of `left` that no row of `right` with the same key matches.
+
+    A left row passes when any right row for the same key agrees on every
+    mapped column. Failing rows carry the mismatching columns of the first
+    candidate right row, or `not_found_reason` when the key is absent.
+    Columns are compared by `comparators` ({left column: Comparator}),
+    by default numerically if `numeric` and skipping blanks if
+    `skip_blanks`; keys by `key_comparator` (default: exact).
+    """
+    default = Comparator("numeric" if numeric else "exact", "skip" if skip_blanks else "compare")
+    comparators = comparators or {}
+    pairs = []
+    for left_col, right_col in column_mapping.items():
+        if left_col in left.columns and right_col in right.columns:
+            pairs.append((left_col, left[left_col], right[right_col]))
+        elif missing == "blank":
+            pairs.append((left_col, _column_or_blank(left, left_col), _column_or_blank(right, right_col)))
+
+    column_names = [name for name, _, _ in pairs]
+    left_codes = np.empty((len(pairs), len(left)), dtype=np.int64)
+    right_codes = np.empty((len(pairs), len(right)), dtype=np.int64)
+    for j, (name, left_values, right_values) in enumerate(pairs):
+        left_codes[j], right_codes[j] = comparators.get(name, default).encode(left_values, right_values)
+
+    left_keys, right_keys = (key_comparator or Comparator()).encode(left[left_key], right[right_key])
+    order, starts, counts = _candidate_groups(left_keys, right_keys)
+
+    found = np.zeros(len(left), dtype=bool)
+    first_mismatch = np.zeros((len(left), len(pairs)), dtype=bool)
+    pair_ends = np.cumsum(counts)
+    chunk_start = 0
+    while chunk_start < len(left):
+        # Grow the chunk until it holds MAX_PAIRS_PER_CHUNK candidate pairs
+        # (always at least one left row).
+        offset = pair_ends[chunk_start - 1] if chunk_start else 0
+        chunk_end = int(np.searchsorted(pair_ends, offset + MAX_PAIRS_PER_CHUNK, side="right"))
+        chunk_end = min(max(chunk_end, chunk_start + 1), len(left))
+
+        rows = np.arange(chunk_start, chunk_end)
+        row_counts = counts[rows]
+        has_candidates = row_counts > 0
+        pair_rows = np.repeat(rows, row_counts)
+        group_offsets = np.cumsum(row_counts) - row_counts
+        within = np.arange(len(pair_rows)) - np.repeat(group_offsets, row_counts)
+        pair_right = order[np.repeat(starts[rows], row_counts) + within]
+
+        mismatches = np.zeros((len(pair_rows), len(pairs)), dtype=bool)
+        for j in range(len(pairs)):
+            mismatches[:, j] = _pair_mismatches(left_codes[j][pair_rows], right_codes[j][pair_right])
+
+        if len(pair_rows):
+            pair_ok = (~mismatches.any(axis=1)).astype(np.int8)
+            group_heads = group_offsets[has_candidates]
+            found[rows[has_candidates]] = np.maximum.reduceat(pair_ok, group_heads).astype(bool)
+            first_mismatch[rows[has_candidates]] = mismatches[group_heads]
+        chunk_start = chunk_end
+
+    failed = np.flatnonzero(~found)
+    reasons = _reason_strings(first_mismatch[failed], column_names)
+    reasons[counts[failed] == 0] = not_found_reason
+    return _unmatched_frame(left, failed, reasons, reason_column)
+
+
+def _unmatched_frame(frame, failed, reasons, reason_column):
+    if len(failed) == 0:
+        return pd.DataFrame()
+    result = frame.iloc[failed].copy()
+    result[reason_column] = reasons
+    result.index = range(1, len(result) + 1)
+    return result
+
+
+def _column_or_blank(frame, column):
+    if column in frame.columns:
+        return frame[column]
+    return pd.Series("", index=frame.index)
+
+
+def _shared_codes(left_values, right_values):
+    codes, _ = pd.factorize(pd.concat([left_values, right_values], ignore_index=True))
+    return codes[:len(left_values)], codes[len(left_values):]
+
+
+def right_only_rows(left, right, left_key, right_key, key_comparator=None):
+    """Return the rows of `right` whose key has no row in `left`."""
+    left_keys, right_keys = (key_comparator or Comparator()).encode(left[left_key], right[right_key])
+    result = right[~np.isin(right_keys, left_keys)]
+    result.index = range(1, len(result) + 1)
+    return result
+
+
+def _first_rows(keys, n_keys):
+    # Position of the first row for every key code, -1 where the key is absent.
+    first = np.full(n_keys, -1, dtype=np.int64)
+    first[keys[::-1]] = np.arange(len(keys) - 1, -1, -1)
+    return first
+
+
+def reconcile(
+    left,
+    right,
+    column_mapping,
+    left_key,
+    right_key,
+    not_found_reason="Customer Not Found",
+    reason_column="Mismatch Columns",
+    comparators=None,
+    key_comparator=None,
+):
+    """Return (left-only, right-only) rows under strict equality of the mapped columns.
+
+    Both sides are reduced to one key tuple over the mapped columns (missing
+    columns read as blank), so a row is matched exactly when the other side
+    holds the same tuple. Unmatched rows are labelled with the columns that
+    differ from the first row on the other side for the same key, named by
+    their left-hand column, or with `not_found_reason`. Columns and keys
+    are compared by `comparators` ({left column: Comparator}) and
+    `key_comparator`, exactly by default; blanks cannot be skipped here.
+    """
+    comparators = comparators or {}
+    if any(comparator.blanks == "skip" for comparator in comparators.values()):
+        raise ValueError("Blanks cannot be skipped when both sides must match row for row")
+    column_names = list(column_mapping)
+    left_key_codes, right_key_codes = (key_comparator or Comparator()).encode(left[left_key], right[right_key])
+    n_keys = max(left_key_codes.max(initial=-1), right_key_codes.max(initial=-1)) + 1
+
+    left_codes, right_codes = [], []
+    left_tuple, right_tuple = left_key_codes, right_key_codes
+    for left_col, right_col in column_mapping.items():
+        left_col_codes, right_col_codes = comparators.get(left_col, Comparator()).encode(
+            _column_or_blank(left, left_col), _column_or_blank(right, right_col)
+        )
+        left_codes.append(left_col_codes)
+        right_codes.append(right_col_codes)
+        # Fold this column into the running tuple code; both factors stay
+        # below the row count, so the product cannot overflow. Values that
+        # never compare equal get a code of their own per side.
+        width = max(left_col_codes.max(initial=-1), right_col_codes.max(initial=-1)) + 1
+        left_col_codes = np.where(left_col_codes == NEVER_EQUAL, width, left_col_codes)
+        right_col_codes = np.where(right_col_codes == NEVER_EQUAL, width + 1, right_col_codes)
+        left_tuple, right_tuple = _shared_codes(
+            pd.Series(left_tuple * (width + 2) + left_col_codes), pd.Series(right_tuple * (width + 2) + right_col_codes)
+        )
+
+    n_tuples = max(left_tuple.max(initial=-1), right_tuple.max(initial=-1)) + 1
+    left_found = np.bincount(right_tuple, minlength=n_tuples)[left_tuple] > 0
+    right_found = np.bincount(left_tuple, minlength=n_tuples)[right_tuple] > 0
+
+    results = []
+    for found, own_keys, own_codes, other_keys, other_codes, frame in (
+        (left_found, left_key_codes, left_codes, right_key_codes, right_codes, left),
+        (right_found, right_key_codes, right_codes, left_key_codes, left_codes, right),
+    ):
+        failed = np.flatnonzero(~found)
+        first_other = _first_rows(other_keys, n_keys)[own_keys[failed]]
+        has_key = first_other >= 0
+        mismatches = np.zeros((len(failed), len(column_names)), dtype=bool)
+        for j in range(len(column_names)):
+            mismatches[has_key, j] = _pair_mismatches(own_codes[j][failed[has_key]], other_codes[j][first_other[has_key]])
+        reasons = _reason_strings(mismatches, column_names)
+        reasons[~has_key] = not_found_reason
+        results.append(_unmatched_frame(frame, failed, reasons, reason_column))
+    return tuple(results)
@@ -0,0 +1,100 @@
+"""Text normalisation of the columns the validations compare.
+
+Compared values are turned into text with whitespace runs (including
+NBSP) collapsed to one space and the ends stripped, in a single regex
+pass. Columns that are never compared keep their native dtypes for
+display and export, which is where most of the time used to go on wide
+SAP tables. With `compact`, customer IDs and repetitive compared columns
+are kept as categoricals (see encoding.py).
+"""
+import time
+
+import pandas as pd
+
+from encoding import is_categorical, is_customer_id, to_categorical
+
+WHITESPACE = r"[\s\xa0]+"
+
+# Columns whose sample has at most this share of distinct values are
+# normalised once per distinct value instead of once per row.
+REPEAT_RATIO = 0.5
+SAMPLE_SIZE = 10_000
+
+
+def _as_text(series):
+    text = series.astype(str)
+    missing = series.isna()
+    if missing.any():
+        text = text.mask(missing, "")
+    return text
+
+
+def _collapse(text):
+    return text.str.replace(WHITESPACE, " ", regex=True).str.strip()
+
+
+def normalize_series(series, compact=False):
+    # With `compact` a repetitive column comes back as a categorical
+    text = _as_text(series)
+    sample = text.iloc[:SAMPLE_SIZE]
+    if len(sample) and sample.nunique() <= REPEAT_RATIO * len(sample):
+        codes, uniques = pd.factorize(text)
+        collapsed = _collapse(pd.Series(uniques, dtype=text.dtype))
+        if compact:
+            return to_categorical(codes, collapsed, series.index)
+        return collapsed.take(codes).set_axis(series.index)
+    return _collapse(text)
+
+
+def _select(df, columns):
+    if columns is None:
+        return list(df.columns)
+    wanted = {str(col).strip().lower() for col in columns}
+    return [col for col in df.columns if str(col).strip().lower() in wanted]
+
+
+def normalize_text_columns(df, columns=None, compact=False):
+    """Return df with `columns` (default: all) normalised to text; the rest untouched.
+
+    Column names are matched case-insensitively, like find_column. With
+    `compact`, customer ID columns and repetitive ones are categoricals.
+    """
+    df = df.copy(deep=False)
+    for col in _select(df, columns):
+        df[col] = normalize_series(df[col], compact=compact)
+        if compact and is_customer_id(col) and not is_categorical(df[col]):
+            codes, uniques = pd.factorize(df[col])
+            df[col] = to_categorical(codes, uniques, df.index)
+    return df
+
+
+def clean_all_text_columns(df):
+    return normalize_text_columns(df)
+
+
+def _frame_bytes(df):
+    return int(df.memory_usage(deep=True, index=False).sum())
+
+
+def normalization_savings(df, columns):
+    """Time and memory of normalising only `columns` versus every column of df.
+
+    compact_bytes is the selective normalisation kept as categoricals.
+    """
+    start = time.perf_counter()
+    full = clean_all_text_columns(df)
+    full_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    selective = normalize_text_columns(df, columns)
+    selective_seconds = time.perf_counter() - start
+
+    return {
+        "columns": len(df.columns),
+        "normalized_columns": len(_select(df, columns)),
+        "full_seconds": full_seconds,
+        "selective_seconds": selective_seconds,
+        "full_bytes": _frame_bytes(full),
+        "selective_bytes": _frame_bytes(selective),
+        "compact_bytes": _frame_bytes(normalize_text_columns(df, columns, compact=True)),
+    }
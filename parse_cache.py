@@ -0,0 +1,81 @@
+import hashlib
+import threading
+from collections import OrderedDict
+from io import BytesIO
+
+DEFAULT_MAX_BYTES = 1 << 30
+
+
+def _content(source):
+    # Raw bytes of an upload, a path or an in-memory buffer
+    if hasattr(source, "getvalue"):
+        return source.getvalue()
+    if isinstance(source, (bytes, bytearray)):
+        return bytes(source)
+    with open(source, "rb") as f:
+        return f.read()
+
+
+def _frame_bytes(df):
+    return int(df.memory_usage(deep=True, index=True).sum())
+
+
+class ParseCache:
+    """Cleaned DataFrames keyed by file content hash, reader and parse options.
+
+    Entries are evicted least-recently-used first once their total in-memory
+    size passes `max_bytes`. Safe to share between Streamlit sessions.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.size_bytes = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def load(self, source, reader, **options):
+        """Return reader(source, **options), parsing only on a cache miss."""
+        data = _content(source)
+        key = (
+            hashlib.sha256(data).hexdigest(),
+            f"{reader.__module__}.{reader.__qualname__}",
+            tuple(sorted((name, tuple(value) if isinstance(value, list) else value) for name, value in options.items())),
+        )
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key][0].copy(deep=False)
+            self.misses += 1
+
+        df = reader(BytesIO(data), **options)
+        size = _frame_bytes(df)
+        with self._lock:
+            if size <= self.max_bytes and key not in self._entries:
+                self._entries[key] = (df, size)
+                self.size_bytes += size
+                while self.size_bytes > self.max_bytes:
+                    _, (_, evicted_size) = self._entries.popitem(last=False)
+                    self.size_bytes -= evicted_size
+                    self.evictions += 1
+        return df.copy(deep=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.size_bytes = 0
+
+    def stats(self):
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._entries),
+            "size_bytes": self.size_bytes,
+        }
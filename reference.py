@@ -0,0 +1,260 @@
+"""The original row-by-row validations, kept as the correctness oracle.
+
+These are the loops the app ran before the checks were vectorised,
+unchanged apart from taking cleaned frames and returning results. They
+are slow (quadratic per customer) and meant for benchmark.py to check
+the current implementation on small inputs, not for real runs.
+
+reference_read parses and cleans an input the way the original app did
+(pd.read_excel and clean_all_text_columns), so the oracle shares none of
+the current readers, type handling or encodings.
+"""
+from io import BytesIO
+
+import pandas as pd
+
+from validations import KNVP_COMPARISON_COLUMNS, MACE_COLUMN_MAPPING, MACE_PARTNER_COLUMN_MAPPING, find_column
+
+# Inputs read in the SAP export layout by the original app
+SAP_INPUTS = {"kna1", "knvv", "knvp"}
+
+
+def clean_all_text_columns(df):
+    df = df.fillna('').replace({pd.NA: ''})
+    for col in df.columns:
+        df[col] = df[col].astype(str).str.replace(r"\s+", " ", regex=True).str.replace("\xa0", " ", regex=True).str.strip()
+    return df
+
+
+def reference_read(source, name):
+    """Read and clean input `name` as the original app did.
+
+    The original read Excel workbooks only; CSV files are read as text and
+    Parquet files as stored, then cleaned the same way.
+    """
+    if str(source).endswith(".csv"):
+        df = pd.read_csv(source, dtype=str, keep_default_na=False)
+    elif str(source).endswith(".parquet"):
+        df = pd.read_parquet(source)
+    elif name in SAP_INPUTS:
+        df = pd.read_excel(source, header=4, skiprows=[5])
+    else:
+        df = pd.read_excel(source)
+    if name in SAP_INPUTS:
+        df.columns = df.columns.str.strip()
+        df = df.loc[:, ~df.columns.str.contains('^Unnamed', case=False) & (df.columns.str.strip() != '')]
+    elif name == "mace_partner":
+        df.columns = df.columns.str.strip()
+    return clean_all_text_columns(df)
+
+
+def reference_merged_workbook(merged_df):
+    # The merge as the original app's download wrote it and Tab 2 read it back
+    output = BytesIO()
+    with pd.ExcelWriter(output, engine='openpyxl') as writer:
+        merged_df.to_excel(writer, index=False)
+    output.seek(0)
+    return reference_read(output, "merged")
+
+
+def reference_kna1_knvv(df_kna1, df_knvv):
+    customer_col_kna1 = find_column(df_kna1, "Customer")
+    customer_col_knvv = find_column(df_knvv, "Customer")
+
+    df_kna1_clean = df_kna1[df_kna1[customer_col_kna1] != '']
+    df_knvv_clean = df_knvv[df_knvv[customer_col_knvv] != '']
+
+    kna1_customers = set(df_kna1_clean[customer_col_kna1])
+    knvv_customers = set(df_knvv_clean[customer_col_knvv])
+
+    df_diff1 = df_kna1_clean[df_kna1_clean[customer_col_kna1].isin(kna1_customers - knvv_customers)]
+    df_diff2 = df_knvv_clean[df_knvv_clean[customer_col_knvv].isin(knvv_customers - kna1_customers)]
+    df_diff1.index = range(1, len(df_diff1) + 1)
+    df_diff2.index = range(1, len(df_diff2) + 1)
+
+    merged_df = pd.merge(
+        df_kna1_clean,
+        df_knvv_clean,
+        how="left",
+        left_on=customer_col_kna1,
+        right_on=customer_col_knvv,
+        suffixes=('', '_KNVV')
+    )
+    merged_df = merged_df.drop(columns=[col for col in merged_df.columns if col.endswith('_KNVV')])
+    merged_df.index = range(1, len(merged_df) + 1)
+    return df_diff1, df_diff2, merged_df
+
+
+def reference_merged_mace(df_merged, df_mace):
+    merged_not_in_mace = []
+    mismatch_reason = []
+    mace_customers = set(df_mace["CUSTOMER_NATURAL_ID"].astype(str).str.strip())
+    merged_customers = df_merged["Customer"].astype(str).str.strip()
+
+    for idx, row in df_merged.iterrows():
+        cust_id = str(row.get("Customer", "")).strip()
+
+        if cust_id not in mace_customers:
+            merged_not_in_mace.append(row)
+            mismatch_reason.append("Customer not found in MACE")
+            continue
+
+        matching_mace_rows = df_mace[df_mace["CUSTOMER_NATURAL_ID"] == cust_id]
+        found_match = False
+        mismatch_cols = []
+
+        for _, mace_row in matching_mace_rows.iterrows():
+            current_mismatch = []
+
+            for m_col, mace_col in MACE_COLUMN_MAPPING.items():
+                if m_col not in row or mace_col not in mace_row:
+                    continue
+
+                val_merged = str(row[m_col]).strip()
+                val_mace = str(mace_row[mace_col]).strip()
+
+                if (
+                    val_merged == ""
+                    or val_mace == ""
+                    or val_merged.lower() == "not found"
+                    or val_mace.lower() == "not found"
+                ):
+                    continue
+
+                try:
+                    if float(val_merged) != float(val_mace):
+                        current_mismatch.append(m_col)
+                except:
+                    if val_merged != val_mace:
+                        current_mismatch.append(m_col)
+
+            if not current_mismatch:
+                found_match = True
+                break
+
+            if not mismatch_cols:
+                mismatch_cols = current_mismatch
+
+        if not found_match:
+            merged_not_in_mace.append(row)
+            mismatch_reason.append(", ".join(mismatch_cols) if mismatch_cols else "Mismatch")
+
+    df_not_in_mace = pd.DataFrame(merged_not_in_mace)
+    if not df_not_in_mace.empty:
+        df_not_in_mace["Mismatch Reason"] = mismatch_reason
+        df_not_in_mace.index = range(1, len(df_not_in_mace) + 1)
+
+    mace_customers_set = set(df_mace["CUSTOMER_NATURAL_ID"].astype(str).str.strip())
+    merged_customers_set = set(merged_customers)
+    df_not_in_merged = df_mace[df_mace["CUSTOMER_NATURAL_ID"].isin(mace_customers_set - merged_customers_set)]
+    df_not_in_merged.index = range(1, len(df_not_in_merged) + 1)
+    return df_not_in_mace, df_not_in_merged
+
+
+def reference_knvv_knvp(df_knvv, df_knvp):
+    customer_col_knvv = find_column(df_knvv, "Customer")
+    customer_col_knvp = find_column(df_knvp, "Customer")
+
+    df_knvv_clean = df_knvv[df_knvv[customer_col_knvv] != '']
+    df_knvp_clean = df_knvp[df_knvp[customer_col_knvp] != '']
+
+    mismatched_rows = []
+    reasons = []
+    knvp_grouped = df_knvp_clean.groupby(customer_col_knvp)
+
+    for idx, row in df_knvv_clean.iterrows():
+        cust_id = str(row[customer_col_knvv]).strip()
+        found_match = False
+        mismatch_fields = []
+
+        if cust_id in knvp_grouped.groups:
+            knvp_matches = knvp_grouped.get_group(cust_id)
+
+            for _, knvp_row in knvp_matches.iterrows():
+                mismatches = []
+                for col in KNVP_COMPARISON_COLUMNS:
+                    if col in row and col in knvp_row:
+                        val_knvv = str(row[col]).strip()
+                        val_knvp = str(knvp_row[col]).strip()
+                        if val_knvv != val_knvp:
+                            mismatches.append(col)
+
+                if not mismatches:
+                    found_match = True
+                    break
+
+                if not mismatch_fields:
+                    mismatch_fields = mismatches
+
+        else:
+            mismatch_fields = ["Customer not found in KNVP"]
+
+        if not found_match:
+            mismatched_rows.append(row)
+            reasons.append(", ".join(mismatch_fields))
+
+    df_mismatches = pd.DataFrame(mismatched_rows)
+    if not df_mismatches.empty:
+        df_mismatches["Mismatch Reason"] = reasons
+        df_mismatches.index = range(1, len(df_mismatches) + 1)
+    return df_mismatches
+
+
+def _partner_mismatches(df_own, other_grouped, own_key, own_is_knvp):
+    mismatches = []
+    for idx, row in df_own.iterrows():
+        cust_id = str(row.get(own_key, "")).strip()
+        found_match = False
+        mismatched_cols = []
+
+        if cust_id in other_grouped.groups:
+            for _, other_row in other_grouped.get_group(cust_id).iterrows():
+                knvp_row, mace_row = (row, other_row) if own_is_knvp else (other_row, row)
+                mismatched_cols_tmp = []
+                for knvp_col, mace_col in MACE_PARTNER_COLUMN_MAPPING.items():
+                    val_knvp = str(knvp_row.get(knvp_col, "")).strip()
+                    val_mace = str(mace_row.get(mace_col, "")).strip()
+                    if val_knvp != val_mace:
+                        mismatched_cols_tmp.append(knvp_col)
+
+                if not mismatched_cols_tmp:
+                    found_match = True
+                    break
+                else:
+                    if not mismatched_cols:
+                        mismatched_cols = mismatched_cols_tmp
+        else:
+            mismatched_cols = ["Customer Not Found"]
+
+        if not found_match:
+            mismatch_row = row.copy()
+            mismatch_row["Mismatch Columns"] = ", ".join(mismatched_cols)
+            mismatches.append(mismatch_row)
+
+    df = pd.DataFrame(mismatches)
+    if not df.empty:
+        df.index = range(1, len(df) + 1)
+    return df
+
+
+def reference_knvp_mace_partner(df_knvp, df_mace):
+    # The original ran the same loop twice, once from each side
+    mace_grouped = df_mace.groupby("CUSTOMER_NATURAL_ID")
+    knvp_grouped = df_knvp.groupby("Customer")
+    return (
+        _partner_mismatches(df_knvp, mace_grouped, "Customer", own_is_knvp=True),
+        _partner_mismatches(df_mace, knvp_grouped, "CUSTOMER_NATURAL_ID", own_is_knvp=False),
+    )
+
+
+def reference(check, *frames):
+    """Run one check the original way; returns a tuple of frames like validations.compare."""
+    if check == "kna1-knvv":
+        return reference_kna1_knvv(*frames)
+    if check == "merged-mace":
+        return reference_merged_mace(*frames)
+    if check == "knvv-knvp":
+        return (reference_knvv_knvp(*frames),)
+    if check == "knvp-mace-partner":
+        return reference_knvp_mace_partner(*frames)
+    raise ValueError(f"Unknown check '{check}'")
@@ -0,0 +1,105 @@
+"""Server-side summaries, filtering, sorting and paging of result frames.
+
+The app shows counts first and then a single page of rows, so what goes
+to the browser stays small however many rows a check returns. Everything
+here is plain pandas and works on any result frame; results kept in a
+database (sql_backend.SqlTable) are counted, filtered and paged there.
+"""
+import math
+
+import pandas as pd
+
+from validations import MACE_COLUMN_MAPPING, MACE_PARTNER_COLUMN_MAPPING
+
+# Summary dimensions and the column names they go by in the result frames
+SUMMARY_DIMENSIONS = {
+    "Mismatch reason": ["Mismatch Reason", "Mismatch Columns"],
+    "Sales org": ["Sales Org.", MACE_COLUMN_MAPPING["Sales Org."], MACE_PARTNER_COLUMN_MAPPING["Sales Org."]],
+    "Division": ["Division", MACE_COLUMN_MAPPING["Division"], MACE_PARTNER_COLUMN_MAPPING["Division"]],
+}
+
+# Mismatch reasons list the differing columns joined by this
+REASON_SEPARATOR = ", "
+
+PAGE_SIZES = [50, 100, 500, 1000]
+
+
+def _in_database(df):
+    # A sql_backend.SqlTable, without importing it (duckdb is optional)
+    return hasattr(df, "chunks")
+
+
+def _dimension_column(df, names):
+    by_name = {str(col).strip().lower(): col for col in df.columns}
+    for name in names:
+        if name.lower() in by_name:
+            return by_name[name.lower()]
+    return None
+
+
+def summarize(df):
+    """Row counts per mismatch reason, sales org and division, where df has them.
+
+    Returns {dimension: DataFrame of value and Rows, largest first}. Each
+    column named in a mismatch reason is counted on its own.
+    """
+    summary = {}
+    for label, names in SUMMARY_DIMENSIONS.items():
+        col = _dimension_column(df, names)
+        if col is None:
+            continue
+        if _in_database(df):
+            counts = df.value_counts(col)
+        else:
+            counts = df[col].astype(str).where(df[col].notna(), "").value_counts()
+        if label == "Mismatch reason":
+            # Split the few distinct reason strings, not every row
+            totals = {}
+            for value, rows in counts.items():
+                for reason in value.split(REASON_SEPARATOR):
+                    totals[reason] = totals.get(reason, 0) + rows
+            counts = pd.Series(totals, dtype="int64").sort_values(ascending=False, kind="stable")
+        counts = counts.rename(index={"": "(blank)"})
+        summary[label] = counts.rename_axis(label).reset_index(name="Rows")
+    return summary
+
+
+def filter_rows(df, text, column=None):
+    # Case-insensitive substring match on one column, or on any column
+    text = text.strip()
+    if not text or df.empty:
+        return df
+    columns = [column] if column is not None else list(df.columns)
+    mask = pd.Series(False, index=df.index)
+    for col in columns:
+        mask |= df[col].astype(str).str.contains(text, case=False, regex=False, na=False)
+    return df[mask]
+
+
+def sort_rows(df, column, ascending=True):
+    if column is None or df.empty:
+        return df
+    try:
+        return df.sort_values(column, ascending=ascending, kind="stable", na_position="last")
+    except TypeError:
+        # Mixed numbers and text: order as text
+        return df.sort_values(column, ascending=ascending, kind="stable", na_position="last", key=lambda s: s.astype(str))
+
+
+def page_count(rows, page_size):
+    return max(1, math.ceil(rows / page_size))
+
+
+def query(df, text="", filter_column=None, sort_column=None, ascending=True, page=1, page_size=100):
+    """Filter, sort and cut out one page of df.
+
+    Returns (page rows, number of rows matching the filter). `page` starts
+    at 1 and is clamped to the last page.
+    """
+    if _in_database(df):
+        return df.query(text, filter_column, sort_column, ascending, page, page_size)
+    rows = filter_rows(df, text, filter_column)
+    rows = sort_rows(rows, sort_column, ascending)
+    page = min(max(1, page), page_count(len(rows), page_size))
+    start = (page - 1) * page_size
+    return rows.iloc[start:start + page_size], len(rows)
@@ -0,0 +1,291 @@
+"""Rule sets: which columns of two inputs a check compares, and how.
+
+A rule set names a left and a right input, the customer key column on
+each side and the mapped column pairs. Every pair has a comparator:
+
+    exact               the text as read, stripped
+    numeric             equal as numbers where both sides parse as one
+    case-insensitive    the text case-folded
+    trim-leading-zeros  "000123" equals "123"
+
+and a blank policy for blank and "Not Found" values: "skip" (they match
+anything), "compare" (they are values like any other) or "mismatch"
+(they never match). Rows are matched in one of two modes:
+
+    any   a left row passes when any right row of its customer agrees on
+          every column (optionally also listing right rows whose customer
+          is missing on the left)
+    both  every row on either side needs an identical row on the other
+
+Rule sets are compiled once: each column pair gets a matching.Comparator,
+which turns the distinct values of both sides into shared integer codes
+(numbers are parsed up front, per distinct value), so rows are compared
+as integer arrays whatever the rule says. The built-in checks are rule
+sets too (validations.RULE_SETS); others are read from a JSON file:
+
+    {
+      "inputs": {"knb1": "sap"},
+      "rule_sets": {
+        "knb1-mace": {
+          "title": "KNB1 vs MACE",
+          "left": "knb1",
+          "right": "mace",
+          "left_key": "Customer",
+          "right_key": "CUSTOMER_NATURAL_ID",
+          "comparator": "exact",
+          "blanks": "skip",
+          "columns": [
+            {"left": "CoCd", "right": "CUSTOMER_COMPANY_CODE"},
+            {"left": "Recon. acct", "right": "CUSTOMER_RECONCILIATION_ACCOUNT", "comparator": "trim-leading-zeros"}
+          ]
+        }
+      }
+    }
+
+"inputs" gives the layout ("sap" or "plain") of inputs the built-in
+checks do not read; unlisted ones are read as SAP exports. Keys of a
+rule set other than left, right and columns are optional; see
+RuleSet.from_config for the full list. A rule set named after a
+built-in check replaces that check's rules.
+"""
+import json
+
+from encoding import decoded
+from matching import BLANK_VALUES, Comparator, find_unmatched_rows, reconcile, right_only_rows
+
+MODES = ["any", "both"]
+
+# What a mapped column missing from an input does: drop the pair, compare
+# it as blank, or fail the check
+MISSING_COLUMNS = ["skip", "blank", "error"]
+
+LAYOUTS = ["sap", "plain"]
+
+RULE_SET_KEYS = {
+    "title", "left", "right", "left_key", "right_key", "columns", "mode", "comparator", "blanks",
+    "blank_values", "key_comparator", "missing_columns", "skip_blank_keys", "right_only",
+    "not_found_reason", "reason_column", "file_name", "sheets", "labels",
+}
+COLUMN_KEYS = {"left", "right", "comparator", "blanks"}
+
+
+def _find_column(df, target):
+    for col in df.columns:
+        if str(col).lower() == target.lower():
+            return col
+    return None
+
+
+def _column_pairs(name, columns):
+    # {"left": "right"} or [{"left": ..., "right": ..., ...}, ...]
+    if isinstance(columns, dict):
+        return [{"left": left, "right": right} for left, right in columns.items()]
+    if not isinstance(columns, list):
+        raise ValueError(f"Rule set '{name}': 'columns' must be an object or a list")
+    for column in columns:
+        if not isinstance(column, dict) or "left" not in column:
+            raise ValueError(f"Rule set '{name}': every column needs at least a 'left' name")
+        unknown = set(column) - COLUMN_KEYS
+        if unknown:
+            raise ValueError(f"Rule set '{name}': unknown column setting(s) {', '.join(sorted(unknown))}")
+    return columns
+
+
+class RuleSet:
+    """One compiled rule set; `run(left, right)` gives its result frames."""
+
+    def __init__(self, name, left, right, left_key, right_key, columns, comparators, key_comparator,
+                 title=None, mode="any", missing_columns="skip", skip_blank_keys=False, right_only=False,
+                 not_found_reason="Customer not found", reason_column="Mismatch Reason",
+                 file_name=None, sheets=None, labels=None, layouts=None):
+        self.name = name
+        self.title = title or name
+        self.left = left
+        self.right = right
+        self.left_key = left_key
+        self.right_key = right_key
+        self.columns = columns
+        self.comparators = comparators
+        self.key_comparator = key_comparator
+        self.mode = mode
+        self.missing_columns = missing_columns
+        self.skip_blank_keys = skip_blank_keys
+        self.right_only = right_only
+        self.not_found_reason = not_found_reason
+        self.reason_column = reason_column
+        results = 2 if mode == "both" or right_only else 1
+        self.file_name = file_name or f"{name}.xlsx"
+        self.sheets = sheets or [f"{left}_not_in_{right}", f"{right}_not_in_{left}"][:results]
+        self.labels = labels or [f"{left.upper()} rows not matching {right.upper()}",
+                                 f"{right.upper()} rows not matching {left.upper()}"][:results]
+        self.layouts = layouts or {}
+        if len(self.sheets) != results or len(self.labels) != results:
+            raise ValueError(f"Rule set '{name}' gives {results} result(s); 'sheets' and 'labels' need one each")
+
+    @classmethod
+    def from_config(cls, name, config, layouts=None):
+        """Validate one rule set's settings and compile its comparators.
+
+        `config` holds "left" and "right" (input names), "columns" and
+        optionally "title", "left_key" (default "Customer"), "right_key"
+        (default: left_key), "mode", "comparator" and "blanks" (defaults
+        for every column, "exact" and "compare"), "blank_values",
+        "key_comparator", "missing_columns" (default "skip"),
+        "skip_blank_keys", "right_only", "not_found_reason",
+        "reason_column", and the report's "file_name", "sheets" and
+        summary "labels". Each column may set its own "comparator" and
+        "blanks"; its "right" name defaults to its "left" one.
+        """
+        if not isinstance(config, dict):
+            raise ValueError(f"Rule set '{name}' must be an object")
+        unknown = set(config) - RULE_SET_KEYS
+        if unknown:
+            raise ValueError(f"Rule set '{name}': unknown setting(s) {', '.join(sorted(unknown))}")
+        for required in ("left", "right", "columns"):
+            if required not in config:
+                raise ValueError(f"Rule set '{name}' needs '{required}'")
+        mode = config.get("mode", "any")
+        if mode not in MODES:
+            raise ValueError(f"Rule set '{name}': unknown mode '{mode}'; use one of {', '.join(MODES)}")
+        missing_columns = config.get("missing_columns", "skip")
+        if missing_columns not in MISSING_COLUMNS:
+            raise ValueError(f"Rule set '{name}': unknown missing_columns '{missing_columns}'; use one of {', '.join(MISSING_COLUMNS)}")
+        if config.get("right_only") and mode == "both":
+            raise ValueError(f"Rule set '{name}': 'right_only' only applies to mode 'any'")
+
+        blank_values = config.get("blank_values", BLANK_VALUES)
+        columns, comparators = {}, {}
+        try:
+            for column in _column_pairs(name, config["columns"]):
+                left_col, right_col = column["left"], column.get("right", column["left"])
+                if left_col in columns:
+                    raise ValueError(f"column '{left_col}' is mapped twice")
+                columns[left_col] = right_col
+                comparators[left_col] = Comparator(
+                    column.get("comparator", config.get("comparator", "exact")),
+                    column.get("blanks", config.get("blanks", "compare")),
+                    blank_values,
+                )
+                if mode == "both" and comparators[left_col].blanks == "skip":
+                    raise ValueError(f"column '{left_col}' cannot skip blanks in mode 'both'")
+            # Keys are matched by code, so they must compare as plain values
+            key_comparator = Comparator(config.get("key_comparator", "exact"))
+            if key_comparator.kind == "numeric":
+                raise ValueError("customer keys cannot be compared numerically")
+        except ValueError as e:
+            raise ValueError(f"Rule set '{name}': {e}") from None
+        if not columns:
+            raise ValueError(f"Rule set '{name}' maps no columns")
+
+        left_key = config.get("left_key", "Customer")
+        return cls(
+            name,
+            config["left"],
+            config["right"],
+            left_key,
+            config.get("right_key", left_key),
+            columns,
+            comparators,
+            key_comparator,
+            title=config.get("title"),
+            mode=mode,
+            missing_columns=missing_columns,
+            skip_blank_keys=bool(config.get("skip_blank_keys", False)),
+            right_only=bool(config.get("right_only", False)),
+            not_found_reason=config.get("not_found_reason", "Customer not found"),
+            reason_column=config.get("reason_column", "Mismatch Reason"),
+            file_name=config.get("file_name"),
+            sheets=config.get("sheets"),
+            labels=config.get("labels"),
+            layouts={input_name: layouts[input_name] for input_name in (config["left"], config["right"]) if input_name in (layouts or {})},
+        )
+
+    def __repr__(self):
+        return f"RuleSet({self.name!r}, {self.left!r} vs {self.right!r}, mode={self.mode!r})"
+
+    @property
+    def inputs(self):
+        return [self.left, self.right]
+
+    def input_columns(self, input_name):
+        """Columns this rule set reads from `input_name`: key first, then the mapped ones."""
+        columns = []
+        if input_name == self.left:
+            columns += [self.left_key, *self.columns]
+        if input_name == self.right:
+            columns += [self.right_key, *self.columns.values()]
+        return list(dict.fromkeys(columns))
+
+    def key_columns(self, left, right):
+        """The customer key column of each side; anything with `columns` will do."""
+        keys = []
+        for df, key, input_name in ((left, self.left_key, self.left), (right, self.right_key, self.right)):
+            column = _find_column(df, key)
+            if column is None:
+                raise ValueError(f"{input_name} must contain '{key}'")
+            keys.append(column)
+        return tuple(keys)
+
+    def mapping(self, left, right):
+        # The mapped pairs to compare, after the missing_columns policy
+        if self.missing_columns != "skip":
+            missing = [f"{input_name} '{col}'" for input_name, df, cols in ((self.left, left, self.columns),
+                                                                            (self.right, right, self.columns.values()))
+                       for col in cols if col not in df.columns]
+            if missing and self.missing_columns == "error":
+                raise ValueError(f"{self.title}: missing column(s) {', '.join(missing)}")
+            return self.columns
+        return {l: r for l, r in self.columns.items() if l in left.columns and r in right.columns}
+
+    def run(self, left, right):
+        """Compare `left` with `right`; always returns a tuple of frames of plain values."""
+        left_key, right_key = self.key_columns(left, right)
+        if self.skip_blank_keys:
+            left = left[left[left_key] != ""]
+            right = right[right[right_key] != ""]
+        mapping = self.mapping(left, right)
+        comparators = {col: self.comparators[col] for col in mapping}
+
+        if self.mode == "both":
+            results = reconcile(
+                left, right, mapping, left_key, right_key,
+                not_found_reason=self.not_found_reason,
+                reason_column=self.reason_column,
+                comparators=comparators,
+                key_comparator=self.key_comparator,
+            )
+            return tuple(decoded(df) for df in results)
+        unmatched = decoded(find_unmatched_rows(
+            left, right, mapping, left_key, right_key,
+            missing="blank",
+            not_found_reason=self.not_found_reason,
+            reason_column=self.reason_column,
+            comparators=comparators,
+            key_comparator=self.key_comparator,
+        ))
+        if not self.right_only:
+            return (unmatched,)
+        return unmatched, decoded(right_only_rows(left, right, left_key, right_key, self.key_comparator))
+
+
+def parse_rule_sets(config):
+    """Compile every rule set of a parsed rule file, in file order."""
+    if not isinstance(config, dict) or not isinstance(config.get("rule_sets"), dict):
+        raise ValueError("A rule file needs a 'rule_sets' object")
+    layouts = config.get("inputs", {})
+    if not isinstance(layouts, dict) or any(layout not in LAYOUTS for layout in layouts.values()):
+        raise ValueError(f"'inputs' must map input names to a layout: {' or '.join(LAYOUTS)}")
+    return {name: RuleSet.from_config(name, rule_set, layouts) for name, rule_set in config["rule_sets"].items()}
+
+
+def load_rule_sets(source):
+    """Read and compile the rule sets of a JSON rule file (path or binary file object)."""
+    try:
+        if hasattr(source, "read"):
+            config = json.loads(source.read())
+        else:
+            with open(source, encoding="utf-8") as f:
+                config = json.load(f)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"Rule file is not valid JSON: {e}") from None
+    return parse_rule_sets(config)
@@ -0,0 +1,648 @@
+"""Out-of-core execution of the validations in an embedded DuckDB database.
+
+For extracts larger than memory: each input is read a chunk at a time
+(ingest.read_extract_chunks), cleaned exactly as the readers clean it and
+appended to a table in a database file on local disk. The checks then run
+there as set-based SQL, which DuckDB spills to disk when it reaches its
+memory limit, and their results stay in the database as SqlTables that
+are paged back for display and streamed out for export. Rows are matched
+on narrow working tables of keys and compared values only; the other
+columns are joined back by row once the matching rows are known.
+
+The SQL gives the same rows, in the same order, as the pandas checks:
+rule sets (see rules.py) with their comparators, blank policies and both
+modes, and the KNA1 vs KNVV merge in either layout. Comparison is on the
+stripped text the readers produce. Two spellings differ: numbers are
+plain numerals, "inf" and "nan" (other forms float() accepts compare as
+text), and case-insensitive comparison lower-cases instead of case-folds.
+
+    with SqlBackend("validation_db", memory_limit="4GB") as backend:
+        tables = {name: backend.load(name, path) for name, path in paths.items()}
+        results, errors = backend.run_suite(tables)
+        write_report("mace.xlsx", "merged-mace", results["merged-mace"])
+"""
+import math
+import os
+import re
+import tempfile
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+
+from columnar import arrow_safe
+from ingest import read_extract_chunks
+from matching import PLAIN_NUMBER
+from normalize import normalize_text_columns
+from validations import (
+    CHECK_INPUTS,
+    KEY_COLUMNS,
+    MERGE_MODES,
+    NESTED_SEPARATOR,
+    REPORTS,
+    RULE_SETS,
+    SALES_AREA_COLUMN,
+    check_inputs,
+    find_column,
+    input_layout,
+    knvv_merge_columns,
+    text_columns,
+    tidy_columns,
+)
+
+try:
+    import duckdb
+    HAS_DUCKDB = True
+except ImportError:
+    HAS_DUCKDB = False
+
+DATABASE_FILE = "validations.duckdb"
+
+# Position of each row in its input, for joins to keep the pandas order
+ROW_COLUMN = "__sql_row__"
+
+# Column values as the comparators see them, in the checks' queries
+KEY = "__sql_key__"
+
+# Values that never compare equal, one marker per side so they differ
+NEVER_EQUAL = {"left": "\x01left", "right": "\x01right"}
+
+INFINITY = r"(?i)[+-]?inf(inity)?"
+NAN = r"(?i)[+-]?nan"
+
+
+def _identifier(name):
+    return '"' + str(name).replace('"', '""') + '"'
+
+
+def _literal(value):
+    return "'" + str(value).replace("'", "''") + "'"
+
+
+def _table_name(*parts):
+    return re.sub(r"\W", "_", "_".join(parts))
+
+
+def _text(column, alias=None):
+    # A column as the stripped text the comparators see; a missing one is blank
+    if column is None:
+        return "''"
+    qualified = f"{alias}.{_identifier(column)}" if alias else _identifier(column)
+    return f"trim(COALESCE(CAST({qualified} AS VARCHAR), ''))"
+
+
+def _compared(comparator, text, side):
+    """SQL for what `comparator` compares: equal exactly when the values are.
+
+    Skipped blanks are NULL; values that never compare equal get the
+    marker of their side, like the codes of matching.Comparator.encode.
+    """
+    never = _literal(NEVER_EQUAL[side])
+    if comparator.kind == "case-insensitive":
+        value = f"lower({text})"
+    elif comparator.kind == "trim-leading-zeros":
+        value = f"CASE WHEN {text} <> '' AND ltrim({text}, '0') = '' THEN '0' ELSE ltrim({text}, '0') END"
+    elif comparator.kind == "numeric":
+        # Numbers as their shortest round-trip text; 0.0 folds in -0.0
+        number = f"CAST(TRY_CAST({text} AS DOUBLE) + 0.0 AS VARCHAR)"
+        value = (
+            f"CASE WHEN regexp_full_match({text}, {_literal(NAN)}) THEN {never} "
+            f"WHEN regexp_full_match({text}, {_literal(PLAIN_NUMBER)}) OR regexp_full_match({text}, {_literal(INFINITY)}) "
+            f"THEN COALESCE('n' || {number}, 't' || {text}) "
+            f"ELSE 't' || {text} END"
+        )
+    else:
+        value = text
+    if comparator.blanks == "compare":
+        return value
+    blanks = ", ".join(_literal(blank) for blank in comparator.blank_values)
+    return f"CASE WHEN lower({text}) IN ({blanks}) THEN {'NULL' if comparator.blanks == 'skip' else never} ELSE {value} END"
+
+
+def _customers(table, column):
+    # (row, customer) of the rows of `table` with a customer
+    return (
+        f"(SELECT {ROW_COLUMN}, {_identifier(column)} AS customer FROM {_identifier(table.name)} "
+        f"WHERE {_identifier(column)} IS DISTINCT FROM '')"
+    )
+
+
+def _customer_columns(kna1, knvv, merge):
+    # The customer columns of KNA1 and KNVV tables, for a merge in `merge` mode
+    if merge not in MERGE_MODES:
+        raise ValueError(f"Unknown merge '{merge}'; use one of {', '.join(MERGE_MODES)}")
+    columns = find_column(kna1, "Customer"), find_column(knvv, "Customer")
+    for table, column in zip((kna1, knvv), columns):
+        if column is None:
+            raise ValueError(f"{table.name} must contain 'Customer'")
+    return columns
+
+
+def _mismatch(j, left="l", right="r"):
+    # Column j differs between two rows; skipped blanks match anything
+    left_value, right_value = f"{left}.__sql_c{j}__", f"{right}.__sql_c{j}__"
+    return f"({left_value} IS NOT NULL AND {right_value} IS NOT NULL AND {left_value} <> {right_value})"
+
+
+def _reason(column_names, left="l", right="r"):
+    # The differing columns, as matching._reason_strings labels them
+    if not column_names:
+        return _literal("Mismatch")
+    parts = ", ".join(f"CASE WHEN {_mismatch(j, left, right)} THEN {_literal(name)} END" for j, name in enumerate(column_names))
+    return f"COALESCE(NULLIF(concat_ws(', ', {parts}), ''), 'Mismatch')"
+
+
+class SqlTable:
+    """A table of the backend's database, in row order.
+
+    Sized, paged and exported like a result frame: len(), `columns`,
+    `page`, `chunks` and `arrow_batches` read only what is asked for.
+    Rows are numbered from 1, like the index of the pandas results.
+    """
+
+    def __init__(self, backend, name, columns, rows, start=0, stop=None):
+        self.backend = backend
+        self.name = name
+        self._columns = list(columns)
+        self.rows = rows
+        self.start = start
+        self.stop = rows if stop is None else min(stop, rows)
+
+    def __repr__(self):
+        return f"SqlTable({self.name!r}, {len(self)} rows)"
+
+    def __len__(self):
+        return max(self.stop - self.start, 0)
+
+    @property
+    def columns(self):
+        return list(self._columns)
+
+    @property
+    def empty(self):
+        return len(self) == 0 or not self._columns
+
+    def slice(self, start, stop):
+        """Rows start..stop of this table, still in the database."""
+        return SqlTable(self.backend, self.name, self._columns, self.rows, self.start + start, min(self.start + stop, self.stop))
+
+    def _select(self, start, stop, where="", order=""):
+        columns = ", ".join(_identifier(col) for col in self._columns) or "NULL AS __sql_none__"
+        return (
+            f"SELECT {columns}, rowid + 1 AS __sql_position__ FROM {_identifier(self.name)} "
+            f"WHERE rowid >= {start} AND rowid < {stop}{where} {order}"
+        )
+
+    def _frame(self, df):
+        df = df.set_index("__sql_position__")
+        df.index.name = None
+        return df if self._columns else pd.DataFrame(index=df.index)
+
+    def page(self, start, stop):
+        """Rows start..stop (0-based, stop excluded) as a DataFrame."""
+        start, stop = self.start + start, min(self.start + stop, self.stop)
+        return self._frame(self.backend.cursor().execute(self._select(start, stop, order="ORDER BY rowid")).df())
+
+    def head(self, n=5):
+        return self.page(0, n)
+
+    def to_frame(self):
+        return self.page(0, len(self))
+
+    def chunks(self, rows):
+        """The table as DataFrames of up to `rows` rows, in order."""
+        for start in range(0, len(self), rows):
+            yield self.page(start, start + rows)
+
+    def arrow_batches(self, rows):
+        """A pyarrow RecordBatchReader over the table, for streaming to Parquet."""
+        columns = ", ".join(_identifier(col) for col in self._columns)
+        query = f"SELECT {columns} FROM {_identifier(self.name)} WHERE rowid >= {self.start} AND rowid < {self.stop} ORDER BY rowid"
+        return self.backend.cursor().execute(query).to_arrow_reader(rows)
+
+    def value_counts(self, column):
+        """Rows per value of `column` as text, blanks as "", most frequent first."""
+        text = f"COALESCE(CAST({_identifier(column)} AS VARCHAR), '')"
+        counts = self.backend.cursor().execute(
+            f"SELECT {text} AS value, count(*) AS rows FROM {_identifier(self.name)} "
+            f"WHERE rowid >= {self.start} AND rowid < {self.stop} GROUP BY value ORDER BY rows DESC, min(rowid)"
+        ).df()
+        return pd.Series(counts["rows"].to_numpy(), index=pd.Index(counts["value"].astype(str), name=column), name="count")
+
+    def query(self, text="", filter_column=None, sort_column=None, ascending=True, page=1, page_size=100):
+        """results_view.query in the database: (page rows, rows matching the filter)."""
+        where = ""
+        text = text.strip()
+        if text and self._columns:
+            columns = [filter_column] if filter_column is not None else self._columns
+            needle = _literal(text.lower())
+            where = " AND (" + " OR ".join(f"contains(lower(CAST({_identifier(col)} AS VARCHAR)), {needle})" for col in columns) + ")"
+        cursor = self.backend.cursor()
+        matched = cursor.execute(
+            f"SELECT count(*) FROM {_identifier(self.name)} WHERE rowid >= {self.start} AND rowid < {self.stop}{where}"
+        ).fetchone()[0]
+        page = min(max(1, page), max(1, math.ceil(matched / page_size)))
+        order = "ORDER BY " + (f"{_identifier(sort_column)} {'ASC' if ascending else 'DESC'} NULLS LAST, " if sort_column is not None else "") + "rowid"
+        query = self._select(self.start, self.stop, where, order) + f" LIMIT {page_size} OFFSET {(page - 1) * page_size}"
+        return self._frame(cursor.execute(query).df()), matched
+
+
+class SqlBackend:
+    """An on-disk DuckDB database for the inputs and results of the checks.
+
+    `directory` holds the database file and DuckDB's spill files (default:
+    a temporary directory removed on close). `memory_limit` (e.g. "4GB")
+    and `threads` are DuckDB's settings of the same names.
+    """
+
+    def __init__(self, directory=None, memory_limit=None, threads=None):
+        if not HAS_DUCKDB:
+            raise ImportError("The SQL backend needs the duckdb package")
+        self._scratch = None
+        if directory is None:
+            self._scratch = tempfile.TemporaryDirectory(prefix="mace_sql_")
+            directory = self._scratch.name
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.connection = duckdb.connect(os.path.join(directory, DATABASE_FILE))
+        self.connection.execute(f"SET temp_directory = {_literal(os.path.join(directory, 'spill'))}")
+        self.connection.execute("SET preserve_insertion_order = true")
+        if memory_limit:
+            self.connection.execute(f"SET memory_limit = {_literal(memory_limit)}")
+        if threads:
+            self.connection.execute(f"SET threads = {int(threads)}")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+        return False
+
+    def close(self):
+        self.connection.close()
+        if self._scratch is not None:
+            self._scratch.cleanup()
+
+    def cursor(self):
+        # One per query, so pages can be read from other threads
+        return self.connection.cursor()
+
+    def _table(self, name):
+        # The SqlTable over a table of the database, without ROW_COLUMN
+        cursor = self.cursor()
+        columns = [row[0] for row in cursor.execute(f"DESCRIBE {_identifier(name)}").fetchall() if row[0] != ROW_COLUMN]
+        rows = cursor.execute(f"SELECT count(*) FROM {_identifier(name)}").fetchone()[0]
+        return SqlTable(self, name, columns, rows)
+
+    def _create(self, name, query):
+        self.cursor().execute(f"CREATE OR REPLACE TABLE {_identifier(name)} AS {query}")
+        return self._table(name)
+
+    def _drop_work(self, name):
+        # The working tables of one check, once its results are stored
+        cursor = self.cursor()
+        prefix = _table_name("work", name) + "_"
+        for (table,) in cursor.execute("SELECT table_name FROM duckdb_tables() WHERE starts_with(table_name, ?)", [prefix]).fetchall():
+            cursor.execute(f"DROP TABLE {_identifier(table)}")
+
+    def _result(self, name, query, blank_when_empty=False):
+        # A result table; unmatched rows come back as pd.DataFrame() when there are none
+        table = self._create(name, query)
+        if blank_when_empty and not len(table):
+            table._columns = []
+        return table
+
+    def _append(self, cursor, table, chunk, create):
+        # Chunks go in as Arrow; a column whose chunks disagree on type is
+        # widened to one holding both (text if need be) before the insert,
+        # and a column new in this chunk is added, blank in earlier rows
+        cursor.register("chunk", pa.Table.from_pandas(arrow_safe(chunk), preserve_index=False))
+        try:
+            if create:
+                cursor.execute(f"CREATE OR REPLACE TABLE {_identifier(table)} AS SELECT * FROM chunk")
+                return
+            types = {row[0]: row[1] for row in cursor.execute(f"DESCRIBE {_identifier(table)}").fetchall()}
+            widened = cursor.execute(f"DESCRIBE SELECT * FROM {_identifier(table)} UNION ALL BY NAME SELECT * FROM chunk").fetchall()
+            for column, column_type, *_ in widened:
+                if column not in types:
+                    cursor.execute(f"ALTER TABLE {_identifier(table)} ADD COLUMN {_identifier(column)} {column_type}")
+                elif types[column] != column_type:
+                    cursor.execute(f"ALTER TABLE {_identifier(table)} ALTER {_identifier(column)} TYPE {column_type}")
+            cursor.execute(f"INSERT INTO {_identifier(table)} BY NAME SELECT * FROM chunk")
+        finally:
+            cursor.unregister("chunk")
+
+    def load(self, name, source, rule_sets=None, columns=None):
+        """Read, clean and store input `name` (a path or binary file) a chunk at a time.
+
+        Cleaning is that of validations.reader_for(name): the compared
+        columns are normalised to text, the rest keep their types. Only
+        `columns` are read when given.
+        """
+        table = _table_name("input", name)
+        compared = text_columns(name, rule_sets)
+        cursor = self.cursor()
+        rows = 0
+        cursor.execute("BEGIN TRANSACTION")
+        try:
+            for i, chunk in enumerate(read_extract_chunks(source, layout=input_layout(name, rule_sets), columns=columns)):
+                chunk = normalize_text_columns(tidy_columns(chunk, name, rule_sets), compared)
+                chunk[ROW_COLUMN] = np.arange(rows, rows + len(chunk), dtype=np.int64)
+                self._append(cursor, table, chunk, create=i == 0)
+                rows += len(chunk)
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        cursor.execute("COMMIT")
+        return self._table(table)
+
+    def load_frame(self, name, df):
+        """Store a frame already in memory as input `name`."""
+        table = _table_name("input", name)
+        self._append(self.cursor(), table, df.assign(**{ROW_COLUMN: np.arange(len(df), dtype=np.int64)}), create=True)
+        return self._table(table)
+
+    def merged_table(self, merged):
+        """validations.merged_table: the merge as input "merged", blanks from the left join as ''."""
+        compared = {str(col).strip().lower() for col in KEY_COLUMNS["merged"]}
+        columns = ", ".join(
+            f"COALESCE(CAST({_identifier(col)} AS VARCHAR), '') AS {_identifier(col)}" if col.strip().lower() in compared else _identifier(col)
+            for col in merged.columns
+        )
+        return self._create(
+            _table_name("input", "merged"),
+            f"SELECT {columns}, rowid AS {ROW_COLUMN} FROM {_identifier(merged.name)} ORDER BY rowid",
+        )
+
+    def compare_kna1_knvv(self, kna1, knvv, merge="per-sales-area", name="kna1-knvv"):
+        """validations.compare_kna1_knvv on input tables; returns three SqlTables.
+
+        Customers are matched on (row, customer) pairs alone; the other
+        columns are joined back by row into the results.
+        """
+        customer_col_kna1, customer_col_knvv = _customer_columns(kna1, knvv, merge)
+        kna1_customers = _customers(kna1, customer_col_kna1)
+        knvv_customers = _customers(knvv, customer_col_knvv)
+
+        # Customers match as the values they are, missing ones with each other
+        def one_side(table, rows, other):
+            columns = ", ".join(f"t.{_identifier(col)}" for col in table.columns)
+            return (
+                f"SELECT {columns} FROM {_identifier(table.name)} t SEMI JOIN "
+                f"(SELECT a.{ROW_COLUMN} FROM {rows} a ANTI JOIN {other} b ON a.customer IS NOT DISTINCT FROM b.customer) x "
+                f"ON t.{ROW_COLUMN} = x.{ROW_COLUMN} ORDER BY t.{ROW_COLUMN}"
+            )
+
+        df_diff1 = self._result(_table_name("result", name, "0"), one_side(kna1, kna1_customers, knvv_customers))
+        df_diff2 = self._result(_table_name("result", name, "1"), one_side(knvv, knvv_customers, kna1_customers))
+        return df_diff1, df_diff2, self.merge_kna1_knvv(kna1, knvv, merge=merge, name=name)
+
+    def merge_kna1_knvv(self, kna1, knvv, merge="per-sales-area", name="kna1-knvv-merge"):
+        """validations.merge_kna1_knvv on input tables; stored as the third result of check `name`."""
+        customer_col_kna1, customer_col_knvv = _customer_columns(kna1, knvv, merge)
+        kna1_customers = _customers(kna1, customer_col_kna1)
+        knvv_customers = _customers(knvv, customer_col_knvv)
+        kna1_columns = [col for col in kna1.columns if not col.endswith("_KNVV")]
+        knvv_columns = [col for col in knvv_merge_columns(kna1, knvv, customer_col_knvv) if col not in kna1.columns]
+        selected = [f"a.{_identifier(col)}" for col in kna1_columns]
+        try:
+            if merge == "per-sales-area":
+                pairs = self._create(_table_name("work", name, "pairs"), f"""
+                    SELECT a.{ROW_COLUMN} AS kna1_row, b.{ROW_COLUMN} AS knvv_row
+                    FROM {kna1_customers} a LEFT JOIN {knvv_customers} b ON a.customer IS NOT DISTINCT FROM b.customer
+                """)
+                # One side's columns at a time, so a join never holds both
+                with_knvv = self._create(_table_name("work", name, "knvv"), f"""
+                    SELECT p.kna1_row, p.knvv_row{''.join(f', b.{_identifier(col)}' for col in knvv_columns)}
+                    FROM {_identifier(pairs.name)} p LEFT JOIN {_identifier(knvv.name)} b ON b.{ROW_COLUMN} = p.knvv_row
+                """)
+                selected += [f"b.{_identifier(col)}" for col in knvv_columns]
+                query = (
+                    f"SELECT {', '.join(selected)} FROM {_identifier(with_knvv.name)} b "
+                    f"JOIN {_identifier(kna1.name)} a ON a.{ROW_COLUMN} = b.kna1_row "
+                    f"ORDER BY b.kna1_row, b.knvv_row"
+                )
+            else:
+                nested = self._nested(knvv, customer_col_knvv, [col for col in knvv_columns if col != customer_col_knvv], name)
+                selected += [f"b.{_identifier(col)}" for col in knvv_columns if col == customer_col_knvv]
+                selected += [f"COALESCE(b.{_identifier(SALES_AREA_COLUMN)}, 0) AS {_identifier(SALES_AREA_COLUMN)}"]
+                selected += [f"b.{_identifier(col)}" for col in knvv_columns if col != customer_col_knvv]
+                query = (
+                    f"SELECT {', '.join(selected)} FROM {_identifier(kna1.name)} a LEFT JOIN {_identifier(nested.name)} b "
+                    f"ON a.{_identifier(customer_col_kna1)} IS NOT DISTINCT FROM b.{_identifier(customer_col_knvv)} "
+                    f"WHERE a.{_identifier(customer_col_kna1)} IS DISTINCT FROM '' ORDER BY a.{ROW_COLUMN}"
+                )
+            merged_df = self._result(_table_name("result", name, "2"), query)
+        finally:
+            self._drop_work(name)
+        return merged_df
+
+    def _nested(self, knvv, customer_col, columns, name):
+        # One row per customer: its sales areas counted, every other
+        # column's values joined in row order (validations.nest_sales_areas).
+        # Ordered aggregates hold every customer in memory, so each row is
+        # ranked within its customer instead (a sort, which spills) and the
+        # nth sales area of every customer appended in the nth pass.
+        customer = _identifier(customer_col)
+        ranked = self._create(_table_name("work", name, "ranked"), f"""
+            SELECT {customer}, row_number() OVER (PARTITION BY {customer} ORDER BY {ROW_COLUMN}) AS __sql_rank__
+                   {''.join(f', {_text(col)} AS {_identifier(col)}' for col in columns)}
+            FROM {_identifier(knvv.name)} WHERE {customer} IS DISTINCT FROM ''
+        """)
+        nested = self._create(_table_name("work", name, "nested"), f"""
+            SELECT r.{customer}, c.{_identifier(SALES_AREA_COLUMN)}{''.join(f', r.{_identifier(col)}' for col in columns)}
+            FROM {_identifier(ranked.name)} r
+            JOIN (SELECT {customer}, count(*) AS {_identifier(SALES_AREA_COLUMN)} FROM {_identifier(ranked.name)} GROUP BY {customer}) c
+            ON r.{customer} IS NOT DISTINCT FROM c.{customer}
+            WHERE r.__sql_rank__ = 1
+        """)
+        if columns:
+            cursor = self.cursor()
+            most = cursor.execute(f"SELECT COALESCE(max(__sql_rank__), 0) FROM {_identifier(ranked.name)}").fetchone()[0]
+            appended = ", ".join(
+                f"{_identifier(col)} = n.{_identifier(col)} || {_literal(NESTED_SEPARATOR)} || r.{_identifier(col)}" for col in columns
+            )
+            for rank in range(2, most + 1):
+                cursor.execute(
+                    f"UPDATE {_identifier(nested.name)} n SET {appended} FROM {_identifier(ranked.name)} r "
+                    f"WHERE r.__sql_rank__ = {rank} AND r.{customer} IS NOT DISTINCT FROM n.{customer}"
+                )
+        return nested
+
+    def sales_area_fanout(self, kna1, knvv, name="kna1-knvv-fanout"):
+        """validations.sales_area_fanout on input tables."""
+        customer_col_kna1 = _identifier(find_column(kna1, "Customer"))
+        customer_col_knvv = _identifier(find_column(knvv, "Customer"))
+        return self._result(_table_name("result", name), f"""
+            WITH a AS (
+                SELECT {customer_col_kna1} AS customer, count(*) AS kna1_rows, min({ROW_COLUMN}) AS first_row
+                FROM {_identifier(kna1.name)} WHERE {customer_col_kna1} IS DISTINCT FROM '' GROUP BY customer
+            ), b AS (
+                SELECT {customer_col_knvv} AS customer, count(*) AS sales_areas
+                FROM {_identifier(knvv.name)} WHERE {customer_col_knvv} IS DISTINCT FROM '' GROUP BY customer
+            )
+            SELECT a.customer AS "Customer", kna1_rows AS "KNA1 rows", COALESCE(sales_areas, 0) AS {_identifier(SALES_AREA_COLUMN)},
+                   kna1_rows * greatest(COALESCE(sales_areas, 0), 1) AS "Merged rows"
+            FROM a LEFT JOIN b ON a.customer IS NOT DISTINCT FROM b.customer
+            ORDER BY "Merged rows" DESC, first_row
+        """)
+
+    def fanout_summary(self, fanout):
+        """validations.fanout_summary of a sales_area_fanout table."""
+        areas = _identifier(SALES_AREA_COLUMN)
+        customers, merged_rows, most, mean, several, none = self.cursor().execute(f"""
+            SELECT count(*), COALESCE(sum("Merged rows"), 0), COALESCE(max({areas}), 0), COALESCE(avg({areas}), 0),
+                   count(*) FILTER ({areas} > 1), count(*) FILTER ({areas} = 0)
+            FROM {_identifier(fanout.name)}
+        """).fetchone()
+        top = self.cursor().execute(
+            f'SELECT "Customer" FROM {_identifier(fanout.name)} WHERE {areas} = {most} ORDER BY rowid LIMIT 1'
+        ).fetchone()
+        return {
+            "customers": customers,
+            "merged_rows": int(merged_rows),
+            "max_sales_areas": int(most),
+            "max_sales_areas_customer": str(top[0]) if top and customers else None,
+            "mean_sales_areas": round(float(mean), 2),
+            "multi_area_customers": several,
+            "customers_without_sales_area": none,
+        }
+
+    def run_rule_set(self, rule_set, left, right, name=None):
+        """RuleSet.run on input tables; returns a tuple of SqlTables.
+
+        Each side's keys and compared values are stored first as narrow
+        working tables, so the joins that find unmatched rows never carry
+        the other columns; those are joined back by row at the end.
+        """
+        name = name or rule_set.name
+        left_key, right_key = rule_set.key_columns(left, right)
+        mapping = rule_set.mapping(left, right)
+        column_names = list(mapping)
+
+        def compared(table, key, columns, side):
+            values = [f"{_compared(rule_set.key_comparator, _text(key), side)} AS {KEY}"]
+            values += [
+                f"{_compared(rule_set.comparators[left_col], _text(col if col in table.columns else None), side)} AS __sql_c{j}__"
+                for j, (left_col, col) in enumerate(zip(mapping, columns))
+            ]
+            where = f" WHERE {_identifier(key)} IS DISTINCT FROM ''" if rule_set.skip_blank_keys else ""
+            return self._create(
+                _table_name("work", name, side),
+                f"SELECT {ROW_COLUMN}, {', '.join(values)} FROM {_identifier(table.name)}{where}",
+            )
+
+        def first(rows, side):
+            # The first row of each customer, which reasons are given against
+            return self._create(_table_name("work", name, side, "first"), f"""
+                SELECT r.* FROM {_identifier(rows.name)} r
+                SEMI JOIN (SELECT {KEY}, min({ROW_COLUMN}) AS {ROW_COLUMN} FROM {_identifier(rows.name)} GROUP BY {KEY}) f
+                ON r.{KEY} = f.{KEY} AND r.{ROW_COLUMN} = f.{ROW_COLUMN}
+            """)
+
+        def unmatched(result, table, rows, other_rows, other_first, matches):
+            # Rows no row of the other side matches, with the columns that
+            # differ from the first other row of their customer
+            failed = self._create(
+                _table_name("work", name, result),
+                f"SELECT l.* FROM {_identifier(rows.name)} l ANTI JOIN {_identifier(other_rows.name)} r ON l.{KEY} = r.{KEY} AND {matches}",
+            )
+            reason = (
+                f"CASE WHEN o.{ROW_COLUMN} IS NULL THEN {_literal(rule_set.not_found_reason)} "
+                f"ELSE {_reason(column_names, 'l', 'o')} END"
+            )
+            selected = [
+                f"{reason} AS {_identifier(col)}" if col == rule_set.reason_column else f"t.{_identifier(col)}"
+                for col in table.columns
+            ]
+            if rule_set.reason_column not in table.columns:
+                selected.append(f"{reason} AS {_identifier(rule_set.reason_column)}")
+            return self._result(_table_name("result", name, result), f"""
+                SELECT {', '.join(selected)} FROM {_identifier(failed.name)} l
+                JOIN {_identifier(table.name)} t ON t.{ROW_COLUMN} = l.{ROW_COLUMN}
+                LEFT JOIN {_identifier(other_first.name)} o ON l.{KEY} = o.{KEY}
+                ORDER BY l.{ROW_COLUMN}
+            """, blank_when_empty=True)
+
+        try:
+            left_rows = compared(left, left_key, list(mapping), "left")
+            right_rows = compared(right, right_key, list(mapping.values()), "right")
+            if rule_set.mode == "both":
+                # A row needs an identical row on the other side
+                same = " AND ".join(f"l.__sql_c{j}__ = r.__sql_c{j}__" for j in range(len(mapping))) or "true"
+                return (
+                    unmatched("0", left, left_rows, right_rows, first(right_rows, "right"), same),
+                    unmatched("1", right, right_rows, left_rows, first(left_rows, "left"), same),
+                )
+
+            # Any right row of the customer agreeing on every column will do
+            agrees = " AND ".join(f"NOT {_mismatch(j)}" for j in range(len(mapping))) or "true"
+            results = [unmatched("0", left, left_rows, right_rows, first(right_rows, "right"), agrees)]
+            if rule_set.right_only:
+                columns = ", ".join(f"t.{_identifier(col)}" for col in right.columns)
+                results.append(self._result(_table_name("result", name, "1"), f"""
+                    SELECT {columns} FROM {_identifier(right.name)} t
+                    SEMI JOIN (SELECT r.{ROW_COLUMN} FROM {_identifier(right_rows.name)} r
+                               ANTI JOIN {_identifier(left_rows.name)} l ON r.{KEY} = l.{KEY}) x
+                    ON t.{ROW_COLUMN} = x.{ROW_COLUMN}
+                    ORDER BY t.{ROW_COLUMN}
+                """))
+            return tuple(results)
+        finally:
+            self._drop_work(name)
+
+    def compare(self, check, *tables, rule_sets=None, merge="per-sales-area"):
+        """validations.compare on input tables of this database; returns a tuple of SqlTables."""
+        if rule_sets and check in rule_sets:
+            return self.run_rule_set(rule_sets[check], *tables, name=check)
+        if check == "kna1-knvv":
+            return self.compare_kna1_knvv(*tables, merge=merge)
+        if check == "merged-mace" and "CUSTOMER_NATURAL_ID" not in tables[1].columns:
+            raise ValueError("MACE file must contain 'CUSTOMER_NATURAL_ID'")
+        if check in RULE_SETS:
+            return self.run_rule_set(RULE_SETS[check], *tables, name=check)
+        raise ValueError(f"Unknown check '{check}'")
+
+    def run_suite(self, tables, checks=None, rule_sets=None, merge="per-sales-area", on_progress=None):
+        """Run `checks` (default: the built-in ones) one after another on input tables.
+
+        Like suite.run_suite: `tables` maps input names to SqlTables from
+        load, KNA1+KNVV vs MACE uses the KNA1 vs KNVV merge when there is
+        no merged input, and `on_progress(check, done, total)` is called
+        as each check starts and ends. Returns ({check: result tables},
+        {check: exception}).
+        """
+        rule_sets = rule_sets or {}
+        every = [*REPORTS, *(check for check in rule_sets if check not in REPORTS)]
+        checks = [check for check in every if check in (checks or REPORTS)]
+        tables = dict(tables)
+        chained = "merged-mace" in checks and "merged" not in tables
+        if chained and "kna1-knvv" not in checks:
+            raise ValueError("merged-mace needs the merged input or the kna1-knvv check")
+        for check in checks:
+            missing = [name for name in check_inputs(check, rule_sets) if name not in tables and not (name == "merged" and chained)]
+            if missing:
+                raise ValueError(f"{check} needs the {', '.join(missing)} input")
+
+        results, errors = {}, {}
+        for check in checks:
+            if on_progress:
+                on_progress(check, 0, 1)
+            try:
+                if check == "merged-mace" and chained:
+                    if "kna1-knvv" in errors:
+                        raise errors["kna1-knvv"]
+                    merged = results["kna1-knvv"][2]
+                    if merge != "per-sales-area":
+                        # The nested merge cannot feed KNA1+KNVV vs MACE
+                        merged = self.merge_kna1_knvv(tables["kna1"], tables["knvv"], name="merge-per-sales-area")
+                    tables["merged"] = self.merged_table(merged)
+                inputs = [tables[name] for name in (CHECK_INPUTS[check] if check in CHECK_INPUTS else rule_sets[check].inputs)]
+                results[check] = self.compare(check, *inputs, rule_sets=rule_sets, merge=merge)
+            except Exception as e:
+                errors[check] = e
+                continue
+            if on_progress:
+                on_progress(check, 1, 1)
+        return {check: results[check] for check in checks if check in results}, errors
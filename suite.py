@@ -0,0 +1,169 @@
+"""Run the validations side by side in a process pool.
+
+Every check is independent except KNA1+KNVV vs MACE, which may need the
+merge from the KNA1 vs KNVV check and so starts once that is done. Large
+inputs are hash-partitioned by customer ID so one check spreads over all
+cores: a customer's rows on both sides land in the same partition, so
+every partition can be compared on its own. The partial results are put
+back in their original row order, giving the same frames as the serial
+compare_* functions.
+"""
+import math
+import multiprocessing
+import os
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, ThreadPoolExecutor, wait
+
+import numpy as np
+import pandas as pd
+
+from encoding import distinct_text
+from validations import CHECK_INPUTS, REPORTS, compare, find_column, merge_kna1_knvv, merged_table
+
+# Partition inputs so that each part holds about this many rows, up to
+# one part per worker
+PARTITION_ROWS = 100_000
+
+# Customer ID column of each input
+PARTITION_KEYS = {
+    "kna1": "Customer",
+    "knvv": "Customer",
+    "merged": "Customer",
+    "knvp": "Customer",
+    "mace": "CUSTOMER_NATURAL_ID",
+    "mace_partner": "CUSTOMER_NATURAL_ID",
+}
+
+# Position of each row in its input, carried through the comparison
+ROW_COLUMN = "__suite_row__"
+
+
+def partition_count(tables, workers):
+    rows = max((len(df) for df in tables.values()), default=0)
+    return max(1, min(workers, math.ceil(rows / PARTITION_ROWS)))
+
+
+def _numbered(df):
+    df = df.copy(deep=False)
+    df[ROW_COLUMN] = range(len(df))
+    return df
+
+
+def _partition_ids(df, name, n_partitions):
+    key = find_column(df, PARTITION_KEYS[name])
+    if key is None:
+        return None
+    # Keys are compared as stripped text, so equal keys hash alike; each
+    # distinct key is hashed once
+    codes, uniques = distinct_text(df[key])
+    hashes = pd.util.hash_array(np.asarray(uniques, dtype=object))
+    return (hashes % n_partitions).astype(np.int64)[codes]
+
+
+def _take_partitions(df, ids, n_partitions):
+    # Rows of each partition, in their original order
+    order = np.argsort(ids, kind="stable")
+    bounds = np.cumsum(np.bincount(ids, minlength=n_partitions))[:-1]
+    return [df.take(rows) for rows in np.split(order, bounds)]
+
+
+def split_inputs(frames, names, n_partitions):
+    """Cut one check's numbered input frames into per-partition tuples.
+
+    Falls back to a single partition when an input has no customer column,
+    so the check reports the missing column as it would serially.
+    """
+    if n_partitions == 1:
+        return [tuple(frames)]
+    ids = [_partition_ids(df, name, n_partitions) for df, name in zip(frames, names)]
+    if any(part is None for part in ids):
+        return [tuple(frames)]
+    return list(zip(*(_take_partitions(df, part, n_partitions) for df, part in zip(frames, ids))))
+
+
+def combine(parts):
+    """Stitch partial result frames back together in original row order."""
+    frames = [df for df in parts if len(df.columns)]
+    if not frames:
+        return pd.DataFrame()
+    df = pd.concat(frames).sort_values(ROW_COLUMN, kind="stable").drop(columns=ROW_COLUMN)
+    df.index = range(1, len(df) + 1)
+    return df
+
+
+def run_suite(tables, checks=None, partitions=None, workers=None, on_progress=None, merge="per-sales-area"):
+    """Run `checks` (default: all) on the input `tables` in parallel.
+
+    `tables` maps input names, as in validations.CHECK_INPUTS, to frames
+    as the readers return them. Inputs are split into `partitions` parts
+    (default: from the input size and worker count); `merge` is the KNA1
+    vs KNVV merge mode. `on_progress(check, done, total)` is called in
+    this process when a check is queued and as each of its partitions
+    finishes.
+
+    Returns ({check: result frames}, {check: exception}) for the checks
+    that succeeded and those that failed.
+    """
+    checks = [check for check in REPORTS if check in (checks or REPORTS)]
+    workers = workers or os.cpu_count() or 1
+    chained = "merged-mace" in checks and "merged" not in tables
+    if chained and "kna1-knvv" not in checks:
+        raise ValueError("merged-mace needs the merged input or the kna1-knvv check")
+    for check in checks:
+        missing = [name for name in CHECK_INPUTS[check] if name not in tables and not (name == "merged" and chained)]
+        if missing:
+            raise ValueError(f"{check} needs the {', '.join(missing)} input")
+    if chained and merge != "per-sales-area":
+        # KNA1+KNVV vs MACE compares one row per sales area, which the
+        # check's own merge does not give; only that merge is redone
+        tables = {**tables, "merged": merged_table(merge_kna1_knvv(tables["kna1"], tables["knvv"]))}
+        chained = False
+
+    n_partitions = partitions or partition_count(tables, workers)
+    numbered = {name: _numbered(df) for name, df in tables.items()}
+    results, errors, parts, pending = {}, {}, {}, {}
+
+    def progress(check):
+        if on_progress:
+            done = sum(part is not None for part in parts[check])
+            on_progress(check, done, len(parts[check]))
+
+    # A single worker runs in a thread: no process start-up or pickling.
+    # Workers are spawned rather than forked, as the Streamlit server that
+    # starts them runs several threads.
+    if workers > 1:
+        pool = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context("spawn"))
+    else:
+        pool = ThreadPoolExecutor(max_workers=1)
+    with pool:
+        def submit(check, frames):
+            split = split_inputs(frames, CHECK_INPUTS[check], n_partitions)
+            parts[check] = [None] * len(split)
+            for i, part in enumerate(split):
+                pending[pool.submit(compare, check, *part, merge=merge)] = (check, i)
+            progress(check)
+
+        for check in checks:
+            if not (check == "merged-mace" and chained):
+                submit(check, [numbered[name] for name in CHECK_INPUTS[check]])
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                check, i = pending.pop(future)
+                if check in errors:
+                    continue
+                try:
+                    parts[check][i] = future.result()
+                except Exception as e:
+                    errors[check] = e
+                    if check == "kna1-knvv" and chained:
+                        errors["merged-mace"] = e
+                    continue
+                progress(check)
+                if any(part is None for part in parts[check]):
+                    continue
+                results[check] = tuple(combine(frames) for frames in zip(*parts[check]))
+                if check == "kna1-knvv" and chained:
+                    submit("merged-mace", [_numbered(merged_table(results[check][2])), numbered["mace"]])
+
+    return {check: results[check] for check in checks if check in results}, errors
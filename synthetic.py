@@ -0,0 +1,209 @@
+"""Synthetic KNA1, KNVV, KNVP, MACE and MACE Partner extracts.
+
+The tables look like the real ones: every customer has a KNA1 row and
+`duplicates` KNVV sales areas with one KNVP partner row each, and MACE
+and MACE Partner mirror them. A share of the mirrored rows then gets one
+mapped value changed (mismatch_rate), a blank or "Not Found" value
+(blank_rate), or is missing with an unknown customer in its place
+(missing_rate). SAP tables are written in the export layout the app
+reads: title lines, the header on row 5, a dashed row 6 and an unnamed
+first column.
+
+    python synthetic.py --rows 100000 --output-dir data
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+from validations import MACE_COLUMN_MAPPING, MACE_PARTNER_COLUMN_MAPPING
+
+FILE_NAMES = {
+    "kna1": "KNA1",
+    "knvv": "KNVV",
+    "knvp": "KNVP",
+    "mace": "MACE",
+    "mace_partner": "MACE_PARTNER",
+}
+SAP_TABLES = {"kna1", "knvv", "knvp"}
+
+CITIES = ["Berlin", "Hamburg", "Paris", "Lyon", "Milano", "Roma", "Madrid", "Wien"]
+COUNTRIES = ["DE", "DE", "FR", "FR", "IT", "IT", "ES", "AT"]
+REGIONS = ["BE", "HH", "75", "69", "MI", "RM", "MD", "W"]
+SALES_ORGS = ["1000", "2000", "3000", "4000"]
+CHANNELS = ["10", "20"]
+# "00" as in real extracts: type inference reads it as 0 in a column of
+# plain codes but keeps it as "00" next to a damaged value, as the
+# original readers did
+DIVISIONS = ["00", "10", "20"]
+PARTNER_FUNCTIONS = ["SP", "SH", "BP", "PY"]
+FIRST_CUSTOMER = 1_000_000
+
+
+def _customer_ids(start, n):
+    return (np.arange(start, start + n)).astype(str)
+
+
+def _pick(rng, values, n):
+    return np.asarray(values, dtype=object)[rng.integers(0, len(values), n)]
+
+
+def _damage(rng, df, columns, mismatch_rate, blank_rate):
+    # Change one of `columns` in a share of the rows, and blank out or
+    # mark "Not Found" another share
+    df = df.copy()
+    n = len(df)
+    changed = np.flatnonzero(rng.random(n) < mismatch_rate)
+    which = rng.integers(0, len(columns), len(changed))
+    for j, col in enumerate(columns):
+        rows = changed[which == j]
+        df.iloc[rows, df.columns.get_loc(col)] = df[col].iloc[rows].astype(str) + "X"
+    blanked = np.flatnonzero(rng.random(n) < blank_rate)
+    which = rng.integers(0, len(columns), len(blanked))
+    for j, col in enumerate(columns):
+        rows = blanked[which == j]
+        df[col] = df[col].astype(object)
+        df.iloc[rows, df.columns.get_loc(col)] = _pick(rng, ["", "Not Found"], len(rows))
+    return df
+
+
+def _replace_missing(rng, df, key, missing_rate, next_id):
+    # Drop a share of the rows and add as many rows for unknown customers
+    missing = rng.random(len(df)) < missing_rate
+    orphans = df[missing].copy()
+    orphans[key] = _customer_ids(next_id, len(orphans))
+    return pd.concat([df[~missing], orphans], ignore_index=True)
+
+
+def generate(rows=10_000, duplicates=2, mismatch_rate=0.05, blank_rate=0.02, missing_rate=0.02, seed=0):
+    """Return {input name: DataFrame} with about `rows` KNVV, KNVP and MACE rows."""
+    rng = np.random.default_rng(seed)
+    n_areas = len(SALES_ORGS) * len(CHANNELS) * len(DIVISIONS)
+    duplicates = max(1, min(duplicates, n_areas))
+    n_customers = max(1, rows // duplicates)
+    customers = _customer_ids(FIRST_CUSTOMER, n_customers)
+    orphan_id = FIRST_CUSTOMER + 2 * n_customers
+
+    place = rng.integers(0, len(CITIES), n_customers)
+    kna1 = pd.DataFrame({
+        "Customer": customers,
+        "Name": np.char.add("Customer ", customers),
+        "Name2": np.where(rng.random(n_customers) < 0.3, "GmbH", ""),
+        "Street": np.char.add(rng.integers(1, 200, n_customers).astype(str), " Main Street"),
+        "City": np.asarray(CITIES)[place],
+        "Postal Code": rng.integers(10000, 99999, n_customers),
+        "Region": np.asarray(REGIONS)[place],
+        "Ctry/Reg.": np.asarray(COUNTRIES)[place],
+        "Account group": _pick(rng, ["Z001", "Z002"], n_customers),
+        "Language": _pick(rng, ["EN", "DE", "FR"], n_customers),
+    })
+
+    # `duplicates` distinct sales areas per customer
+    areas = ((rng.integers(0, n_areas, n_customers)[:, None] + np.arange(duplicates)) % n_areas).ravel()
+    knvv = pd.DataFrame({
+        "Customer": np.repeat(customers, duplicates),
+        "Sales Org.": np.asarray(SALES_ORGS)[areas // (len(CHANNELS) * len(DIVISIONS))],
+        "Distr. Channel": np.asarray(CHANNELS)[areas // len(DIVISIONS) % len(CHANNELS)],
+        "Division": np.asarray(DIVISIONS)[areas % len(DIVISIONS)],
+        "Currency": _pick(rng, ["EUR", "USD"], len(areas)),
+        "Group": _pick(rng, ["01", "02"], len(areas)),
+    })
+    # Some KNA1 customers have no sales area, some sales areas no KNA1 customer
+    knvv = _replace_missing(rng, knvv, "Customer", missing_rate, orphan_id)
+    orphan_id += len(knvv)
+
+    knvp = knvv[["Customer", "Sales Org.", "Distr. Channel", "Division"]].copy()
+    knvp["Partner Functn"] = _pick(rng, PARTNER_FUNCTIONS, len(knvp))
+    knvp["Customer Parent"] = np.where(rng.random(len(knvp)) < 0.1, knvp["Customer"].iloc[::-1], knvp["Customer"])
+    knvp = _damage(rng, knvp, ["Sales Org."], mismatch_rate, 0)
+
+    merged = kna1.merge(knvv, on="Customer")
+    mace = pd.DataFrame({mace_col: merged[col] for col, mace_col in MACE_COLUMN_MAPPING.items()})
+    mace["CUSTOMER_POSTAL_CODE"] = mace["CUSTOMER_POSTAL_CODE"].astype(float).astype(str)
+    mace = _damage(rng, mace, list(mace.columns[1:]), mismatch_rate, blank_rate)
+    mace = _replace_missing(rng, mace, "CUSTOMER_NATURAL_ID", missing_rate, orphan_id)
+    orphan_id += len(mace)
+
+    mace_partner = pd.DataFrame({mace_col: knvp[col] for col, mace_col in MACE_PARTNER_COLUMN_MAPPING.items()})
+    mace_partner = _damage(rng, mace_partner, list(mace_partner.columns[1:]), mismatch_rate, 0)
+    mace_partner = _replace_missing(rng, mace_partner, "CUSTOMER_NATURAL_ID", missing_rate, orphan_id)
+
+    # MACE extracts come in no particular order
+    return {
+        "kna1": kna1,
+        "knvv": knvv,
+        "knvp": knvp.reset_index(drop=True),
+        "mace": mace.sample(frac=1, random_state=seed).reset_index(drop=True),
+        "mace_partner": mace_partner.sample(frac=1, random_state=seed).reset_index(drop=True),
+    }
+
+
+def write_sap_xlsx(df, path, title):
+    # SAP list export: title lines, header on row 5, dashes on row 6, and
+    # an empty first column that reads back as "Unnamed: 0"
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title="Sheet1")
+    sheet.append([None, f"Table: {title}"])
+    sheet.append([None, f"Displayed Fields: {len(df.columns)} of {len(df.columns)}"])
+    sheet.append([])
+    sheet.append([])
+    sheet.append([None, *df.columns])
+    sheet.append([None, *("-" * len(col) for col in df.columns)])
+    for row in df.itertuples(index=False, name=None):
+        sheet.append([None, *row])
+    workbook.save(path)
+
+
+def write_plain_xlsx(df, path):
+    from openpyxl import Workbook
+
+    workbook = Workbook(write_only=True)
+    sheet = workbook.create_sheet(title="Sheet1")
+    sheet.append(list(df.columns))
+    for row in df.itertuples(index=False, name=None):
+        sheet.append(list(row))
+    workbook.save(path)
+
+
+def write_extracts(tables, output_dir, fmt="xlsx"):
+    """Write the generated tables as the app's inputs; returns {input name: path}."""
+    os.makedirs(output_dir, exist_ok=True)
+    paths = {}
+    for name, df in tables.items():
+        path = os.path.join(output_dir, f"{FILE_NAMES[name]}.{fmt}")
+        if fmt == "csv":
+            df.to_csv(path, index=False)
+        elif fmt == "parquet":
+            df.to_parquet(path, index=False)
+        elif name in SAP_TABLES:
+            write_sap_xlsx(df, path, FILE_NAMES[name])
+        else:
+            write_plain_xlsx(df, path)
+        paths[name] = path
+    return paths
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Write synthetic SAP and MACE extracts.")
+    parser.add_argument("--rows", type=int, default=10_000, help="KNVV rows; KNVP, MACE and MACE Partner get about as many")
+    parser.add_argument("--duplicates", type=int, default=2, help="sales areas per customer")
+    parser.add_argument("--mismatch-rate", type=float, default=0.05, help="share of MACE rows with a changed value")
+    parser.add_argument("--blank-rate", type=float, default=0.02, help='share of MACE rows with a blank or "Not Found" value')
+    parser.add_argument("--missing-rate", type=float, default=0.02, help="share of rows whose customer is missing on the other side")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--format", dest="fmt", choices=["xlsx", "csv", "parquet"], default="xlsx")
+    parser.add_argument("--output-dir", default=".")
+    args = parser.parse_args(argv)
+
+    tables = generate(args.rows, args.duplicates, args.mismatch_rate, args.blank_rate, args.missing_rate, args.seed)
+    for name, path in write_extracts(tables, args.output_dir, args.fmt).items():
+        print(f"{path}: {len(tables[name])} rows")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,239 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import synthetic
+from benchmark import same_result
+from incremental import run_incremental
+from reference import reference, reference_merged_workbook, reference_read
+from rules import RuleSet
+from sql_backend import HAS_DUCKDB, SqlBackend
+from suite import run_suite
+from validations import (
+    CHECK_INPUTS,
+    MACE_COLUMN_MAPPING,
+    NESTED_SEPARATOR,
+    REPORTS,
+    SALES_AREA_COLUMN,
+    compare,
+    load_rules,
+    merged_table,
+    reader_for,
+    run_checks,
+    text_columns,
+)
+
+needs_duckdb = pytest.mark.skipif(not HAS_DUCKDB, reason="needs the duckdb package")
+
+
+def edge_cases(tables):
+    # Blank and missing customer IDs, padded IDs, "Not Found" values and
+    # numbers spelled differently on each side
+    kna1, knvv, knvp = tables["kna1"], tables["knvv"], tables["knvp"]
+    mace, mace_partner = tables["mace"].astype(object), tables["mace_partner"].astype(object)
+    kna1 = pd.concat([kna1, kna1.iloc[:3].assign(Customer=[None, "", " " + kna1["Customer"].iloc[3] + " "])], ignore_index=True)
+    knvv = pd.concat([knvv, knvv.iloc[:2].assign(Customer=[None, ""])], ignore_index=True)
+    knvp = pd.concat([knvp, knvp.iloc[:1].assign(Customer=[""])], ignore_index=True)
+    mace.loc[:4, MACE_COLUMN_MAPPING["Sales Org."]] = mace.loc[:4, MACE_COLUMN_MAPPING["Sales Org."]].astype(str) + ".0"
+    mace.loc[5:7, MACE_COLUMN_MAPPING["City"]] = "Not Found"
+    mace.loc[8, "CUSTOMER_NATURAL_ID"] = None
+    mace.loc[9, "CUSTOMER_NATURAL_ID"] = ""
+    mace_partner.loc[:2, "CUSTOMER_SALES_ORGANIZATION"] = "1e3"
+    mace_partner.loc[3, "CUSTOMER_NATURAL_ID"] = None
+    return {**tables, "kna1": kna1, "knvv": knvv, "knvp": knvp, "mace": mace, "mace_partner": mace_partner}
+
+
+@pytest.fixture(scope="module")
+def paths(tmp_path_factory):
+    tables = edge_cases(synthetic.generate(400, duplicates=3, mismatch_rate=0.1, blank_rate=0.05, seed=7))
+    return synthetic.write_extracts(tables, str(tmp_path_factory.mktemp("extracts")))
+
+
+@pytest.fixture(scope="module")
+def tables(paths):
+    # As the app and the command line read them
+    return {name: reader_for(name)(path, text_columns=text_columns(name)) for name, path in paths.items()}
+
+
+@pytest.fixture(scope="module")
+def expected(paths):
+    # The original checks on the inputs as the original app read them
+    inputs = {name: reference_read(path, name) for name, path in paths.items()}
+    results = {"kna1-knvv": reference("kna1-knvv", inputs["kna1"], inputs["knvv"])}
+    inputs["merged"] = reference_merged_workbook(results["kna1-knvv"][2])
+    for check in list(REPORTS)[1:]:
+        results[check] = reference(check, *(inputs[name] for name in CHECK_INPUTS[check]))
+    return results
+
+
+def assert_same(expected, actual):
+    assert len(expected) == len(actual)
+    for e, a in zip(expected, actual):
+        assert same_result(e, a), f"expected\n{e}\ngot\n{a}"
+
+
+def with_merged(tables):
+    return {**tables, "merged": merged_table(compare("kna1-knvv", tables["kna1"], tables["knvv"])[2])}
+
+
+@pytest.mark.parametrize("check", REPORTS)
+def test_checks_match_reference(tables, expected, check):
+    inputs = with_merged(tables)
+    assert_same(expected[check], compare(check, *(inputs[name] for name in CHECK_INPUTS[check])))
+
+
+def test_suite_matches_reference(tables, expected):
+    results, errors = run_suite(tables, partitions=3, workers=1)
+    assert not errors
+    for check in REPORTS:
+        assert_same(expected[check], results[check])
+
+
+@pytest.mark.parametrize("check", REPORTS)
+def test_incremental_matches_reference(tables, expected, tmp_path, check):
+    inputs = [with_merged(tables)[name] for name in CHECK_INPUTS[check]]
+    # A first run on other rows leaves a snapshot to update from
+    run_incremental(check, [df.iloc[::2] for df in inputs], str(tmp_path))
+    result, delta = run_incremental(check, inputs, str(tmp_path))
+    assert not delta["full_run"]
+    assert_same(expected[check], result)
+
+
+@needs_duckdb
+def test_sql_matches_reference(paths, expected):
+    with SqlBackend() as backend:
+        loaded = {name: backend.load(name, path) for name, path in paths.items()}
+        results, errors = backend.run_suite(loaded)
+        assert not errors
+        for check in REPORTS:
+            assert_same(expected[check], [table.to_frame() for table in results[check]])
+
+
+def test_per_customer_merge_nests_sales_areas(tables):
+    kna1, knvv = tables["kna1"], tables["knvv"]
+    _, _, merged = compare("kna1-knvv", kna1, knvv, merge="per-customer")
+    customers = kna1["Customer"][kna1["Customer"] != ""]
+    assert list(merged["Customer"]) == list(customers)
+    assert merged[SALES_AREA_COLUMN].gt(1).any()
+    for row in merged.to_dict("records"):
+        areas = knvv[knvv["Customer"] == row["Customer"]]
+        assert row[SALES_AREA_COLUMN] == len(areas)
+        if len(areas):
+            assert row["Currency"] == NESTED_SEPARATOR.join(areas["Currency"])
+            assert row["Division"] == NESTED_SEPARATOR.join(areas["Division"])
+
+
+def test_per_customer_merge_on_every_path(paths, tables):
+    expected = compare("kna1-knvv", tables["kna1"], tables["knvv"], merge="per-customer")
+    results, errors = run_suite(tables, ["kna1-knvv"], partitions=3, workers=1, merge="per-customer")
+    assert not errors
+    assert_same(expected, results["kna1-knvv"])
+    if HAS_DUCKDB:
+        with SqlBackend() as backend:
+            loaded = {name: backend.load(name, paths[name]) for name in ("kna1", "knvv")}
+            assert_same(expected, [table.to_frame() for table in backend.compare_kna1_knvv(*loaded.values(), merge="per-customer")])
+
+
+def test_per_customer_merge_leaves_merged_mace_as_it_was(paths, tmp_path):
+    # KNA1+KNVV vs MACE always compares one row per sales area
+    counts = {}
+    for merge in ("per-sales-area", "per-customer"):
+        results = run_checks(paths, ["kna1-knvv", "merged-mace"], output_dir=str(tmp_path / merge), merge=merge)
+        counts[merge] = results["merged-mace"][1]
+    assert counts["per-customer"] == counts["per-sales-area"]
+
+
+# Rule sets, against a row-by-row reading of their rules
+
+BLANKS = {"", "not found"}
+
+
+def same_value(comparator, blanks, left, right):
+    left, right = str(left).strip(), str(right).strip()
+    if left.lower() in BLANKS or right.lower() in BLANKS:
+        if blanks == "skip":
+            return True
+        if blanks == "mismatch":
+            return False
+    if comparator == "case-insensitive":
+        return left.casefold() == right.casefold()
+    if comparator == "trim-leading-zeros":
+        return (left.lstrip("0") or left[:1]) == (right.lstrip("0") or right[:1])
+    if comparator == "numeric":
+        try:
+            left_number, right_number = float(left), float(right)
+        except ValueError:
+            return left == right
+        return left_number == right_number
+    return left == right
+
+
+def unmatched_rows(rule_set, left, right):
+    # Row numbers of the left rows no right row of the customer agrees with
+    columns = {col: (rule_set.comparators[col].kind, rule_set.comparators[col].blanks) for col in rule_set.columns}
+    rows = []
+    for i, row in left.iterrows():
+        candidates = right[right[rule_set.right_key].str.strip() == row[rule_set.left_key].strip()]
+        if not any(all(same_value(*columns[col], row[col], other[right_col]) for col, right_col in rule_set.columns.items())
+                   for _, other in candidates.iterrows()):
+            rows.append(row["Row"])
+    return rows
+
+
+VALUES = ["00", "0", "10", "10.0", "1e1", "abc", "ABC", "", "Not Found", "nan"]
+
+
+def random_sides(seed, n=60):
+    rng = np.random.default_rng(seed)
+    keys = np.array(["1", "2", "3", " 3", ""], dtype=object)
+
+    def side(prefix):
+        return pd.DataFrame({
+            "Customer": keys[rng.integers(0, len(keys), n)],
+            **{f"{prefix}{i}": np.array(VALUES, dtype=object)[rng.integers(0, len(VALUES), n)] for i in range(2)},
+            "Row": [f"{prefix}{i}" for i in range(n)],
+        })
+
+    return side("L"), side("R")
+
+
+@pytest.mark.parametrize("comparator", ["exact", "numeric", "case-insensitive", "trim-leading-zeros"])
+@pytest.mark.parametrize("blanks", ["skip", "compare", "mismatch"])
+@pytest.mark.parametrize("mode", ["any", "both"])
+def test_rule_sets_follow_their_rules(comparator, blanks, mode):
+    if mode == "both" and blanks == "skip":
+        pytest.skip("mode 'both' cannot skip blanks")
+    rule_set = RuleSet.from_config("test", {
+        "left": "left", "right": "right", "mode": mode, "comparator": comparator, "blanks": blanks,
+        "columns": [{"left": "L0", "right": "R0"}, {"left": "L1", "right": "R1"}],
+    })
+    for seed in range(3):
+        left, right = random_sides(seed)
+        results = rule_set.run(left, right)
+        flipped = RuleSet.from_config("flipped", {
+            "left": "right", "right": "left", "comparator": comparator, "blanks": blanks,
+            "columns": [{"left": "R0", "right": "L0"}, {"left": "R1", "right": "L1"}],
+        })
+        expected = [unmatched_rows(rule_set, left, right)]
+        if mode == "both":
+            expected.append(unmatched_rows(flipped, right, left))
+        assert [list(df["Row"]) if len(df) else [] for df in results] == expected
+
+        if HAS_DUCKDB:
+            with SqlBackend() as backend:
+                tables = backend.load_frame("left", left), backend.load_frame("right", right)
+                assert_same(results, [table.to_frame() for table in backend.run_rule_set(rule_set, *tables, name="test")])
+
+
+def test_rule_file_replaces_a_built_in_check(tables, tmp_path):
+    path = tmp_path / "rules.json"
+    path.write_text(json.dumps({"rule_sets": {"knvv-knvp": {
+        "left": "knvv", "right": "knvp", "mode": "both", "comparator": "trim-leading-zeros",
+        "columns": {"Sales Org.": "Sales Org.", "Distr. Channel": "Distr. Channel", "Division": "Division"},
+    }}}))
+    rule_sets = load_rules(str(path))
+    result = compare("knvv-knvp", tables["knvv"], tables["knvp"], rule_sets=rule_sets)
+    assert len(result) == 2
+    assert_same(rule_sets["knvv-knvp"].run(tables["knvv"], tables["knvp"]), result)
@@ -0,0 +1,22 @@
+import os
+
+from diagnostics import RunRecorder
+
+
+def test_run_records_keep_only_the_newest(tmp_path):
+    paths = []
+    for i in range(5):
+        with RunRecorder(f"run{i}") as run:
+            pass
+        paths.append(run.write(str(tmp_path), keep=3))
+        # Records of one second differ by modification time
+        os.utime(paths[-1], (i, i))
+    assert sorted(os.listdir(tmp_path)) == sorted(os.path.basename(path) for path in paths[2:])
+
+
+def test_run_record_to_a_file_leaves_its_directory_alone(tmp_path):
+    (tmp_path / "other.json").write_text("{}")
+    with RunRecorder("run") as run:
+        pass
+    run.write(str(tmp_path / "run.json"), keep=0)
+    assert sorted(os.listdir(tmp_path)) == ["other.json", "run.json"]
@@ -0,0 +1,26 @@
+import zipfile
+from io import BytesIO
+
+import pandas as pd
+import pytest
+from streamlit.runtime.download_data_util import convert_data_to_bytes_and_infer_mime
+
+from export import FORMATS, render
+
+SHEETS = [
+    ("Mismatches", pd.DataFrame({"Customer": ["1", "2"], "City": ["Oslo", "Not Found"]})),
+    ("Missing", pd.DataFrame({"Customer": ["3"]})),
+]
+
+
+@pytest.mark.parametrize("fmt", FORMATS)
+def test_rendered_reports_download(fmt):
+    # What st.download_button does with the value of a deferred download
+    data, _ = convert_data_to_bytes_and_infer_mime(render(SHEETS, fmt=fmt), unsupported_error=TypeError())
+    if fmt == "xlsx":
+        sheets = pd.read_excel(BytesIO(data), sheet_name=None, dtype=str)
+        assert list(sheets) == ["Mismatches", "Missing"]
+        assert sheets["Mismatches"].equals(SHEETS[0][1])
+    else:
+        with zipfile.ZipFile(BytesIO(data)) as archive:
+            assert archive.namelist() == [f"Mismatches.{fmt}", f"Missing.{fmt}"]
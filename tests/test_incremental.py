@@ -0,0 +1,86 @@
+import os
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from incremental import Customers, prune_snapshots, run_incremental
+from validations import compare
+
+
+@pytest.mark.parametrize("keys", [
+    ["a", None, "", "a"],
+    ["a", " a", "b ", "b"],
+    pd.Categorical(["a", "b", "a", "b"], categories=["z", "a", "b", "y"]),
+])
+def test_customers_group_keys_by_stripped_text(keys):
+    df = pd.DataFrame({"k": keys, "v": list("1234")})
+    customers = Customers(df, "k")
+
+    digests = customers.digests(df)
+    assert list(digests.index) == list(customers.keys)
+    assert len(customers.order) == len(customers.ranks) == len(df)
+    for i, key in enumerate(customers.keys):
+        rows = np.flatnonzero(customers.codes == i)
+        assert list(customers.ranks[rows]) == list(range(len(rows)))
+        assert list(customers.positions(pd.Index([key] * len(rows)), np.arange(len(rows)))) == list(rows)
+
+
+def test_blank_and_missing_keys_are_one_customer():
+    df = pd.DataFrame({"k": ["a", None, "", "a"], "v": list("1234")})
+    customers = Customers(df, "k")
+    assert sorted(customers.keys) == ["", "a"]
+    # Changing a row of the blank customer changes its digest only
+    changed = df.assign(v=list("1294"))
+    before, after = customers.digests(df), customers.digests(changed)
+    assert before["a"] == after["a"]
+    assert before[""] != after[""]
+
+
+def test_incremental_run_with_whitespace_keys(tmp_path):
+    knvv = pd.DataFrame({
+        "Customer": ["1", " 1", "2", None, ""],
+        "Sales Org.": ["1000", "2000", "1000", "1000", "1000"],
+        "Distr. Channel": ["10"] * 5,
+        "Division": ["00"] * 5,
+    })
+    knvp = knvv.iloc[[0, 2, 4]].assign(**{"Partner Functn": "SP"})
+    first, _ = run_incremental("knvv-knvp", (knvv, knvp), str(tmp_path))
+    second, delta = run_incremental("knvv-knvp", (knvv, knvp.iloc[:2]), str(tmp_path))
+    assert not delta["full_run"]
+    expected = compare("knvv-knvp", knvv, knvp.iloc[:2])
+    for got, want in zip(second, expected):
+        pd.testing.assert_frame_equal(got, want)
+
+
+def test_unreadable_snapshot_is_a_full_run(tmp_path):
+    knvv = pd.DataFrame({
+        "Customer": ["1", "2"],
+        "Sales Org.": ["1000", "1000"],
+        "Distr. Channel": ["10", "10"],
+        "Division": ["00", "00"],
+    })
+    knvp = knvv.iloc[:1].assign(**{"Partner Functn": "SP"})
+    run_incremental("knvv-knvp", (knvv, knvp), str(tmp_path))
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["knvv-knvp.pkl"]
+
+    snapshot = tmp_path / "knvv-knvp.pkl"
+    snapshot.write_bytes(snapshot.read_bytes()[:20])
+    result, delta = run_incremental("knvv-knvp", (knvv, knvp), str(tmp_path))
+    assert delta["full_run"]
+    assert delta["newly_broken"] is None
+    for got, want in zip(result, compare("knvv-knvp", knvv, knvp)):
+        pd.testing.assert_frame_equal(got, want)
+    # The truncated snapshot was replaced by a readable one
+    _, delta = run_incremental("knvv-knvp", (knvv, knvp), str(tmp_path))
+    assert not delta["full_run"]
+
+
+def test_prune_snapshots_keeps_the_newest_names(tmp_path):
+    for i, name in enumerate(["old", "older", "newer", "newest"]):
+        (tmp_path / name).mkdir()
+        (tmp_path / name / "knvv-knvp.pkl").write_bytes(b"")
+        os.utime(tmp_path / name, (i, [1, 0, 2, 3][i]))
+    prune_snapshots(str(tmp_path), 2)
+    assert sorted(p.name for p in tmp_path.iterdir()) == ["newer", "newest"]
+    prune_snapshots(str(tmp_path / "missing"), 2)
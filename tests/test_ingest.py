@@ -0,0 +1,67 @@
+from io import BytesIO
+
+import pandas as pd
+import pytest
+from openpyxl import Workbook
+
+import ingest
+from ingest import read_extract, read_extract_chunks
+
+
+def workbook(rows):
+    book = Workbook()
+    for row in rows:
+        book.active.append(row)
+    buffer = BytesIO()
+    book.save(buffer)
+    return buffer.getvalue()
+
+
+SHEETS = {
+    "trailing blank rows": ("plain", [["A", "B"], ["1", "x"], [2, None], [None, None], [3, "y"], [None, None]]),
+    "cells past the header": ("plain", [["A", "B"], [1, "x"], [2, "y", None, "extra"], [3, "z"]]),
+    "no rows": ("plain", [["A", "B"]]),
+    "sap layout": ("sap", [["junk"], [], [], [], ["Customer", "Sales Org."], ["--"], ["0001", "1000"], ["0002", "2000"]]),
+}
+
+
+ENGINES = ["calamine", "openpyxl"] if ingest.HAS_CALAMINE else ["openpyxl"]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("sheet", SHEETS)
+@pytest.mark.parametrize("columns", [None, ["a", "customer"]])
+def test_xlsx_chunks_add_up_to_read_extract(engine, sheet, columns):
+    layout, rows = SHEETS[sheet]
+    data = workbook(rows)
+    whole = read_extract(data, layout=layout, columns=columns, engine=engine)
+    chunks = list(read_extract_chunks(data, layout=layout, columns=columns, chunk_rows=1))
+
+    # Blank rows go with the next data row; a sheet without rows still gives a chunk
+    assert 1 <= len(chunks) <= max(len(whole), 1)
+    # Chunks are typed on their own; later ones may add columns
+    got = pd.concat(chunks).reindex(columns=whole.columns)
+    assert list(got.index) == list(range(len(whole)))
+    assert got.astype(str).values.tolist() == whole.astype(str).values.tolist()
+
+
+def test_xlsx_chunks_stream_through_openpyxl(monkeypatch):
+    # python-calamine loads the whole sheet before the first row
+    def whole_sheet(buffer):
+        raise AssertionError("read_extract_chunks loaded the whole sheet")
+
+    monkeypatch.setattr(ingest, "_calamine_rows", whole_sheet)
+    chunks = list(read_extract_chunks(workbook(SHEETS["sap layout"][1]), layout="sap", chunk_rows=1))
+    assert [chunk["Customer"].tolist() for chunk in chunks] == [[1], [2]]
+
+
+def test_read_extract_engine(monkeypatch):
+    data = workbook(SHEETS["sap layout"][1])
+    monkeypatch.setattr(ingest, "XLSX_ENGINE", "openpyxl")
+    monkeypatch.setattr(ingest, "_calamine_rows", None)
+    assert read_extract(data, layout="sap")["Customer"].tolist() == [1, 2]
+    with pytest.raises(ValueError, match="Unknown workbook engine"):
+        read_extract(data, engine="xlrd")
+    monkeypatch.setattr(ingest, "HAS_CALAMINE", False)
+    with pytest.raises(ValueError, match="python-calamine"):
+        read_extract(data, engine="calamine")
@@ -0,0 +1,720 @@
+"""SAP vs MACE customer validations, usable without Streamlit.
+
+Run from the command line, e.g.
+
+    python validations.py --kna1 KNA1.xlsx --knvv KNVV.xlsx --mace MACE.xlsx --output-dir results
+
+Every check whose inputs are given is run; --checks restricts the run to
+a subset. The KNA1+KNVV vs MACE check uses --merged when given, otherwise
+the merge produced by the KNA1 vs KNVV check; --merge per-customer
+reports that merge as one row per customer, its sales areas nested. --rules adds or replaces
+column-mapped checks from a JSON rule file (see rules.py), whose extra
+inputs are given as --input NAME=PATH.
+--database DIR loads the inputs into an on-disk DuckDB database and runs
+the checks there, for extracts larger than memory (see sql_backend.py).
+"""
+import argparse
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+
+import export
+from diagnostics import RunRecorder, stage
+from encoding import decoded, distinct_text, share_customer_codes, shared_codes
+from ingest import read_extract
+from normalize import normalization_savings, normalize_text_columns
+from rules import RuleSet, load_rule_sets
+
+MACE_COLUMN_MAPPING = {
+    "Customer": "CUSTOMER_NATURAL_ID",
+    "City": "CUSTOMER_CITY_NAME",
+    "Ctry/Reg.": "CUSTOMER_COUNTRY_ISO2_CODE",
+    "Postal Code": "CUSTOMER_POSTAL_CODE",
+    "Street": "CUSTOMER_STREET_NAME",
+    "Region": "CUSTOMER_REGION_CODE",
+    "Name": "CUSTOMER_NAME",
+    "Name2": "CUSTOMER_NAME2",
+    "Sales Org.": "CUSTOMER_SALES_ORGANIZATION_CODE",
+    "Distr. Channel": "CUSTOMER_SALES_DISTRIBUTION_CHANNEL_CODE",
+    "Division": "CUSTOMER_DIVISION_CODE",
+    "Currency": "CUSTOMER_CURRENCY",
+    "Account group": "CUSTOMER_ACCOUNT_GROUP_CODE",
+    "Language": "CUSTOMER_LANGUAGE_KEY",
+    "Group": "CUSTOMER_GROUP_KEY"
+}
+
+KNVP_COMPARISON_COLUMNS = ["Sales Org.", "Distr. Channel", "Division"]
+
+MACE_PARTNER_COLUMN_MAPPING = {
+    "Customer": "CUSTOMER_NATURAL_ID",
+    "Sales Org.": "CUSTOMER_SALES_ORGANIZATION",
+    "Distr. Channel": "CUSTOMER_DISTRIBUTION_CHANNEL",
+    "Division": "CUSTOMER_DIVISION",
+    "Partner Functn": "CUSTOMER_PARTNER_FUNCTION",
+    "Customer Parent": "CUSTOMER_PARTNER_NATURAL_ID"
+}
+
+# Output workbook of each check: file name and sheet names in order.
+REPORTS = {
+    "kna1-knvv": ("merged_kna1_knvv.xlsx", ["Sheet1"]),
+    "merged-mace": ("mace_kna1+knvv_comparison.xlsx", ["kna1+knvv _Not_in_MACE", "MACE_Not_in_ kna1+knvv"]),
+    "knvv-knvp": ("knvv_knvp_mismatch.xlsx", ["Mismatches"]),
+    "knvp-mace-partner": ("knvp_mace_partner_mismatch.xlsx", ["KNVP_Not_in_MACEpartner", "MACEpartner_Not_in_KNVP"]),
+}
+
+# Inputs each check needs; "merged" can also come from the KNA1 vs KNVV check.
+CHECK_INPUTS = {
+    "kna1-knvv": ["kna1", "knvv"],
+    "merged-mace": ["merged", "mace"],
+    "knvv-knvp": ["knvv", "knvp"],
+    "knvp-mace-partner": ["knvp", "mace_partner"],
+}
+
+# Columns the checks compare, per input. Only these are normalised to
+# text; loading only these keeps wide extracts small, at the cost of
+# narrower result rows.
+KEY_COLUMNS = {
+    "kna1": list(MACE_COLUMN_MAPPING),
+    "knvv": list(MACE_COLUMN_MAPPING),
+    "merged": list(MACE_COLUMN_MAPPING),
+    "mace": list(MACE_COLUMN_MAPPING.values()),
+    "knvp": list(dict.fromkeys(["Customer", *KNVP_COMPARISON_COLUMNS, *MACE_PARTNER_COLUMN_MAPPING])),
+    "mace_partner": list(MACE_PARTNER_COLUMN_MAPPING.values()),
+}
+
+SUMMARY_LABELS = {
+    "kna1-knvv": ["Customers in KNA1 not in KNVV", "Customers in KNVV not in KNA1", "Merged rows"],
+    "merged-mace": ["Customers in KNA1+KNVV but NOT in MACE (including mismatches)", "Customers in MACE but NOT in KNA1+KNVV"],
+    "knvv-knvp": ["Customers in KNVV but NOT properly matched in KNVP"],
+    "knvp-mace-partner": ["KNVP rows not matching MACE", "MACE rows not matching KNVP"],
+}
+
+# KNA1 vs KNVV merges: one row per KNA1 row and KNVV sales area, or one
+# row per KNA1 row with the customer's sales areas nested in its cells
+MERGE_MODES = ["per-sales-area", "per-customer"]
+
+# Nested merge: number of sales areas, and the separator of their values
+SALES_AREA_COLUMN = "Sales areas"
+NESTED_SEPARATOR = "; "
+
+
+# The column-mapped checks as rule sets (see rules.py)
+RULE_SETS = {
+    # A row passes if any MACE row for the customer matches on every mapped
+    # column, numerically where both sides are numbers; blanks match anything
+    "merged-mace": RuleSet.from_config("merged-mace", {
+        "title": "KNA1+KNVV vs MACE",
+        "left": "merged",
+        "right": "mace",
+        "left_key": "Customer",
+        "right_key": "CUSTOMER_NATURAL_ID",
+        "columns": MACE_COLUMN_MAPPING,
+        "comparator": "numeric",
+        "blanks": "skip",
+        "right_only": True,
+        "not_found_reason": "Customer not found in MACE",
+    }),
+    "knvv-knvp": RuleSet.from_config("knvv-knvp", {
+        "title": "KNVV vs KNVP",
+        "left": "knvv",
+        "right": "knvp",
+        "columns": {col: col for col in KNVP_COMPARISON_COLUMNS},
+        "skip_blank_keys": True,
+        "not_found_reason": "Customer not found in KNVP",
+    }),
+    # Both directions, strict equality; missing columns read as blank
+    "knvp-mace-partner": RuleSet.from_config("knvp-mace-partner", {
+        "title": "KNVP vs MACE Partner",
+        "left": "knvp",
+        "right": "mace_partner",
+        "left_key": "Customer",
+        "right_key": "CUSTOMER_NATURAL_ID",
+        "columns": MACE_PARTNER_COLUMN_MAPPING,
+        "mode": "both",
+        "missing_columns": "blank",
+        "not_found_reason": "Customer Not Found",
+        "reason_column": "Mismatch Columns",
+    }),
+}
+
+
+def find_column(df, target):
+    for col in df.columns:
+        if col.lower() == target.lower():
+            return col
+    return None
+
+
+def _sap_columns(df):
+    # SAP exports: padding columns without a name
+    df.columns = df.columns.str.strip()
+    return df.loc[:, ~df.columns.str.contains('^Unnamed', case=False) & (df.columns.str.strip() != '')]
+
+
+def _plain_columns(df):
+    df.columns = df.columns.str.strip()
+    return df
+
+
+def read_sap_table(source, columns=None, text_columns=None, compact=True):
+    # SAP exports: header on row 5, junk row 6. Only `text_columns`
+    # (default: all) are normalised to text, the rest keep their dtypes;
+    # with `compact` customer IDs and repetitive ones are categoricals.
+    with stage("parse") as info:
+        df = read_extract(source, layout="sap", columns=columns)
+        info["rows_out"] = len(df)
+    with stage("clean", rows_in=len(df)) as info:
+        df = normalize_text_columns(_sap_columns(df), text_columns, compact=compact)
+        info["rows_out"] = len(df)
+    return df
+
+
+def read_table(source, columns=None, text_columns=None, compact=True):
+    # Plain sheets with the header on the first row (MACE, the merged KNA1+KNVV file)
+    with stage("parse") as info:
+        df = read_extract(source, layout="plain", columns=columns)
+        info["rows_out"] = len(df)
+    with stage("clean", rows_in=len(df)) as info:
+        df = normalize_text_columns(_plain_columns(df), text_columns, compact=compact)
+        info["rows_out"] = len(df)
+    return df
+
+
+def knvv_merge_columns(df_kna1, df_knvv, customer_col_knvv):
+    # The KNVV key and the columns KNA1 lacks; columns both have keep
+    # their KNA1 values, so they are left out before the join
+    return [customer_col_knvv] + [
+        col for col in df_knvv.columns
+        if col != customer_col_knvv and col not in df_kna1.columns and not col.endswith('_KNVV')
+    ]
+
+
+def nest_sales_areas(df_knvv, customer_col):
+    """One row per KNVV customer: its number of sales areas and, per column,
+    the values of its rows in row order joined by NESTED_SEPARATOR, so the
+    n-th value of every column belongs to the same sales area.
+    """
+    group, uniques = pd.factorize(df_knvv[customer_col], use_na_sentinel=False)
+    counts = np.bincount(group, minlength=len(uniques))
+    # Position of each row within its customer
+    by_customer = np.argsort(group, kind="stable")
+    rank = np.empty(len(group), dtype=np.int64)
+    rank[by_customer] = np.arange(len(group)) - np.repeat(np.cumsum(counts) - counts, counts)
+    # Rows by that position: the first rows start each customer's values,
+    # the k-th rows are appended to them
+    layers = np.split(np.argsort(rank, kind="stable"), np.cumsum(np.bincount(rank))[:-1]) if len(group) else [group]
+    first = np.empty(len(uniques), dtype=np.int64)
+    first[group[layers[0]]] = layers[0]
+
+    nested = {customer_col: df_knvv[customer_col].iloc[first].reset_index(drop=True), SALES_AREA_COLUMN: counts}
+    for col in df_knvv.columns:
+        if col == customer_col:
+            continue
+        codes, texts = distinct_text(df_knvv[col])
+        text = np.asarray(texts, dtype=object)[codes]
+        joined = text[first]
+        for rows in layers[1:]:
+            at = group[rows]
+            joined[at] = joined[at] + NESTED_SEPARATOR + text[rows]
+        nested[col] = pd.Series(joined, dtype=str)
+    return pd.DataFrame(nested)
+
+
+def sales_area_fanout(df_kna1, df_knvv):
+    """Per KNA1 customer: its KNA1 rows, KNVV sales areas and merged rows,
+    customers with the largest merge first."""
+    df_kna1, df_knvv = share_customer_codes((df_kna1, df_knvv))
+    kna1 = df_kna1[find_column(df_kna1, "Customer")]
+    knvv = df_knvv[find_column(df_knvv, "Customer")]
+    kna1, knvv = kna1[kna1 != ''], knvv[knvv != '']
+    kna1_codes, knvv_codes = shared_codes(kna1, knvv)
+    n = max(kna1_codes.max(initial=-1), knvv_codes.max(initial=-1)) + 1
+    # Each customer once, where it first appears in KNA1
+    _, first = np.unique(kna1_codes, return_index=True)
+    first.sort()
+    codes = kna1_codes[first]
+    kna1_rows = np.bincount(kna1_codes, minlength=n)[codes]
+    sales_areas = np.bincount(knvv_codes, minlength=n)[codes]
+    fanout = decoded(pd.DataFrame({"Customer": kna1.iloc[first].reset_index(drop=True)}))
+    fanout["KNA1 rows"] = kna1_rows
+    fanout[SALES_AREA_COLUMN] = sales_areas
+    fanout["Merged rows"] = kna1_rows * np.maximum(sales_areas, 1)
+    fanout = fanout.sort_values("Merged rows", ascending=False, kind="stable")
+    fanout.index = range(1, len(fanout) + 1)
+    return fanout
+
+
+def fanout_summary(fanout):
+    # The headline numbers of sales_area_fanout
+    areas = fanout[SALES_AREA_COLUMN]
+    return {
+        "customers": len(fanout),
+        "merged_rows": int(fanout["Merged rows"].sum()),
+        "max_sales_areas": int(areas.max()) if len(fanout) else 0,
+        "max_sales_areas_customer": str(fanout["Customer"].iloc[areas.argmax()]) if len(fanout) else None,
+        "mean_sales_areas": round(float(areas.mean()), 2) if len(fanout) else 0.0,
+        "multi_area_customers": int((areas > 1).sum()),
+        "customers_without_sales_area": int((areas == 0).sum()),
+    }
+
+
+def merge_kna1_knvv(df_kna1, df_knvv, merge="per-sales-area"):
+    """The merged KNA1+KNVV view of compare_kna1_knvv, without the customer differences.
+
+    KNA1 rows with a customer are left-joined with the columns KNA1 lacks
+    from KNVV; `merge` is one of MERGE_MODES, see compare_kna1_knvv.
+    """
+    if merge not in MERGE_MODES:
+        raise ValueError(f"Unknown merge '{merge}'; use one of {', '.join(MERGE_MODES)}")
+    df_kna1, df_knvv = share_customer_codes((df_kna1, df_knvv))
+    customer_col_kna1 = find_column(df_kna1, "Customer")
+    customer_col_knvv = find_column(df_knvv, "Customer")
+    df_kna1_clean = df_kna1[df_kna1[customer_col_kna1] != '']
+    df_knvv_clean = df_knvv[df_knvv[customer_col_knvv] != '']
+
+    # Merge on Customer only, taking from KNVV just the columns KNA1 lacks
+    with stage("merge", rows_in=len(df_kna1_clean) + len(df_knvv_clean)) as info:
+        df_knvv_clean = df_knvv_clean[knvv_merge_columns(df_kna1_clean, df_knvv_clean, customer_col_knvv)]
+        if merge == "per-customer":
+            df_knvv_clean = nest_sales_areas(df_knvv_clean, customer_col_knvv)
+        merged_df = pd.merge(
+            df_kna1_clean,
+            df_knvv_clean,
+            how="left",
+            left_on=customer_col_kna1,
+            right_on=customer_col_knvv,
+            suffixes=('', '_KNVV'),
+            validate="many_to_one" if merge == "per-customer" else None,
+        )
+
+        # KNA1's own columns named like KNVV duplicates
+        merged_df = merged_df.drop(columns=[col for col in merged_df.columns if col.endswith('_KNVV')])
+        if merge == "per-customer":
+            merged_df[SALES_AREA_COLUMN] = merged_df[SALES_AREA_COLUMN].fillna(0).astype("int64")
+        info["rows_out"] = len(merged_df)
+    merged_df.index = range(1, len(merged_df) + 1)
+    return decoded(merged_df)
+
+
+def compare_kna1_knvv(df_kna1, df_knvv, merge="per-sales-area"):
+    """Return (KNA1-only rows, KNVV-only rows, merged KNA1+KNVV view).
+
+    `merge` is one of MERGE_MODES: "per-sales-area" repeats each KNA1 row
+    for every sales area of its customer; "per-customer" keeps one row per
+    KNA1 row, with the customer's sales areas nested (see nest_sales_areas).
+    """
+    if merge not in MERGE_MODES:
+        raise ValueError(f"Unknown merge '{merge}'; use one of {', '.join(MERGE_MODES)}")
+    df_kna1, df_knvv = share_customer_codes((df_kna1, df_knvv))
+    customer_col_kna1 = find_column(df_kna1, "Customer")
+    customer_col_knvv = find_column(df_knvv, "Customer")
+
+    # Filter non-empty customers
+    df_kna1_clean = df_kna1[df_kna1[customer_col_kna1] != '']
+    df_knvv_clean = df_knvv[df_knvv[customer_col_knvv] != '']
+
+    # Customers on one side only, by their integer codes
+    kna1_codes, knvv_codes = shared_codes(df_kna1_clean[customer_col_kna1], df_knvv_clean[customer_col_knvv])
+    df_diff1 = df_kna1_clean[~np.isin(kna1_codes, knvv_codes)]
+    df_diff2 = df_knvv_clean[~np.isin(knvv_codes, kna1_codes)]
+    df_diff1.index = range(1, len(df_diff1) + 1)
+    df_diff2.index = range(1, len(df_diff2) + 1)
+    return decoded(df_diff1), decoded(df_diff2), merge_kna1_knvv(df_kna1, df_knvv, merge)
+
+
+def compare_merged_mace(df_merged, df_mace):
+    """Return (KNA1+KNVV rows not in MACE or mismatched, MACE rows not in KNA1+KNVV)."""
+    if "CUSTOMER_NATURAL_ID" not in df_mace.columns:
+        raise ValueError("MACE file must contain 'CUSTOMER_NATURAL_ID'")
+    return RULE_SETS["merged-mace"].run(df_merged, df_mace)
+
+
+def compare_knvv_knvp(df_knvv, df_knvp):
+    """Return the KNVV rows with no KNVP row matching on the sales area."""
+    df_not_in_knvp, = RULE_SETS["knvv-knvp"].run(df_knvv, df_knvp)
+    return df_not_in_knvp
+
+
+def compare_knvp_mace_partner(df_knvp, df_mace):
+    """Return (KNVP rows not in MACE Partner, MACE Partner rows not in KNVP)."""
+    # Both directions in one pass over the mapped key tuples
+    return RULE_SETS["knvp-mace-partner"].run(df_knvp, df_mace)
+
+
+def merged_table(merged_df):
+    # The in-process merge as if read back from the merged workbook:
+    # blanks from the left join become ''
+    return normalize_text_columns(merged_df, KEY_COLUMNS["merged"], compact=True)
+
+
+def load_rules(source):
+    """The rule sets of a JSON rule file, checked against the built-in checks they replace."""
+    rule_sets = load_rule_sets(source)
+    for name, rule_set in rule_sets.items():
+        if name in CHECK_INPUTS and name not in RULE_SETS:
+            raise ValueError(f"Check '{name}' is not column-mapped and has no rules to replace")
+        if name in CHECK_INPUTS and rule_set.inputs != CHECK_INPUTS[name]:
+            raise ValueError(f"Rule set '{name}' replaces a built-in check and must compare {' and '.join(CHECK_INPUTS[name])}")
+    return rule_sets
+
+
+# Checks from a rule file (`rule_sets`) next to the built-in ones; a rule
+# set replacing a built-in check keeps its inputs, report and labels
+def check_inputs(check, rule_sets=None):
+    return CHECK_INPUTS[check] if check in CHECK_INPUTS else rule_sets[check].inputs
+
+
+def summary_labels(check, rule_sets=None):
+    return SUMMARY_LABELS[check] if check in SUMMARY_LABELS else rule_sets[check].labels
+
+
+def text_columns(name, rule_sets=None):
+    # KEY_COLUMNS of the input plus whatever the rule sets compare in it
+    columns = list(KEY_COLUMNS.get(name, []))
+    for rule_set in (rule_sets or {}).values():
+        columns += rule_set.input_columns(name)
+    return list(dict.fromkeys(columns))
+
+
+def _report(check, rule_sets=None):
+    if check in REPORTS:
+        return REPORTS[check]
+    return rule_sets[check].file_name, rule_sets[check].sheets
+
+
+def report_sheets(check, frames, rule_sets=None):
+    # The result frames of one check under the sheet names it has always used
+    _, sheet_names = _report(check, rule_sets)
+    return list(zip(sheet_names, frames))
+
+
+def report_file_name(check, fmt="xlsx", rule_sets=None):
+    file_name, sheet_names = _report(check, rule_sets)
+    return export.file_name(file_name, fmt, len(sheet_names))
+
+
+def write_report(output, check, frames, fmt="xlsx", split=True, rule_sets=None):
+    # xlsx sheets over Excel's row limit are split unless `split` is off
+    export.write_sheets(output, report_sheets(check, frames, rule_sets), fmt=fmt, split=split)
+
+
+def reader_for(name, rule_sets=None):
+    # Inputs only a rule file reads are SAP exports unless it says otherwise
+    for rule_set in (rule_sets or {}).values():
+        if name in rule_set.layouts:
+            return read_table if rule_set.layouts[name] == "plain" else read_sap_table
+    return read_table if name in ("merged", "mace", "mace_partner") else read_sap_table
+
+
+def input_layout(name, rule_sets=None):
+    return "plain" if reader_for(name, rule_sets) is read_table else "sap"
+
+
+def tidy_columns(df, name, rule_sets=None):
+    # The header clean-up reader_for(name) applies to a raw extract
+    return _plain_columns(df) if input_layout(name, rule_sets) == "plain" else _sap_columns(df)
+
+
+def compare(check, *frames, rule_sets=None, merge="per-sales-area"):
+    """Run one check on its input frames; always returns a tuple of frames.
+
+    A rule set in `rule_sets` named after the check replaces its built-in
+    rules; `merge` is the KNA1 vs KNVV merge mode. The inputs' customer IDs
+    are first put on one shared dictionary of integer codes.
+    """
+    frames = share_customer_codes(frames)
+    if rule_sets and check in rule_sets:
+        return rule_sets[check].run(*frames)
+    if check == "kna1-knvv":
+        return compare_kna1_knvv(*frames, merge=merge)
+    if check == "merged-mace":
+        return compare_merged_mace(*frames)
+    if check == "knvv-knvp":
+        return (compare_knvv_knvp(*frames),)
+    if check == "knvp-mace-partner":
+        return compare_knvp_mace_partner(*frames)
+    raise ValueError(f"Unknown check '{check}'")
+
+
+def report_normalization(paths, rule_sets=None):
+    # Cost of normalising every column versus only the compared ones, per input
+    for name, path in paths.items():
+        raw = read_extract(path, layout=input_layout(name, rule_sets))
+        savings = normalization_savings(tidy_columns(raw, name, rule_sets), text_columns(name, rule_sets))
+        print(
+            f"[normalize] {name}: {savings['normalized_columns']} of {savings['columns']} columns, "
+            f"{savings['selective_seconds']:.2f}s instead of {savings['full_seconds']:.2f}s, "
+            f"{savings['selective_bytes'] / 2**20:.1f} MB instead of {savings['full_bytes'] / 2**20:.1f} MB, "
+            f"{savings['compact_bytes'] / 2**20:.1f} MB compact"
+        )
+
+
+def run_checks(paths, checks=None, output_dir=".", key_columns_only=False, fmt="xlsx", split=True,
+               parallel=False, partitions=None, workers=None, on_progress=None, snapshot_dir=None,
+               rule_sets=None, merge="per-sales-area", backend=None):
+    """Run the requested checks on the files in `paths` and write their reports.
+
+    `paths` maps input names ("kna1", "knvv", "merged", "mace", "knvp",
+    "mace_partner", and those of `rule_sets`) to xlsx, CSV or Parquet
+    files. The compared columns of each input are normalised to text; with
+    `key_columns_only` nothing else is read. Reports are written in `fmt`
+    ("xlsx", "csv" or "parquet"). `rule_sets` (see load_rules) add checks
+    or replace the rules of built-in ones. `merge` (see MERGE_MODES) is
+    how the KNA1 vs KNVV report lays out customers with several sales
+    areas; KNA1+KNVV vs MACE always compares one row per sales area.
+    With `parallel` the checks run in a process pool, see suite.run_suite.
+    With `snapshot_dir` each check re-compares only the customers changed
+    since the last run that used it, see incremental.run_incremental.
+    With `backend` (a sql_backend.SqlBackend) the inputs are loaded into
+    its on-disk database and the checks run there as SQL, for inputs
+    larger than memory.
+    Stages are recorded in the active diagnostics.RunRecorder, if any.
+    Returns {check: (report path, row counts, delta or None, fan-out or
+    None)}, the fan-out being the fanout_summary of KNA1 vs KNVV.
+    """
+    if parallel and snapshot_dir:
+        raise ValueError("Incremental runs are serial; use either parallel or snapshot_dir")
+    if rule_sets and (parallel or snapshot_dir):
+        raise ValueError("Rule files run serially and without snapshots")
+    if backend is not None and (parallel or snapshot_dir):
+        raise ValueError("The SQL backend runs serially and without snapshots")
+    rule_sets = rule_sets or {}
+    checks = checks or list(REPORTS)
+    tables = {}
+
+    def table(name):
+        if name not in tables:
+            with stage(f"load {name}") as info:
+                columns = text_columns(name, rule_sets) if key_columns_only else None
+                if backend is not None:
+                    tables[name] = backend.load(name, paths[name], rule_sets=rule_sets, columns=columns)
+                else:
+                    tables[name] = reader_for(name, rule_sets)(paths[name], columns=columns, text_columns=text_columns(name, rule_sets))
+                info["rows_out"] = len(tables[name])
+        return tables[name]
+
+    def matched(check, *frames):
+        with stage(check, rows_in=sum(len(df) for df in frames)) as info:
+            if snapshot_dir:
+                from incremental import run_incremental
+
+                result, deltas[check] = run_incremental(check, frames, snapshot_dir, merge=merge)
+            else:
+                result = compare(check, *frames, rule_sets=rule_sets, merge=merge)
+            info["rows_out"] = sum(len(df) for df in result)
+        return result
+
+    outputs, deltas, fanouts = {}, {}, {}
+    if backend is not None:
+        needed = {name for check in checks for name in check_inputs(check, rule_sets) if name in paths}
+        inputs = {name: table(name) for name in needed}
+        with stage("checks in the database", rows_in=sum(len(df) for df in inputs.values())) as info:
+            outputs, errors = backend.run_suite(inputs, checks, rule_sets=rule_sets, merge=merge, on_progress=on_progress)
+            info["rows_out"] = sum(len(df) for frames in outputs.values() for df in frames)
+        if errors:
+            raise next(iter(errors.values()))
+    elif parallel:
+        from suite import run_suite
+
+        needed = {name for check in checks for name in CHECK_INPUTS[check] if name in paths}
+        inputs = {name: table(name) for name in needed}
+        with stage("checks in parallel", rows_in=sum(len(df) for df in inputs.values())) as info:
+            outputs, errors = run_suite(inputs, checks, partitions=partitions, workers=workers, on_progress=on_progress, merge=merge)
+            info["rows_out"] = sum(len(df) for frames in outputs.values() for df in frames)
+        if errors:
+            raise next(iter(errors.values()))
+    else:
+        if "kna1-knvv" in checks:
+            outputs["kna1-knvv"] = matched("kna1-knvv", table("kna1"), table("knvv"))
+            if "merged" not in paths and "merged-mace" in checks:
+                merged_df = outputs["kna1-knvv"][2]
+                if merge != "per-sales-area":
+                    with stage("merge per sales area"):
+                        merged_df = merge_kna1_knvv(table("kna1"), table("knvv"))
+                tables["merged"] = merged_table(merged_df)
+        if "merged-mace" in checks:
+            outputs["merged-mace"] = matched("merged-mace", table("merged"), table("mace"))
+        if "knvv-knvp" in checks:
+            outputs["knvv-knvp"] = matched("knvv-knvp", table("knvv"), table("knvp"))
+        if "knvp-mace-partner" in checks:
+            outputs["knvp-mace-partner"] = matched("knvp-mace-partner", table("knvp"), table("mace_partner"))
+        for check in checks:
+            if check not in CHECK_INPUTS:
+                outputs[check] = matched(check, *(table(name) for name in rule_sets[check].inputs))
+
+    if "kna1-knvv" in outputs:
+        with stage("fan-out"):
+            if backend is not None:
+                fanouts["kna1-knvv"] = backend.fanout_summary(backend.sales_area_fanout(table("kna1"), table("knvv")))
+            else:
+                fanouts["kna1-knvv"] = fanout_summary(sales_area_fanout(table("kna1"), table("knvv")))
+
+    os.makedirs(output_dir, exist_ok=True)
+    results = {}
+    for check in [*REPORTS, *(check for check in rule_sets if check not in REPORTS)]:
+        if check not in outputs:
+            continue
+        frames = outputs[check]
+        path = os.path.join(output_dir, report_file_name(check, fmt, rule_sets))
+        # The KNA1 vs KNVV report holds the merge only
+        reported = frames[2:] if check == "kna1-knvv" else frames
+        with stage(f"export {check}", rows_in=sum(len(df) for df in reported)):
+            write_report(path, check, reported, fmt=fmt, split=split, rule_sets=rule_sets)
+        results[check] = (path, [len(df) for df in frames], deltas.get(check), fanouts.get(check))
+    return results
+
+
+def print_delta(delta, limit=20):
+    if delta["full_run"]:
+        print(f"  Full run of {delta['customers']} customers; the next --incremental run compares against it")
+    else:
+        print(f"  Re-checked {delta['changed_customers']} of {delta['customers']} customers ({delta['rechecked_rows']} rows)")
+    for label, name in (("Newly broken", "newly_broken"), ("Newly fixed", "newly_fixed")):
+        customers = delta[name]
+        if customers is not None:
+            more = f" and {len(customers) - limit} more" if len(customers) > limit else ""
+            print(f"  {label}: {len(customers)}" + (f" ({', '.join(customers[:limit])}{more})" if customers else ""))
+
+
+def print_fanout(fanout):
+    print(
+        f"  Sales areas per customer: {fanout['mean_sales_areas']} on average, "
+        f"{fanout['max_sales_areas']} at most ({fanout['max_sales_areas_customer']}); "
+        f"{fanout['multi_area_customers']} of {fanout['customers']} customers have several, "
+        f"{fanout['customers_without_sales_area']} none"
+    )
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the SAP vs MACE customer validations headlessly.")
+    parser.add_argument("--kna1", help="KNA1 export (SAP layout if xlsx)")
+    parser.add_argument("--knvv", help="KNVV export (SAP layout if xlsx)")
+    parser.add_argument("--knvp", help="KNVP export (SAP layout if xlsx)")
+    parser.add_argument("--merged", help="KNA1+KNVV workbook from a previous KNA1 vs KNVV run")
+    parser.add_argument("--mace", help="MACE extract")
+    parser.add_argument("--mace-partner", dest="mace_partner", help="MACE Partner extract")
+    parser.add_argument("--rules", help="JSON rule file adding checks or replacing the rules of built-in ones (see rules.py)")
+    parser.add_argument("--input", dest="inputs", action="append", default=[], metavar="NAME=PATH", help="an input named in the rule file; repeat for each")
+    parser.add_argument("--checks", nargs="+", help=f"checks to run: {', '.join(REPORTS)} or a rule set of --rules (default: every check whose inputs are given)")
+    parser.add_argument("--merge", choices=MERGE_MODES, default="per-sales-area", help="KNA1 vs KNVV report: one row per sales area, or one per customer with its sales areas nested (default: per-sales-area)")
+    parser.add_argument("--output-dir", default=".", help="directory for the result workbooks")
+    parser.add_argument("--format", dest="fmt", choices=export.FORMATS, default="xlsx", help="report format; multi-sheet CSV/Parquet reports are zipped (default: xlsx)")
+    parser.add_argument("--no-split", dest="split", action="store_false", help="fail instead of splitting xlsx sheets over Excel's row limit")
+    parser.add_argument("--key-columns-only", action="store_true", help="read only the compared columns of each input (faster, narrower reports)")
+    parser.add_argument("--parallel", action="store_true", help="run the checks side by side in a process pool")
+    parser.add_argument("--partitions", type=int, help="with --parallel, split each check into this many customer partitions (default: from the input size)")
+    parser.add_argument("--workers", type=int, help="with --parallel, number of worker processes (default: one per CPU)")
+    parser.add_argument("--incremental", metavar="SNAPSHOT_DIR", help="re-check only customers whose rows changed since the last run with this snapshot directory, and list newly broken and fixed customers")
+    parser.add_argument("--database", metavar="DIR", help="load the inputs into an on-disk DuckDB database in this directory and run the checks there as SQL, for inputs larger than memory")
+    parser.add_argument("--memory-limit", help="with --database, the most memory DuckDB uses before spilling to disk, e.g. 4GB (default: DuckDB's)")
+    parser.add_argument("--run-record", help="write per-stage timings, peak memory and row counts as JSON to this file or directory")
+    parser.add_argument("--report-normalization", action="store_true", help="also time text normalisation of all columns versus the compared ones")
+    args = parser.parse_args(argv)
+
+    flagged = ("kna1", "knvv", "knvp", "merged", "mace", "mace_partner")
+    paths = {name: getattr(args, name) for name in flagged if getattr(args, name)}
+    for value in args.inputs:
+        name, _, path = value.partition("=")
+        if not name or not path:
+            parser.error(f"--input expects NAME=PATH, not '{value}'")
+        paths[name] = path
+
+    rule_sets = {}
+    if args.rules:
+        if args.parallel or args.incremental:
+            parser.error("--rules runs serially; drop --parallel and --incremental")
+        try:
+            rule_sets = load_rules(args.rules)
+        except (OSError, ValueError) as e:
+            parser.error(str(e))
+
+    def available(check):
+        return all(name in paths or (name == "merged" and "kna1-knvv" in checks_to_run) for name in check_inputs(check, rule_sets))
+
+    def flags(check):
+        return " ".join(f"--{name.replace('_', '-')}" if name in flagged else f"--input {name}=PATH" for name in check_inputs(check, rule_sets))
+
+    if args.parallel and args.incremental:
+        parser.error("--incremental runs serially; drop --parallel")
+    if args.database:
+        from sql_backend import HAS_DUCKDB
+
+        if not HAS_DUCKDB:
+            parser.error("--database needs the duckdb package")
+        if args.parallel or args.incremental:
+            parser.error("--database runs serially; drop --parallel and --incremental")
+    elif args.memory_limit:
+        parser.error("--memory-limit applies to --database only")
+
+    if args.checks:
+        checks_to_run = list(args.checks)
+        for check in checks_to_run:
+            if check not in REPORTS and check not in rule_sets:
+                parser.error(f"unknown check '{check}'")
+            if not available(check):
+                parser.error(f"{check} needs {flags(check)}")
+    else:
+        # In REPORTS order, so kna1-knvv is picked before merged-mace looks
+        # for its output; then the rule file's own checks
+        checks_to_run = []
+        for check in [*REPORTS, *(check for check in rule_sets if check not in REPORTS)]:
+            if available(check):
+                checks_to_run.append(check)
+        if not checks_to_run:
+            parser.error("no check has all of its input files")
+
+    def print_progress(check, done, total):
+        print(f"[{check}] {done}/{total} partitions done", file=sys.stderr)
+
+    inputs = {name: {"file": path, "bytes": os.path.getsize(path)} for name, path in paths.items()}
+    backend = None
+    if args.database:
+        from sql_backend import SqlBackend
+
+        backend = SqlBackend(args.database, memory_limit=args.memory_limit)
+    with RunRecorder("validations", inputs=inputs) as run:
+        try:
+            results = run_checks(
+                paths,
+                checks_to_run,
+                args.output_dir,
+                key_columns_only=args.key_columns_only,
+                fmt=args.fmt,
+                split=args.split,
+                parallel=args.parallel,
+                partitions=args.partitions,
+                workers=args.workers,
+                on_progress=print_progress,
+                snapshot_dir=args.incremental,
+                rule_sets=rule_sets,
+                merge=args.merge,
+                backend=backend,
+            )
+        finally:
+            if backend is not None:
+                backend.close()
+    run.results = {check: dict(zip(summary_labels(check, rule_sets), counts)) for check, (_, counts, _, _) in results.items()}
+    for check, (_, _, delta, fanout) in results.items():
+        if delta:
+            run.results[check]["delta"] = {name: len(value) if isinstance(value, list) else value for name, value in delta.items()}
+        if fanout:
+            run.results[check]["fan-out"] = fanout
+    if args.run_record:
+        print(f"Run record: {run.write(args.run_record)}", file=sys.stderr)
+    for check, (path, counts, delta, fanout) in results.items():
+        print(f"[{check}] {path}")
+        for label, count in zip(summary_labels(check, rule_sets), counts):
+            print(f"  {label}: {count}")
+        if fanout:
+            print_fanout(fanout)
+        if delta:
+            print_delta(delta)
+    if args.report_normalization:
+        report_normalization(paths, rule_sets)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())